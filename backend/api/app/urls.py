@@ -16,10 +16,23 @@ stop = url(r'stop', views.StopView.as_view())
 start = url(r'start', views.StartView.as_view())
 # Find out the current state of things (e.g. temperature, duty cycle, etc)
 current = url(r'current', views.CurrentView.as_view())
+# Get pushed the current state of things as it changes, instead of polling "current"
+status_stream = url(r'status/stream', views.StatusStreamView.as_view())
 # Skip a step
 skip = url(r'skip', views.SkipView.as_view())
 # See a list of previous runs and their temperatures over time
 temperature_logs = url(r'logs', views.TemperatureLogView.as_view())
+# The channels of a multi-channel controller, each of which has its own versions of the endpoints above
+channels = url(r'^channels$', views.ChannelsView.as_view())
+# Performance metrics of the control loop, for Prometheus to scrape
+metrics = url(r'^metrics$', views.MetricsView.as_view())
+channel = r'^channel/(?P<channel>[A-Za-z0-9_-]+)/'
+channel_endpoints = [url(channel + r'stop$', views.StopView.as_view()),
+                     url(channel + r'start$', views.StartView.as_view()),
+                     url(channel + r'current$', views.CurrentView.as_view()),
+                     url(channel + r'status/stream$', views.StatusStreamView.as_view()),
+                     url(channel + r'skip$', views.SkipView.as_view())]
 
-
-urlpatterns = [url(r'', include(router.urls)), stop, start, current, skip, temperature_logs]
+# the channel endpoints come first, since the patterns above would also match their paths
+urlpatterns = channel_endpoints + [url(r'', include(router.urls)), channels, metrics, stop, start, current, status_stream,
+                                   skip, temperature_logs]
@@ -0,0 +1,44 @@
+import collections
+import threading
+
+
+class LRUCache(object):
+    """
+    Remembers a limited number of values, forgetting whichever was used least recently when it's full. It's safe to
+    share between the threads that serve requests.
+
+    """
+    def __init__(self, size):
+        assert size > 0
+        self._size = size
+        self._values = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, compute):
+        """
+        Gets the value for a key, calculating and remembering it if it isn't already known. The value is calculated
+        outside of the lock, so a slow calculation doesn't hold up requests for other keys.
+
+        :param key:        any hashable value
+        :param compute:    a function that takes no arguments and returns the value
+
+        """
+        with self._lock:
+            if key in self._values:
+                self.hits += 1
+                value = self._values.pop(key)
+                # move it to the most recently used end
+                self._values[key] = value
+                return value
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._values[key] = value
+            while len(self._values) > self._size:
+                self._values.popitem(last=False)
+        return value
@@ -0,0 +1,75 @@
+"""
+Finds PID values for a heating block by simulating a program with many candidate values, and saves the best ones as a
+new driver. This runs entirely offline, so it can be done before an experiment without tying up the heater.
+
+    python manage.py tune_driver PROGRAM_ID --name "Block B" --time-constant 150 --dead-time 8
+
+"""
+from device import tuning
+from django.core.management.base import BaseCommand, CommandError
+import json
+from rpidapi import models
+
+
+def _floats(text):
+    return [float(value) for value in text.split(",")]
+
+
+class Command(BaseCommand):
+    help = "Tune PID values against a simulated heating block and save them as a driver"
+
+    def add_arguments(self, parser):
+        parser.add_argument("program", type=int, help="the ID of the program to tune against")
+        parser.add_argument("--name", required=True, help="the name of the new driver")
+        parser.add_argument("--method", choices=("grid", "nelder-mead"), default="grid")
+        parser.add_argument("--kp", type=_floats, default=[1.0, 2.0, 5.0, 10.0, 20.0],
+                            help="comma-separated Kp values for the grid, or the starting value for Nelder-Mead")
+        parser.add_argument("--ki", type=_floats, default=[0.0, 0.01, 0.05, 0.1, 0.5])
+        parser.add_argument("--kd", type=_floats, default=[0.0, 5.0, 20.0, 50.0])
+        parser.add_argument("--error-limit", type=_floats, default=[50.0, 200.0, 1000.0],
+                            help="accumulated error bounds to try (the minimum is the negative of the maximum)")
+        parser.add_argument("--iterations", type=int, default=50, help="the maximum number of Nelder-Mead iterations")
+        parser.add_argument("--period", type=float, default=1.0, help="the control period of the new driver")
+        parser.add_argument("--gain", type=float, default=80.0,
+                            help="how far above ambient the block settles at full power, in Celsius")
+        parser.add_argument("--time-constant", type=float, default=120.0, help="the block's time constant, in seconds")
+        parser.add_argument("--dead-time", type=float, default=5.0, help="the block's dead time, in seconds")
+        parser.add_argument("--ambient", type=float, default=22.0, help="the room temperature, in Celsius")
+        parser.add_argument("--noise", type=float, default=0.1, help="the thermometer noise, in Celsius")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--max-duration", type=float, default=None,
+                            help="how long to simulate, in seconds, which is required for programs with a Hold step")
+        parser.add_argument("--processes", type=int, default=None, help="defaults to the number of CPUs")
+
+    def handle(self, *args, **options):
+        try:
+            program = models.Program.objects.get(id=options["program"])
+        except models.Program.DoesNotExist:
+            raise CommandError("There is no program with ID %s" % options["program"])
+        steps = json.loads(program.steps)
+        plant_parameters = {"gain": options["gain"],
+                            "time_constant": options["time_constant"],
+                            "dead_time": options["dead_time"],
+                            "ambient": options["ambient"]}
+        tuner = tuning.Tuner(steps, processes=options["processes"], plant_parameters=plant_parameters,
+                             noise=options["noise"], seed=options["seed"], max_duration=options["max_duration"],
+                             period=options["period"])
+        with tuner:
+            if options["method"] == "grid":
+                gains, score = tuner.grid_search(options["kp"], options["ki"], options["kd"], options["error_limit"])
+            else:
+                initial = tuning.Gains(options["kp"][0], options["ki"][0], options["kd"][0], options["error_limit"][0])
+                gains, score = tuner.nelder_mead(initial, iterations=options["iterations"])
+
+        driver = models.Driver.objects.create(name=options["name"],
+                                              kp=gains.kp,
+                                              ki=gains.ki,
+                                              kd=gains.kd,
+                                              max_accumulated_error=gains.error_limit,
+                                              min_accumulated_error=-gains.error_limit,
+                                              period=options["period"])
+        self.stdout.write("Evaluated %d candidates." % tuner.evaluations)
+        self.stdout.write("IAE: %.1f C*s, overshoot: %.2f C, time outside tolerance: %.0f s" %
+                          (score.iae, score.overshoot, score.settling_time))
+        self.stdout.write("Saved driver %d: kp=%s ki=%s kd=%s accumulated error limit=%s" %
+                          (driver.id, gains.kp, gains.ki, gains.kd, gains.error_limit))
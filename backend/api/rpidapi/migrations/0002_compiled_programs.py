@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-16 20:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import rpidapi.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rpidapi', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driver',
+            name='period',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='compiled',
+            field=models.TextField(blank=True, default=b''),
+        ),
+        migrations.AddField(
+            model_name='program',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default=b'', max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='program',
+            name='steps',
+            field=models.TextField(validators=[rpidapi.models.validate_steps]),
+        ),
+    ]
@@ -1,4 +1,16 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from interface import programs
+import json
+
+
+def validate_steps(steps):
+    # catch mistakes when the program is saved, rather than when someone tries to run it. Django's forms and the
+    # serializer both check the steps with this before the program is saved
+    try:
+        programs.compile_steps(steps)
+    except programs.ProgramError as e:
+        raise ValidationError(str(e))
 
 
 # Users
@@ -15,11 +27,43 @@ class Driver(models.Model):
     max_accumulated_error = models.FloatField(default=10.0)
     min_accumulated_error = models.FloatField(default=-10.0)
     max_power = models.FloatField(default=1.0)
+    # seconds between control loop ticks
+    period = models.FloatField(default=1.0)
 
 
 # A set of instructions for heating something at given temperatures for a given amount of time
 class Program(models.Model):
     name = models.CharField(max_length=128)
-    steps = models.TextField()
+    steps = models.TextField(validators=[validate_steps])
     scientist = models.ForeignKey(Scientist)
     driver = models.ForeignKey(Driver)
+    # the steps as compiled by interface.programs, which is what the controller actually runs
+    compiled = models.TextField(blank=True, default="")
+    content_hash = models.CharField(max_length=40, blank=True, default="", db_index=True)
+
+    def save(self, *args, **kwargs):
+        # compile whenever the steps might have changed, so that the compiled form can never be out of date. The steps
+        # have already been validated, unless whatever saved the program skipped that, in which case it's saved without
+        # a compiled form and can't be started until its steps are fixed
+        try:
+            compiled = programs.compile_steps(self.steps)
+        except programs.ProgramError:
+            self.compiled = self.content_hash = ""
+        else:
+            self.compiled = json.dumps(compiled)
+            self.content_hash = compiled["hash"]
+        super(Program, self).save(*args, **kwargs)
+
+    def current_compiled(self):
+        """
+        The compiled steps, or None if they have to be compiled again because they never were, or were compiled by a
+        different version.
+
+        :rtype:     dict
+
+        """
+        if self.compiled:
+            compiled = json.loads(self.compiled)
+            if compiled.get("version") == programs.VERSION:
+                return compiled
+        return None
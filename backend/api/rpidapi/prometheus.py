@@ -0,0 +1,84 @@
+"""
+Renders the controller's metrics (see device.metrics) in the Prometheus text exposition format, version 0.0.4.
+
+"""
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "piwarmer_"
+# the statistics of each phase, as published by the controller, and the quantile each one stands for
+QUANTILES = (("p50", "0.5"), ("p99", "0.99"))
+COUNTERS = {
+    "overruns": "Ticks that finished after the next one should have started",
+    "sensor_rejections": "Thermometer readings that were thrown away as implausible",
+    "telemetry_dropped": "Temperature log records that were dropped because the log writer had fallen behind",
+    "thermometer_retries": "Thermometer reads that had to be retried",
+}
+
+
+def render(metrics_by_channel, now=None):
+    """
+    :param metrics_by_channel:    the metrics of each channel, as read by APIInterface.read_metrics(), keyed by the
+                                  name of the channel, or None for the default channel or the whole controller
+    :type metrics_by_channel:     dict
+    :param now:                   the current time in seconds since the Unix epoch
+    :return:    the text of a scrape
+    :rtype:     str
+
+    """
+    now = time.time() if now is None else now
+    families = {}
+
+    def add(name, kind, description, channel, value, **labels):
+        family = families.setdefault(name, (kind, description, []))
+        if channel is not None:
+            labels["channel"] = channel
+        family[2].append((labels, value))
+
+    for channel, metrics in sorted(metrics_by_channel.items()):
+        if not metrics:
+            continue
+        for field, value in sorted(metrics.items()):
+            if field.startswith("counter:"):
+                name = field.split(":", 1)[1]
+                add(PREFIX + name + "_total", "counter", COUNTERS.get(name, name), channel, value)
+                continue
+            if ":" not in field:
+                continue
+            phase, statistic = field.rsplit(":", 1)
+            description = "Seconds taken by each phase of the control tick"
+            for key, quantile in QUANTILES:
+                if statistic == key:
+                    add(PREFIX + "tick_phase_seconds", "summary", description, channel, value, phase=phase,
+                        quantile=quantile)
+            if statistic in ("sum", "count"):
+                add(PREFIX + "tick_phase_seconds_" + statistic, "summary", description, channel, value, phase=phase)
+            elif statistic == "max":
+                add(PREFIX + "tick_phase_max_seconds", "gauge",
+                    "The longest of the recent times taken by each phase of the control tick", channel, value,
+                    phase=phase)
+        if "time" in metrics:
+            add(PREFIX + "metrics_age_seconds", "gauge", "Seconds since the controller last published its metrics",
+                channel, max(0.0, now - metrics["time"]))
+
+    lines = []
+    for name in sorted(families):
+        kind, description, samples = families[name]
+        # the _sum and _count of a summary belong to its family, and mustn't be described separately
+        if not (kind == "summary" and name.endswith(("_sum", "_count"))):
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s %s" % (name, kind))
+        for labels, value in samples:
+            lines.append("%s%s %s" % (name, _labels(labels), _value(value)))
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                             for key, value in sorted(labels.items()))
+
+
+def _value(value):
+    return repr(float(value))
@@ -20,4 +20,6 @@ class DriverSerializer(serializers.ModelSerializer):
 class ProgramSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Program
-        fields = ('id', 'name', 'steps', 'scientist', 'driver')
+        fields = ('id', 'name', 'steps', 'scientist', 'driver', 'content_hash')
+        # the steps are checked by models.validate_steps(), which the serializer picks up from the model
+        read_only_fields = ('content_hash',)
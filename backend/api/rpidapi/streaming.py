@@ -0,0 +1,153 @@
+"""
+Fans the controller's status out to every browser that's watching. Each API process has a single subscription to each
+channel's status no matter how many browsers there are, so the load on Redis and the controller stays the same.
+
+"""
+from interface import APIInterface
+import logging
+import os
+import Queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+# the most browsers that can be watching at once, across every channel. Each one holds one of the API's worker threads
+# for as long as it's watching (see api.conf), so this has to leave enough of them for every other request
+MAX_STREAMS = int(os.environ.get("PIWARMER_MAX_STREAMS", 16))
+
+
+class StatusBroadcaster(object):
+    """
+    Subscribes to the status channel in a background thread, which is started when the first browser connects, and
+    copies each message to a queue for every browser.
+
+    """
+    # the number of messages a browser can fall behind before it starts to miss the oldest ones
+    QUEUE_SIZE = 60
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, api_interface_factory=APIInterface):
+        self._api_interface_factory = api_interface_factory
+        self._lock = threading.Lock()
+        self._listeners = set()
+        self._thread = None
+
+    def subscribe(self):
+        """
+        Start receiving messages.
+
+        :return:    a queue that each message will be put in, as a JSON string
+        :rtype:     Queue.Queue
+
+        """
+        listener = Queue.Queue(self.QUEUE_SIZE)
+        with self._lock:
+            self._listeners.add(listener)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="status-broadcaster")
+                self._thread.daemon = True
+                self._thread.start()
+        return listener
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            self._listeners.discard(listener)
+
+    def broadcast(self, message):
+        """
+        Give a message to every listener. A listener that isn't keeping up loses its oldest message, so that it can't
+        hold up anyone else.
+
+        """
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener.put_nowait(message)
+            except Queue.Full:
+                try:
+                    listener.get_nowait()
+                    listener.put_nowait(message)
+                except (Queue.Empty, Queue.Full):
+                    pass
+
+    def _run(self):
+        while True:
+            try:
+                api_interface = self._api_interface_factory()
+                pubsub = api_interface.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(api_interface.status_channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.broadcast(message['data'])
+            except Exception:
+                log.exception("Lost the status channel. Resubscribing.")
+                time.sleep(self.RECONNECT_DELAY)
+
+
+class StreamLimit(object):
+    """
+    Limits how many streams can be open at once.
+
+    """
+    def __init__(self, limit=MAX_STREAMS):
+        self._slots = threading.Semaphore(limit)
+
+    def open(self, stream):
+        """
+        Takes a slot for a stream, until the server closes it when the browser goes away.
+
+        :param stream:    what the response will iterate over
+        :return:    the stream, wrapped so that it gives up its slot when it's closed, or None if every slot is taken
+        :rtype:     LimitedStream
+
+        """
+        if not self._slots.acquire(False):
+            return None
+        return LimitedStream(stream, self._slots.release)
+
+
+class LimitedStream(object):
+    """
+    A stream that holds a slot of a StreamLimit. The server closes it when the response is finished with, even if it
+    was never iterated over, which a generator's finally block can't be relied on for.
+
+    """
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def close(self):
+        if self._release is None:
+            return
+        release, self._release = self._release, None
+        try:
+            if hasattr(self._stream, "close"):
+                self._stream.close()
+        finally:
+            release()
+
+
+broadcaster = StatusBroadcaster()
+stream_limit = StreamLimit()
+_channel_broadcasters = {}
+_channel_broadcasters_lock = threading.Lock()
+
+
+def broadcaster_for(channel):
+    """
+    The broadcaster of a channel's status, which is created the first time it's needed.
+
+    :param channel:    the name of the channel, or None for the default channel
+    :rtype:     StatusBroadcaster
+
+    """
+    if channel is None:
+        return broadcaster
+    with _channel_broadcasters_lock:
+        if channel not in _channel_broadcasters:
+            _channel_broadcasters[channel] = StatusBroadcaster(lambda: APIInterface(channel=channel))
+        return _channel_broadcasters[channel]
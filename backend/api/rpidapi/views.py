@@ -1,14 +1,61 @@
-from interface import APIInterface
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from interface import APIInterface, STATUS_FIELDS, catalog, channels, downsample, programs, pyramid, telemetry
+from device.program import TemperatureProgram
 from rest_framework import status
+from rest_framework.decorators import detail_route
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 import serializers
+import json
 import logging
+import lru
 import models
+import numpy as np
 import os
+import prometheus
+import Queue
+import streaming
 
 log = logging.getLogger(__name__)
+# Every view in every thread shares this, and through it the state store (see interface.stores), e.g. a pool of
+# connections to Redis, so that requests don't have to open a new connection each time
+api_interface = APIInterface()
+# the same for each of the channels of a multi-channel controller, by name
+_channel_interfaces = {}
+# the run catalog, which is set up by the first request that needs it. Each request opens its own connection to it
+_run_catalog = None
+
+
+def get_api_interface(channel):
+    """
+    The APIInterface of a channel. Every channel shares the same state store.
+
+    :param channel:    the name of the channel, or None for the default channel
+    :rtype:     APIInterface
+    :raises:    Http404
+
+    """
+    if channel is None:
+        return api_interface
+    if channel not in _channel_interfaces:
+        if channel not in channels.names():
+            raise Http404("There is no channel named %s" % channel)
+        _channel_interfaces[channel] = APIInterface(channel=channel)
+    return _channel_interfaces[channel]
+
+
+def open_run_catalog():
+    """
+    Opens a connection to the run catalog, setting the catalog up first if this process hasn't already.
+
+    :rtype:     catalog.RunCatalog
+
+    """
+    global _run_catalog
+    if _run_catalog is None:
+        _run_catalog = catalog.RunCatalog()
+    return _run_catalog.connect()
 
 
 class ScientistViewset(ModelViewSet):
@@ -20,9 +67,26 @@ class DriverViewset(ModelViewSet):
     serializer_class = serializers.DriverSerializer
     queryset = models.Driver.objects.all()
 
+    def perform_update(self, serializer):
+        super(DriverViewset, self).perform_update(serializer)
+        # If the driver is being used right now, by any channel, the controller should start using the new values
+        # immediately
+        for channel in [None] + channels.names():
+            channel_interface = get_api_interface(channel)
+            running_driver = channel_interface.driver
+            if (channel_interface.active and running_driver is not None
+                    and running_driver.get('id') == serializer.instance.id):
+                channel_interface.update_gains(serializer.data)
+                log.info("Updated PID values of running driver: ID: {id}".format(id=serializer.instance.id))
+
 
 class ProgramViewset(ModelViewSet):
     serializer_class = serializers.ProgramSerializer
+    # the number of points in a preview, unless a resolution is asked for, and the most that will ever be sent
+    PREVIEW_POINTS = 1000
+    MAX_PREVIEW_POINTS = 20000
+    # previews keyed by the program's content hash and the resolution, so that programs with the same steps share them
+    previews = lru.LRUCache(64)
 
     def get_queryset(self):
         # We implement get_queryset so that a user will only see their own programs.
@@ -31,14 +95,83 @@ class ProgramViewset(ModelViewSet):
             return models.Program.objects.filter(scientist=self.request.query_params['user'])
         return models.Program.objects.all()
 
+    @detail_route(methods=['get'])
+    def preview(self, request, pk=None):
+        """
+        The target temperature over the course of the program, so that it can be plotted before it's run. A program
+        that ends with a hold is shown up to the start of the hold.
+
+        Query parameters:
+            resolution:    the number of seconds between points
+
+        """
+        program = self.get_object()
+        try:
+            resolution = float(request.query_params['resolution']) if 'resolution' in request.query_params else None
+            if resolution is not None and not resolution > 0.0:
+                raise ValueError("resolution must be more than zero seconds")
+        except ValueError as e:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={"error": str(e)})
+        compiled = program.current_compiled()
+        if compiled is None:
+            # programs that were never compiled, or were compiled by a different version, are compiled here, but not
+            # saved, since this is only a read. They're compiled for good the next time they're saved
+            try:
+                compiled = programs.compile_steps(program.steps)
+            except programs.ProgramError as e:
+                return Response(status=status.HTTP_400_BAD_REQUEST, data={"error": str(e)})
+        total_duration = compiled["total_duration"]
+        # never send more than MAX_PREVIEW_POINTS, however fine a resolution is asked for
+        resolution = max(resolution or total_duration / self.PREVIEW_POINTS or 1.0,
+                         total_duration / self.MAX_PREVIEW_POINTS)
+        preview = self.previews.get((compiled["hash"], resolution), lambda: self._preview(compiled, resolution))
+        return Response(dict(preview, id=program.id), status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _preview(compiled, resolution):
+        temperature_program = TemperatureProgram.from_compiled(compiled)
+        total_duration = temperature_program.total_duration
+        times = np.append(np.arange(0.0, total_duration, resolution), total_duration)
+        evaluate_at = times.copy()
+        if not temperature_program.has_hold and total_duration > 0.0:
+            # a program is over at exactly its total duration, so the last point shows the very end of the last step
+            evaluate_at[-1] = np.nextafter(total_duration, 0.0)
+        targets = temperature_program.target_temperatures(evaluate_at)
+        return {"content_hash": temperature_program.content_hash,
+                "total_duration": total_duration,
+                "has_hold": temperature_program.has_hold,
+                "resolution": resolution,
+                "time": times.tolist(),
+                "target": [None if target != target else target for target in targets.tolist()]}
+
+
+class ChannelsView(APIView):
+    """
+    Lists the channels of a multi-channel controller. There are none if the controller only has the default channel.
+
+    """
+    def get(self, request, format=None):
+        return Response({"channels": channels.names()}, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    """
+    Serves the controller's performance metrics to Prometheus: how long each phase of the control tick takes, and how
+    often things go wrong. They're published to Redis by the controller every few seconds.
+
+    """
+    def get(self, request, format=None):
+        metrics = {name: get_api_interface(name).read_metrics() for name in [None] + channels.names()}
+        return HttpResponse(prometheus.render(metrics), content_type=prometheus.CONTENT_TYPE)
+
 
 class StartView(APIView):
     """
     The endpoint that will start a program.
 
     """
-    def post(self, request, format=None):
-        api_interface = APIInterface()
+    def post(self, request, channel=None, format=None):
+        api_interface = get_api_interface(channel)
         try:
             # look up the driver and program in the database
             driver = models.Driver.objects.get(id=request.data['driver'])
@@ -47,9 +180,18 @@ class StartView(APIView):
             # convert to JSON, which our Python backend is expecting
             json_driver = serializers.DriverSerializer(driver)
             json_program = serializers.ProgramSerializer(program)
+            if program.current_compiled() is None:
+                # programs that were never compiled, or were compiled by a different version, get compiled once, here
+                program.save()
+                if not program.compiled:
+                    return Response(status=status.HTTP_400_BAD_REQUEST,
+                                    data={"error": "The program's steps can't be run. Fix them and save it again"})
             # update the selected driver and program in Redis, so that our backend can know which ones to use
             api_interface.driver = json_driver.data
             api_interface.program = json_program.data['steps']
+            api_interface.program_id = program.id
+            # the controller runs the compiled form, so it doesn't have to parse the steps itself
+            api_interface.compiled_program = program.compiled
             log.info("Program steps: {steps}".format(steps=str(json_program.data['steps'])))
         except Exception as e:
             log.exception("Could not start program")
@@ -66,9 +208,9 @@ class StopView(APIView):
     The endpoint that will reset everything and shut off the heater.
 
     """
-    def post(self, request, format=None):
+    def post(self, request, channel=None, format=None):
+        api_interface = get_api_interface(channel)
         log.info("User requested that we stop the current program")
-        api_interface = APIInterface()
         # Turn off the heater
         api_interface.deactivate()
         # Delete the program and driver from Redis so that the backend realizes we're done
@@ -82,9 +224,8 @@ class SkipView(APIView):
     Skips the current step.
 
     """
-    def post(self, request, format=None):
-        api_interface = APIInterface()
-        api_interface.skip_step()
+    def post(self, request, channel=None, format=None):
+        get_api_interface(channel).skip_step()
         log.info("User skipped a step")
         return Response(status=status.HTTP_200_OK)
 
@@ -94,33 +235,223 @@ class CurrentView(APIView):
     The endpoint that provides the current temperature and the action that the controller is performing.
 
     """
-    def get(self, request, format=None):
-        api_interface = APIInterface()
-        out = {"step": api_interface.current_step,
-               "temp": api_interface.current_temp,
-               "target": api_interface.target_temp,
-               "step_time_remaining": api_interface.step_time_remaining,
-               "program_time_remaining": api_interface.program_time_remaining,
-               "program": api_interface.program
+    def get(self, request, channel=None, format=None):
+        current = get_api_interface(channel).read_status()
+        out = {"step": current["current_step"],
+               "temp": current["current_temp"],
+               "target": current["target_temp"],
+               "step_time_remaining": current["step_time_remaining"],
+               "program_time_remaining": current["program_time_remaining"],
+               "program": current["program"]
                }
         return Response(out, status=status.HTTP_200_OK)
 
 
+class StatusStreamView(APIView):
+    """
+    Pushes the controller's status to the browser with Server-Sent Events as soon as it's published, so that the
+    browser doesn't have to poll CurrentView.
+
+    The first event is a "backfill" of the statuses from the last few minutes, as a column for each field. After that,
+    each "status" event only has the fields that changed since the one before it, along with the time.
+
+    Query parameters:
+        minutes:    how far back the backfill goes
+
+    Only streaming.MAX_STREAMS browsers can watch at once, since each one holds a worker thread. Any more are told to
+    try again later, and can poll CurrentView in the meantime.
+
+    """
+    DEFAULT_BACKFILL_MINUTES = 10
+    # a comment is sent this often when nothing else is, so that proxies don't close the connection
+    KEEPALIVE_INTERVAL = 15.0
+
+    def get(self, request, channel=None, format=None):
+        channel_interface = get_api_interface(channel)
+        try:
+            minutes = float(self.request.query_params.get('minutes', self.DEFAULT_BACKFILL_MINUTES))
+        except ValueError as e:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={"error": str(e)})
+        stream = streaming.stream_limit.open(self._stream(channel_interface, streaming.broadcaster_for(channel),
+                                                          minutes * 60.0))
+        if stream is None:
+            # every stream holds a worker thread, so too many of them would leave none for anything else
+            response = Response(status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                data={"error": "Too many browsers are already watching"})
+            response['Retry-After'] = str(int(self.KEEPALIVE_INTERVAL))
+            return response
+        response = StreamingHttpResponse(stream, content_type="text/event-stream")
+        response['Cache-Control'] = 'no-cache'
+        # stop nginx from holding events back until it has a full buffer
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _stream(self, channel_interface, broadcaster, seconds):
+        # subscribe before reading the history, so that nothing published in between is missed
+        listener = broadcaster.subscribe()
+        try:
+            history = channel_interface.read_status_history(seconds)
+            backfill = {field: [entry.get(field) for entry in history] for field in STATUS_FIELDS + ("time",)}
+            yield self._event("backfill", backfill)
+            previous = history[-1] if history else {}
+            while True:
+                try:
+                    current = json.loads(listener.get(timeout=self.KEEPALIVE_INTERVAL))
+                except Queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                delta = {field: value for field, value in current.items()
+                         if field == "time" or field not in previous or previous[field] != value}
+                previous = current
+                yield self._event("status", delta)
+        finally:
+            broadcaster.unsubscribe(listener)
+
+    @staticmethod
+    def _event(name, data):
+        return "event: %s\ndata: %s\n\n" % (name, json.dumps(data))
+
+
 class TemperatureLogView(APIView):
     """
-    SHOULD provide links to each log, so you can see their data, however it currently just shows a list of logs available.
-    This is just not completely implemented yet.
+    Lists runs from the run catalog, or, given the date of one of them, streams its measurements as JSON columns that
+    are ready to be plotted. Long runs are reduced to a limited number of points.
+
+    Query parameters for the list, all optional:
+        program/driver: only include runs of this program or with this driver, by ID
+        after/before:   only include runs that started in this range, in seconds since the Unix epoch
+        page:           which page of results, starting from 1
+        page_size:      the number of runs on each page
+
+    Query parameters for a single log:
+        date:       which log, as it appears in the list
+        start/end:  only include measurements in this range, in seconds since the start of the run
+        columns:    a comma-separated list of any of measured, target, duty, step and integral
+        points:     roughly the most points to return, or 0 for all of them
+        method:     how to choose the points, either minmax (keeps every peak and dip) or lttb (keeps the shape)
+
+    When a finished run has more measurements in the range than points, the answer comes from the nearest level of
+    its pyramid (see interface.pyramid) instead. Each point is then the mean of a bucket of "resolution" seconds, and
+    the minimum and maximum of each column are included as <column>_min and <column>_max.
 
     """
+    LOG_DIR = "/var/log/piwarmer/"
+    DEFAULT_COLUMNS = ("measured", "target", "duty")
+    DEFAULT_POINTS = 1000
+    MAX_PAGE_SIZE = 500
+    # the number of values to format at a time while streaming
+    CHUNK_SIZE = 4096
+
     def get(self, request, format=None):
-        log_dir = "/var/log/piwarmer/"
         if 'date' in self.request.query_params.keys():
+            return self._get_log(self.request.query_params)
+        return self._list_runs(self.request.query_params)
+
+    def _list_runs(self, params):
+        try:
+            filters = {"program_id": int(params['program']) if 'program' in params else None,
+                       "driver_id": int(params['driver']) if 'driver' in params else None,
+                       "after": float(params['after']) if 'after' in params else None,
+                       "before": float(params['before']) if 'before' in params else None}
+            page = int(params.get('page', 1))
+            page_size = int(params.get('page_size', catalog.DEFAULT_PAGE_SIZE))
+            if page < 1 or not 1 <= page_size <= self.MAX_PAGE_SIZE:
+                raise ValueError("page must be positive and page_size must be from 1 to %d" % self.MAX_PAGE_SIZE)
+        except ValueError as e:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={"error": str(e)})
+
+        run_catalog = open_run_catalog()
+        try:
+            count, runs = run_catalog.query(limit=page_size, offset=(page - 1) * page_size, **filters)
+        finally:
+            run_catalog.close()
+        for run in runs:
+            # the frontend only needs the name to ask for the log itself
+            del run['path']
+        return Response({"count": count, "page": page, "page_size": page_size, "results": runs},
+                        status=status.HTTP_200_OK)
+
+    def _get_log(self, params):
+        try:
+            columns = params.get('columns', ",".join(self.DEFAULT_COLUMNS)).split(",")
+            start = float(params.get('start', 0.0))
+            end = float(params.get('end', 'inf'))
+            points = int(params.get('points', self.DEFAULT_POINTS))
+            method = params.get('method', downsample.METHODS[0])
+            if points < 0 or method not in downsample.METHODS:
+                raise ValueError("points must be positive and method must be one of %s" % ", ".join(downsample.METHODS))
+            if not columns or any(c == "timestamp" or c not in telemetry.COLUMNS for c in columns):
+                raise ValueError("columns must be some of %s" % ", ".join(telemetry.COLUMNS[1:]))
+        except ValueError as e:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={"error": str(e)})
+
+        # the date comes from the user, so make sure it can't point outside of the log directory
+        path = os.path.join(self.LOG_DIR, "temperature-%s" % os.path.basename(params['date']))
+        try:
+            if os.path.exists(path + telemetry.EXTENSION):
+                start_time, records = telemetry.read_telemetry(path + telemetry.EXTENSION)
+            elif os.path.exists(path + ".log"):
+                start_time, records = telemetry.read_legacy_log(path + ".log")
+            else:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+        except (IOError, OSError, telemetry.TelemetryError):
+            log.exception("Could not read temperature log")
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        times = records['timestamp'] - start_time
+        # records are written in order, so the range can be found with a binary search instead of a scan
+        first, last = np.searchsorted(times, [start, end], side='left')
+        pyramid_path = pyramid.pyramid_path(path + telemetry.EXTENSION)
+        if (points and last - first > points and os.path.exists(pyramid_path)
+                and all(column in pyramid.COLUMNS for column in columns)):
+            width = pyramid.choose_level(times[last - 1] - times[first], points)
             try:
-                with open(log_dir + "temperature-%s.log" % self.request.query_params['date']) as f:
-                    return Response({n: line.rstrip() for n, line in enumerate(f)}, status=status.HTTP_200_OK)
-            except OSError:
-                return Response(status=status.HTTP_400_BAD_REQUEST)
-
-        logs = sorted([l for l in os.listdir(log_dir) if l.startswith("temperature-") and l.endswith(".log")])
-        data = {n: l for n, l in enumerate(logs)}
-        return Response(data, status=status.HTTP_200_OK)
+                level = pyramid.read_level(pyramid_path, width, start, end)
+            except (IOError, OSError, ValueError, KeyError):
+                log.exception("Could not read pyramid, using the full temperature log instead")
+            else:
+                means = [level["%s_mean" % column].astype(np.float64) for column in columns]
+                # the coarsest level can still have too many points for a very long run
+                keep = downsample.downsample(level["time"], means, points, method)
+                series = []
+                for column, mean in zip(columns, means):
+                    series += [(column, mean[keep]),
+                               ("%s_min" % column, level["%s_min" % column][keep]),
+                               ("%s_max" % column, level["%s_max" % column][keep])]
+                return StreamingHttpResponse(self._stream(start_time, last - first, level["time"][keep], series, width),
+                                             content_type="application/json")
+
+        times = times[first:last]
+        values = [self._column(records[first:last], column) for column in columns]
+        keep = downsample.downsample(times, values, points, method)
+        return StreamingHttpResponse(self._stream(start_time, last - first, times[keep],
+                                                  [(c, v[keep]) for c, v in zip(columns, values)]),
+                                     content_type="application/json")
+
+    @staticmethod
+    def _column(records, column):
+        """
+        The values of one column as floats, with anything that's missing as NaN.
+
+        """
+        values = records[column].astype(np.float64)
+        if column == "step":
+            values[records[column] == telemetry.NO_STEP] = np.nan
+        return values
+
+    def _stream(self, start_time, count, times, columns, resolution=None):
+        """
+        Produces the JSON response a piece at a time, so that a long run doesn't have to be formatted in memory all at
+        once. Times are in seconds since the start of the run, and missing values are null.
+
+        """
+        yield '{"start_time": %s, "count": %d, "resolution": %s' % (repr(float(start_time)), count,
+                                                                     "null" if resolution is None else resolution)
+        for name, values, precision in [("time", times, "%.10g")] + [(c, v, "%.6g") for c, v in columns]:
+            yield ', "%s": [' % name
+            for offset in range(0, len(values), self.CHUNK_SIZE):
+                chunk = values[offset:offset + self.CHUNK_SIZE]
+                text = ",".join("null" if value != value else precision % value for value in chunk.tolist())
+                yield text if offset == 0 else "," + text
+            yield ']'
+        yield '}'
@@ -0,0 +1,83 @@
+"""
+Compares the latency of the Redis work behind a CurrentView request when every request opens its own connection (as
+the API used to) with when every request shares one connection pool, with several requests in flight at once. It needs
+a Redis server. Run from the backend directory:
+
+    python -m benchmarks.api_latency --threads 8 --requests 500
+    python -m benchmarks.api_latency --socket /var/run/redis/redis.sock
+
+"""
+import argparse
+import threading
+import time
+import redis
+from interface import APIInterface, connection
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(make_api_interface, threads, requests):
+    """
+    Makes requests from several threads at once.
+
+    :param make_api_interface:    called at the start of each request to get an APIInterface
+    :param threads:               the number of requests in flight at once
+    :param requests:              the number of requests each thread makes
+
+    :return:    the latency of every request in milliseconds, and the total number of seconds taken
+    :rtype:     (list of float, float)
+
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        mine = []
+        for _ in range(requests):
+            start = time.time()
+            make_api_interface().read_status()
+            mine.append((time.time() - start) * 1000.0)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, time.time() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API request latency with and without a shared Redis pool")
+    parser.add_argument("--threads", type=int, default=8, help="the number of requests in flight at once")
+    parser.add_argument("--requests", type=int, default=500, help="the number of requests made by each thread")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--socket", help="also measure a shared pool over this Unix socket")
+    args = parser.parse_args()
+
+    shared_tcp = APIInterface(connection_pool=connection.make_pool(host=args.host, port=args.port))
+    try:
+        shared_tcp.store.ping()
+    except redis.ConnectionError as e:
+        parser.error("can't reach Redis at %s:%d (%s)" % (args.host, args.port, e))
+    cases = [("connection per request", lambda: APIInterface(connection_pool=redis.ConnectionPool(host=args.host,
+                                                                                                   port=args.port))),
+             ("shared pool, TCP", lambda: shared_tcp)]
+    if args.socket:
+        shared_unix = APIInterface(connection_pool=connection.make_pool(socket_path=args.socket))
+        cases.append(("shared pool, Unix socket", lambda: shared_unix))
+
+    print("%d threads, %d requests each" % (args.threads, args.requests))
+    print("%-26s %10s %10s %10s %12s" % ("", "p50 (ms)", "p95 (ms)", "p99 (ms)", "requests/s"))
+    for name, make_api_interface in cases:
+        # warm up, so that the shared pools already have their connections open
+        run(make_api_interface, args.threads, 10)
+        latencies, elapsed = run(make_api_interface, args.threads, args.requests)
+        print("%-26s %10.3f %10.3f %10.3f %12.0f" % (name, percentile(latencies, 0.5), percentile(latencies, 0.95),
+                                                     percentile(latencies, 0.99), len(latencies) / elapsed))
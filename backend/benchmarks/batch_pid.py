@@ -0,0 +1,73 @@
+"""
+Compares the time per controller of updating many PIDs one at a time with updating them all at once with a BatchPID.
+Run from the backend directory:
+
+    python -m benchmarks.batch_pid
+    python -m benchmarks.batch_pid --controllers 1 10 100 1000 10000
+
+"""
+import argparse
+import random
+import timeit
+from device import pid
+
+UPDATES = 200
+
+
+class Cycle(object):
+    """
+    The parts of a cycle.CurrentCycle that a PID reads.
+
+    """
+    def __init__(self, target_temperature, current_temperature, accumulated_error):
+        self.target_temperature = target_temperature
+        self.current_temperature = current_temperature
+        self.accumulated_error = accumulated_error
+
+
+def make_drivers(count, seed=0):
+    rng = random.Random(seed)
+    return [pid.Driver("sweep", rng.uniform(1.0, 20.0), rng.uniform(0.0, 0.5), rng.uniform(0.0, 40.0), 500.0, -500.0)
+            for _ in range(count)]
+
+
+def time_loop(drivers, updates=UPDATES):
+    """
+    The mean time per controller per update when each has its own PID, in microseconds.
+
+    """
+    pids = [pid.PID(driver) for driver in drivers]
+    cycles = [Cycle(60.0, 40.0 + i % 20, 0.0) for i in range(len(drivers))]
+
+    def run():
+        for _ in range(updates):
+            for controller, current_cycle in zip(pids, cycles):
+                duty_cycle, current_cycle.accumulated_error = controller.update(current_cycle, 1.0)
+    return min(timeit.repeat(run, number=1, repeat=3)) / updates / len(drivers) * 1e6
+
+
+def time_batch(drivers, updates=UPDATES):
+    """
+    The mean time per controller per update when they're all in one BatchPID, in microseconds.
+
+    """
+    batch = pid.BatchPID(drivers)
+    targets = [60.0] * len(drivers)
+    measurements = [40.0 + i % 20 for i in range(len(drivers))]
+
+    def run():
+        for _ in range(updates):
+            batch.update(targets, measurements, 1.0)
+    return min(timeit.repeat(run, number=1, repeat=3)) / updates / len(drivers) * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the cost of updating many PIDs")
+    parser.add_argument("--controllers", type=int, nargs="+", default=[1, 4, 16, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    print("%12s %20s %20s %10s" % ("controllers", "PID loop (us each)", "BatchPID (us each)", "speedup"))
+    for count in args.controllers:
+        drivers = make_drivers(count)
+        loop, batch = time_loop(drivers), time_batch(drivers)
+        print("%12d %20.3f %20.3f %9.1fx" % (count, loop, batch, loop / batch))
@@ -0,0 +1,258 @@
+"""
+Runs real programs through a ProgramRunner in real time, with the mock devices in place of the hardware, and measures
+how steady and how cheap the control loop is:
+
+    - jitter: how far the time between ticks strays from the period
+    - CPU time per tick, for the whole process (which includes the heater's PWM thread)
+    - state store commands, and the round trips they would take to Redis, per tick
+    - memory growth over a long program, and over repeated runs
+
+The state is kept in memory by default, so nothing needs to be running, not even Redis (see interface.stores for the
+other stores). Run from the backend directory:
+
+    python -m benchmarks.control_loop
+    python -m benchmarks.control_loop --store mmap:/dev/shm/piwarmer-benchmark
+    python -m benchmarks.control_loop --ticks 5000 --period 0.005 --spi-latency 0 0.002 --output results.json
+    python -m benchmarks.control_loop --baseline results.json
+
+The results are saved as JSON, along with the commit they were measured at, so that they can be compared with
+--baseline after a change.
+
+"""
+import argparse
+import collections
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from device import clock, heater, mock, runner, thermometer
+from interface import APIInterface, stores
+
+DRIVER = {"name": "benchmark", "kp": 8.0, "ki": 0.05, "kd": 10.0, "max_accumulated_error": 500.0,
+          "min_accumulated_error": -500.0}
+# the figures that --baseline compares, and whether bigger is worse
+HEADLINES = (("jitter_p99_ms", True), ("jitter_max_ms", True), ("cpu_ms_per_tick", True),
+             ("commands_per_tick", True), ("round_trips_per_tick", True), ("rss_growth_kb", True))
+
+
+class CountingStore(object):
+    """
+    Passes every command on to a store, and counts the commands and the round trips they would take to a server. It
+    also notes the time at which each pub/sub channel is published to.
+
+    """
+    def __init__(self, store):
+        self._store = store
+        self.commands = collections.Counter()
+        self.round_trips = 0
+        self.published = collections.defaultdict(list)
+
+    def __getattr__(self, name):
+        if name not in stores.StateStore.COMMANDS:
+            return getattr(self._store, name)
+
+        def command(*args, **kwargs):
+            self.round_trips += 1
+            result = getattr(self._store, name)(*args, **kwargs)
+            self.count(name, args)
+            return result
+        return command
+
+    def count(self, name, args):
+        self.commands[name] += 1
+        if name == "publish":
+            self.published[args[0]].append(time.time())
+
+    def pipeline(self, transaction=True):
+        return CountingPipeline(self, self._store.pipeline(transaction=transaction))
+
+
+class CountingPipeline(object):
+    """
+    Counts the commands in a pipeline, which all take a single round trip.
+
+    """
+    def __init__(self, counter, pipeline):
+        self._counter = counter
+        self._pipeline = pipeline
+        self._queued = []
+
+    def __getattr__(self, name):
+        method = getattr(self._pipeline, name)
+
+        def queue(*args, **kwargs):
+            self._queued.append((name, args))
+            method(*args, **kwargs)
+            return self
+        return queue
+
+    def execute(self):
+        self._counter.round_trips += 1
+        results = self._pipeline.execute()
+        for name, args in self._queued:
+            self._counter.count(name, args)
+        self._queued = []
+        return results
+
+
+def resident_kb():
+    """
+    The memory the process is using now, in kilobytes. Without /proc, this is the most it has ever used.
+
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_program(store_spec, ticks, period, spi_latency, sampled, log_dir):
+    """
+    Runs a program of one Set step that lasts for a number of ticks, in real time.
+
+    :return:    the measurements of the run
+    :rtype:     dict
+
+    """
+    store = CountingStore(stores.make_store(store_spec))
+    api_interface = APIInterface(store=store)
+    sensor = mock.MockMAX31855(latency=spi_latency)
+    if sampled:
+        # started as main.py starts it, just before the runner, with nothing read yet
+        sampler = thermometer.ThermometerSampler(sensor)
+        group = thermometer.SamplerGroup([sampler])
+        group.start()
+    else:
+        group = None
+    program_runner = runner.ProgramRunner(api_interface, sampler if sampled else thermometer.Thermometer(sensor),
+                                          heater.Heater(mock.MockGPIO), log_dir=log_dir, clock=clock.SystemClock(),
+                                          build_pyramids=False)
+    try:
+        program_runner.boot()
+        api_interface.driver = dict(DRIVER, period=period)
+        # stored as the API stores it
+        api_interface.program = json.dumps({"1": {"mode": "set", "temperature": 60.0, "duration": ticks * period}})
+        api_interface.activate()
+        program_runner.start()
+        # only the loop itself is measured, not the setup
+        store.commands.clear()
+        store.round_trips = 0
+        cpu_start = cpu_seconds()
+        program_runner.run_loop()
+        cpu = cpu_seconds() - cpu_start
+    finally:
+        if group is not None:
+            group.stop()
+    ticks_run = len(store.published[api_interface.status_channel])
+    intervals = [later - earlier for earlier, later in zip(store.published[api_interface.status_channel],
+                                                           store.published[api_interface.status_channel][1:])]
+    jitter = [abs(interval - period) * 1000.0 for interval in intervals] or [0.0]
+    return {"ticks": ticks_run,
+            "jitter_p50_ms": percentile(jitter, 0.5),
+            "jitter_p99_ms": percentile(jitter, 0.99),
+            "jitter_max_ms": max(jitter),
+            "cpu_ms_per_tick": cpu * 1000.0 / max(1, ticks_run),
+            "commands_per_tick": sum(store.commands.values()) / float(max(1, ticks_run)),
+            "round_trips_per_tick": store.round_trips / float(max(1, ticks_run)),
+            "commands": dict(store.commands)}
+
+
+def run_case(store_spec, ticks, period, spi_latency, sampled, runs):
+    """
+    Runs the same program several times, and measures how much memory is left behind after each one.
+
+    :rtype:     dict
+
+    """
+    log_dir = tempfile.mkdtemp()
+    try:
+        results = []
+        gc.collect()
+        rss_start, objects_start = resident_kb(), len(gc.get_objects())
+        for _ in range(runs):
+            result = run_program(store_spec, ticks, period, spi_latency, sampled, log_dir)
+            gc.collect()
+            result["rss_kb"] = resident_kb()
+            result["gc_objects"] = len(gc.get_objects())
+            results.append(result)
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+    # the first run pays for everything that's set up once, so the later ones show whether anything is leaking
+    case = {"store": store_spec, "period": period, "ticks": ticks, "spi_latency": spi_latency, "sampled": sampled, "runs": results,
+            "rss_growth_kb": results[-1]["rss_kb"] - rss_start,
+            "rss_growth_per_run_kb": (results[-1]["rss_kb"] - results[0]["rss_kb"]) / float(max(1, runs - 1)),
+            "gc_objects_growth_per_run": ((results[-1]["gc_objects"] - results[0]["gc_objects"])
+                                          / float(max(1, runs - 1))),
+            "gc_objects_growth": results[-1]["gc_objects"] - objects_start}
+    for key, worse in HEADLINES:
+        if key in results[0]:
+            case[key] = (max if worse else min)(result[key] for result in results)
+    return case
+
+
+def commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_name(case):
+    return "%s, latency %gms, %s" % (case.get("store", "memory"), case["spi_latency"] * 1000.0,
+                                     "sampled" if case["sampled"] else "direct")
+
+
+def print_case(case, baseline=None):
+    print(case_name(case))
+    for key, worse in HEADLINES:
+        line = "  %-24s %10.3f" % (key, case[key])
+        if baseline is not None and baseline.get(key):
+            change = (case[key] - baseline[key]) / float(abs(baseline[key])) * 100.0
+            line += "   %+7.1f%% vs %.3f%s" % (change, baseline[key], " (worse)" if (change > 0) == worse and
+                                                                       abs(change) >= 10.0 else "")
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the jitter and cost of the control loop")
+    parser.add_argument("--store", default="memory", help="where to keep the state, as for PIWARMER_STATE_STORE")
+    parser.add_argument("--ticks", type=int, default=2000, help="the length of each program, in ticks")
+    parser.add_argument("--period", type=float, default=0.01, help="the number of seconds between ticks")
+    parser.add_argument("--spi-latency", type=float, nargs="+", default=[0.0, 0.002],
+                        help="the number of seconds each thermometer reading takes")
+    parser.add_argument("--runs", type=int, default=3, help="the number of times each program is run")
+    parser.add_argument("--sampled", action="store_true",
+                        help="read the thermometer in the background, as the controller does")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with results saved by --output")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {case_name(case): case for case in json.load(f)["cases"]}
+    results = {"commit": commit(), "python": platform.python_version(), "machine": platform.machine(),
+               "time": time.time(), "cases": []}
+    for spi_latency in args.spi_latency:
+        case = run_case(args.store, args.ticks, args.period, spi_latency, args.sampled, args.runs)
+        results["cases"].append(case)
+        print_case(case, baseline.get(case_name(case)) if args.baseline else None)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,36 @@
+"""
+Measures how long each derivative estimator takes per update, for a few window sizes. Run from the backend directory:
+
+    python -m benchmarks.derivative
+
+"""
+import random
+import timeit
+from device import derivative
+
+ESTIMATORS = [("lstsq (original)", derivative.LeastSquaresDerivative),
+              ("incremental least squares", derivative.IncrementalLeastSquaresDerivative),
+              ("filtered on measurement", lambda memory: derivative.FilteredDerivative())]
+UPDATES = 20000
+
+
+def time_estimator(factory, memory, updates=UPDATES):
+    """
+    The mean time per update, in microseconds.
+
+    """
+    estimator = factory(memory)
+    rng = random.Random(0)
+    errors = [rng.uniform(-10.0, 10.0) for _ in range(updates)]
+
+    def run():
+        for error in errors:
+            estimator.update(error, 37.0 - error, 1.0)
+    return min(timeit.repeat(run, number=1, repeat=3)) / updates * 1e6
+
+
+if __name__ == "__main__":
+    print("%-28s %8s %14s" % ("estimator", "memory", "us per update"))
+    for memory in (4, 10, 60):
+        for name, factory in ESTIMATORS:
+            print("%-28s %8d %14.2f" % (name, memory, time_estimator(factory, memory)))
@@ -1 +1,6 @@
-from runner import ProgramRunner
+import logging
+from runner import MultiChannelRunner, ProgramRunner
+
+# main.py gives the "heater" logger its handlers, so anything else that uses the device, such as the tests, shouldn't
+# be told that there aren't any
+logging.getLogger("heater").addHandler(logging.NullHandler())
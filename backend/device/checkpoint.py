@@ -0,0 +1,105 @@
+"""
+Checkpoints of a running program, so that a controller that is restarted partway through a run, e.g. by supervisord
+after an unexpected exception, carries on where it left off instead of abandoning the run and letting the block cool
+down. A checkpoint holds what's needed to pick the run up again that isn't already in the state store: when the run
+started, how far it has been skipped ahead, where it's being logged, and the state of the PID, so that the PID doesn't
+start over cold.
+
+Each checkpoint replaces the last one atomically, by writing a new file and renaming it over the old one, so a crash
+while one is being written leaves the previous one intact. The file isn't fsynced, since it only has to survive the
+controller crashing, not the Pi losing power, and an fsync on an SD card can take longer than a tick.
+
+A run is only ever resumed if the checkpoint was written recently, and since the Pi last booted. A Pi without a
+real-time clock can't always tell how long it was off for, and a program should never start by itself when the power
+comes back on.
+
+A run that crashes the controller again every time it's resumed would otherwise be resumed forever, so each checkpoint
+also counts how many times in a row the run has been resumed. The count goes up as soon as the run is resumed, and
+only goes back to 0 once the resumed run has carried on for INTERVAL ticks without crashing. After MAX_RESUMES resumes
+in a row, the run is abandoned instead.
+
+"""
+import collections
+import json
+import logging
+import os
+from datetime import datetime
+
+log = logging.getLogger("heater." + __name__)
+# how often, in ticks, a checkpoint is written
+INTERVAL = 5
+# how long, in seconds, after the last checkpoint a restarted controller will still resume the run
+GRACE_PERIOD = float(os.environ.get("PIWARMER_RESUME_GRACE_PERIOD", 60.0))
+# how many times in a row a run is resumed before it's abandoned
+MAX_RESUMES = int(os.environ.get("PIWARMER_MAX_RESUMES", 3))
+BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+Checkpoint = collections.namedtuple("Checkpoint", ["written", "boot_id", "program_hash", "start_time", "skip_time",
+                                                   "accumulated_error", "past_errors", "log_path", "run_id", "resumes"])
+
+
+class CheckpointFile(object):
+    """
+    Where the checkpoints of one channel are kept.
+
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, checkpoint):
+        """
+        Replaces the checkpoint.
+
+        :type checkpoint:    Checkpoint
+
+        """
+        values = checkpoint._asdict()
+        values["written"] = checkpoint.written.strftime(TIME_FORMAT)
+        values["start_time"] = checkpoint.start_time.strftime(TIME_FORMAT)
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(values, f)
+        os.rename(temporary, self.path)
+
+    def load(self):
+        """
+        :return:    the checkpoint, or None if there isn't one or it can't be read
+        :rtype:     Checkpoint
+
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as f:
+                values = json.load(f)
+            values["written"] = datetime.strptime(values["written"], TIME_FORMAT)
+            values["start_time"] = datetime.strptime(values["start_time"], TIME_FORMAT)
+            return Checkpoint(**values)
+        except (IOError, ValueError, TypeError, KeyError):
+            log.warning("Could not read the checkpoint in %s" % self.path, exc_info=True)
+            return None
+
+    def remove(self):
+        """
+        Forgets the checkpoint, so that the run it belongs to can't be resumed.
+
+        """
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def boot_id():
+    """
+    A string that's different every time the machine boots, or None if we can't tell.
+
+    :rtype:     str
+
+    """
+    try:
+        with open(BOOT_ID_PATH) as f:
+            return f.read().strip()
+    except IOError:
+        return None
@@ -0,0 +1,151 @@
+import ctypes
+import ctypes.util
+from datetime import datetime, timedelta
+import logging
+import os
+import time
+
+log = logging.getLogger("heater." + __name__)
+# from <time.h> on Linux
+CLOCK_MONOTONIC = 1
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def _posix_monotonic():
+    """
+    Python 2 has no monotonic clock in the standard library, so we ask the C library for one. The wall clock isn't good
+    enough: a Pi has no real-time clock, so NTP can step it backwards by minutes after it boots, and anything timed by
+    it (the scheduler's sleeps, the heater's pulses) would then last that much longer.
+
+    :return:    a function that gives the time of CLOCK_MONOTONIC, in seconds
+    :raises:    OSError if there's no clock_gettime() to call
+
+    """
+    clock_gettime = None
+    for name in ("c", "rt"):
+        path = ctypes.util.find_library(name)
+        if path is not None:
+            clock_gettime = getattr(ctypes.CDLL(path, use_errno=True), "clock_gettime", None)
+            if clock_gettime is not None:
+                break
+    if clock_gettime is None:
+        raise OSError("clock_gettime() is not available")
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+
+    def monotonic():
+        # a timespec of its own for every call, since the PWM thread and the control loop both read the clock
+        timespec = _Timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(timespec)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+    monotonic()
+    return monotonic
+
+
+if hasattr(time, 'monotonic'):
+    monotonic = time.monotonic
+else:
+    try:
+        monotonic = _posix_monotonic()
+    except (OSError, AttributeError):
+        # e.g. when developing on a machine without clock_gettime(). Nothing should run a heater like this
+        log.warning("No monotonic clock is available, so the wall clock will be used instead")
+        monotonic = time.time
+
+
+class SystemClock(object):
+    """
+    The real passage of time. Everything that needs to know the time or wait for it goes through a clock, so that a
+    VirtualClock can be swapped in for simulations.
+
+    """
+    @staticmethod
+    def now():
+        """
+        The current date and time, in UTC.
+
+        :rtype:     datetime
+
+        """
+        return datetime.utcnow()
+
+    @staticmethod
+    def monotonic():
+        """
+        A time in seconds that never goes backwards, for measuring intervals.
+
+        :rtype:     float
+
+        """
+        return monotonic()
+
+    @staticmethod
+    def sleep(seconds):
+        time.sleep(seconds)
+
+    @staticmethod
+    def wait_for(waiter, seconds):
+        """
+        Waits up to some number of seconds for something to happen.
+
+        :param waiter:     a function like threading.Event.wait, that blocks for up to a given number of seconds and
+                           returns True if it was woken up early
+        :param seconds:    the maximum number of seconds to wait
+
+        :return:    whatever waiter returns
+        :rtype:     bool
+
+        """
+        return waiter(seconds)
+
+
+class VirtualClock(object):
+    """
+    A clock that only moves forward when something sleeps on it. Sleeping is instantaneous, so a program that would
+    take hours to run in real time can be run in however long the computation takes.
+
+    """
+    def __init__(self, start=datetime(2000, 1, 1)):
+        """
+
+        :param start:    the date and time the clock starts at
+        :type start:     datetime
+
+        """
+        self._start = start
+        self._elapsed = 0.0
+
+    def now(self):
+        """
+        The current virtual date and time.
+
+        :rtype:     datetime
+
+        """
+        return self._start + timedelta(seconds=self._elapsed)
+
+    def monotonic(self):
+        """
+        The number of virtual seconds since the clock was created.
+
+        :rtype:     float
+
+        """
+        return self._elapsed
+
+    def sleep(self, seconds):
+        self._elapsed += max(0.0, seconds)
+
+    def wait_for(self, waiter, seconds):
+        """
+        Jumps ahead by some number of seconds, then checks (without blocking) whether anything happened.
+
+        :rtype:     bool
+
+        """
+        self.sleep(seconds)
+        return waiter(0)
@@ -0,0 +1,89 @@
+import collections
+import json
+import logging
+import threading
+import time
+from interface import Command
+
+log = logging.getLogger("heater." + __name__)
+
+
+class CommandListener(threading.Thread):
+    """
+    Subscribes to the command channel in Redis and hands each command to the control loop as soon as it arrives, so
+    that the loop doesn't have to poll for them. Stop commands are also acted on directly from this thread, so the
+    heater is cut even if the control loop is busy.
+
+    """
+    def __init__(self, api_interface, on_stop=None):
+        """
+
+        :param api_interface:    an APIInterface, used to subscribe to its channel's commands
+        :param on_stop:          a function to call immediately when a stop command arrives
+
+        """
+        super(CommandListener, self).__init__(name="commands")
+        self.daemon = True
+        self._api_interface = api_interface
+        self._on_stop = on_stop
+        self._commands = collections.deque()
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+
+    def run(self):
+        # absolutely do not allow this thread to die, or we'd stop hearing about stop commands
+        while True:
+            try:
+                pubsub = self._api_interface.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._api_interface.command_channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self._receive(json.loads(message['data']))
+            except Exception:
+                log.exception("Lost the command channel. Resubscribing.")
+                time.sleep(1)
+
+    def _receive(self, command):
+        """
+        Queue up a command for the control loop and wake it up.
+
+        :type command:    dict
+
+        """
+        log.info("Received command: %s" % command['command'])
+        if command['command'] == Command.STOP and self._on_stop is not None:
+            try:
+                self._on_stop()
+            except Exception:
+                log.exception("Could not act on stop command!")
+        with self._lock:
+            self._commands.append(command)
+            self._pending.set()
+
+    def wait(self, timeout):
+        """
+        Blocks until a command is waiting or the timeout expires. This is a drop-in replacement for time.sleep() that
+        can be interrupted.
+
+        :param timeout:    the maximum number of seconds to wait
+        :type timeout:     float
+
+        :return:    whether there are commands waiting to be handled
+        :rtype:     bool
+
+        """
+        self._pending.wait(timeout)
+        return self._pending.is_set()
+
+    def drain(self):
+        """
+        Takes every waiting command, in the order they arrived.
+
+        :rtype:     list of dict
+
+        """
+        with self._lock:
+            commands = list(self._commands)
+            self._commands.clear()
+            self._pending.clear()
+        return commands
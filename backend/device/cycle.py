@@ -26,21 +26,36 @@ class CurrentCycle(object):
     @property
     def current_setting(self):
         """
-        Finds the setting that we should currently be using to calculate the target temperature.
+        Finds the setting that we should currently be using to calculate the target temperature. The lookup is only
+        done once per elapsed time, since several properties need it during each cycle.
 
         :return:    start time (in seconds), stop time (in seconds), the program setting
         :rtype:     int, int, ProgramSetting
         :raises:    ProgramOver
 
+        """
+        step = self.current_program_step
+        return step.start, step.stop, step.setting
+
+    @property
+    def current_program_step(self):
+        """
+        The result of looking up the current time in the program's compiled schedule.
+
+        :rtype:     program.Step
+        :raises:    ProgramOver
+
         """
         assert self.program is not None
         assert self.current_time is not None
         assert self.start_time is not None
-        for start, stop, setting in self.steps:
-            if stop is None or start <= self.seconds_elapsed < stop:
-                # we're either at a Hold setting (stop is None) or we've found the current setting
-                return start, stop, setting
-        raise ProgramOver
+        seconds_elapsed = self.seconds_elapsed
+        if self._current_setting is None or self._current_setting[0] != seconds_elapsed:
+            self._current_setting = seconds_elapsed, self.program.schedule.lookup(seconds_elapsed)
+        step = self._current_setting[1]
+        if step is None:
+            raise ProgramOver
+        return step
 
     @property
     def step_time_remaining(self):
@@ -60,14 +75,13 @@ class CurrentCycle(object):
     @property
     def current_step(self):
         """
-        Gets the index of the current program setting.
+        Gets the index of the current program setting, or of the repeat that it belongs to.
 
         :rtype:     int
 
         """
         try:
-            start, stop, setting = self.current_setting
-            return setting.index
+            return self.current_program_step.index
         except ProgramOver:
             return None
 
@@ -80,8 +94,7 @@ class CurrentCycle(object):
 
         """
         try:
-            start, stop, setting = self.current_setting
-            return setting.get_temperature(self.seconds_elapsed - start)
+            return self.current_program_step.target_temperature
         except ProgramOver:
             return None
 
@@ -107,7 +120,7 @@ class CurrentCycle(object):
         Yields program settings in order along with their start and stop times (in seconds from the start of the program).
 
         """
-        for (start, stop), setting in sorted(self.program.settings.items()):
+        for start, stop, setting in self.program.schedule:
             yield start, stop, setting
 
     @property
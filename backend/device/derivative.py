@@ -0,0 +1,182 @@
+"""
+Ways of estimating how quickly the error is changing, for the derivative part of the PID. They all take the same
+inputs each tick, so the PID can use any of them.
+
+"""
+from abc import ABCMeta, abstractmethod
+import collections
+
+
+def least_squares_slope(values):
+    """
+    The slope of the line that best fits equally-spaced values, in units per tick.
+
+    :type values:    list of float
+    :rtype:     float
+
+    """
+    n = len(values)
+    sum_x = n * (n - 1) / 2.0
+    sum_xx = (n - 1) * n * (2 * n - 1) / 6.0
+    sum_y = float(sum(values))
+    sum_xy = float(sum(i * value for i, value in enumerate(values)))
+    return (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x * sum_x)
+
+
+class DerivativeEstimator(object):
+    """
+    Estimates the rate of change of the error, in Celsius per second.
+
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def update(self, error, measurement, dt=1.0):
+        """
+        Add the latest data and get the new estimate.
+
+        :param error:          the target temperature minus the measured temperature
+        :param measurement:    the measured temperature
+        :param dt:             the number of seconds since the previous update
+
+        :rtype:     float
+
+        """
+
+    @property
+    def values(self):
+        """
+        The recent values the estimate is based on, oldest first.
+
+        :rtype:     list of float
+
+        """
+        return []
+
+    def restore(self, values):
+        """
+        Carries on from values that were saved from another estimator of the same kind, e.g. by a checkpoint.
+
+        :param values:    what the other estimator's values were
+        :type values:     list of float
+
+        """
+        pass
+
+
+class LeastSquaresDerivative(DerivativeEstimator):
+    """
+    Fits a line to the last few errors with numpy every tick. This is how the derivative was originally calculated,
+    and it's kept for comparison. numpy is only imported when this is used, since it's slow to import on a Pi.
+
+    """
+    def __init__(self, memory=4):
+        import numpy as np
+        self._np = np
+        ticks = np.array([float(i) for i in range(memory)])
+        self._ticks = np.vstack([ticks, np.ones(memory)]).T
+        # seed the past errors with zeros. this will diminish the effect of the derivative for the
+        # first few (i.e. len(memory)) seconds, but after that it will be correct
+        self._past_errors = collections.deque([0.0 for _ in range(memory)], maxlen=memory)
+
+    @property
+    def values(self):
+        return list(self._past_errors)
+
+    def restore(self, values):
+        self._past_errors.extend(_window(values, self._past_errors.maxlen))
+
+    def update(self, error, measurement, dt=1.0):
+        self._past_errors.append(error)
+        return self._np.linalg.lstsq(self._ticks, self._np.array(self._past_errors), rcond=-1)[0][0] / dt
+
+
+class IncrementalLeastSquaresDerivative(DerivativeEstimator):
+    """
+    Gives the same answer as LeastSquaresDerivative, but keeps running sums so that each update takes constant time
+    no matter how many values are in the window.
+
+    """
+    # floating point errors slowly build up in the running sums, so every so often we recalculate them from scratch
+    RESUM_INTERVAL = 1000
+
+    def __init__(self, memory=4):
+        assert memory > 1
+        self._n = memory
+        self._past_errors = collections.deque([0.0 for _ in range(memory)], maxlen=memory)
+        sum_x = memory * (memory - 1) / 2.0
+        sum_xx = (memory - 1) * memory * (2 * memory - 1) / 6.0
+        self._sum_x = sum_x
+        self._denominator = memory * sum_xx - sum_x * sum_x
+        self._sum_y = 0.0
+        self._sum_xy = 0.0
+        self._updates = 0
+
+    @property
+    def values(self):
+        return list(self._past_errors)
+
+    def restore(self, values):
+        self._past_errors.extend(_window(values, self._n))
+        self._sum_y = float(sum(self._past_errors))
+        self._sum_xy = float(sum(i * value for i, value in enumerate(self._past_errors)))
+
+    def update(self, error, measurement, dt=1.0):
+        oldest = self._past_errors[0]
+        self._past_errors.append(error)
+        self._updates += 1
+        if self._updates % IncrementalLeastSquaresDerivative.RESUM_INTERVAL == 0:
+            self._sum_y = float(sum(self._past_errors))
+            self._sum_xy = float(sum(i * value for i, value in enumerate(self._past_errors)))
+        else:
+            # every value moves one tick to the left, the oldest drops off and the newest comes in on the right
+            self._sum_xy += -(self._sum_y - oldest) + (self._n - 1) * error
+            self._sum_y += error - oldest
+        slope = (self._n * self._sum_xy - self._sum_x * self._sum_y) / self._denominator
+        return slope / dt
+
+
+class FilteredDerivative(DerivativeEstimator):
+    """
+    Differentiates the measured temperature instead of the error, so that a step change in the target temperature
+    doesn't cause a spike, and smooths the result with a first-order low-pass filter to suppress thermometer noise.
+
+    """
+    def __init__(self, time_constant=4.0):
+        """
+
+        :param time_constant:    the time constant of the low-pass filter, in seconds
+
+        """
+        assert time_constant >= 0.0
+        self._time_constant = time_constant
+        self._previous = None
+        self._derivative = 0.0
+
+    @property
+    def values(self):
+        return [] if self._previous is None else [self._previous]
+
+    def restore(self, values):
+        # the filtered derivative itself isn't saved, so it builds up again over the next few ticks
+        self._previous = values[-1] if values else None
+
+    def update(self, error, measurement, dt=1.0):
+        if self._previous is not None:
+            # when the target is steady, the error falls exactly as fast as the temperature rises
+            raw = -(measurement - self._previous) / dt
+            alpha = dt / (self._time_constant + dt)
+            self._derivative += alpha * (raw - self._derivative)
+        self._previous = measurement
+        return self._derivative
+
+
+def _window(values, size):
+    """
+    The last few values, with zeros in front of them if there aren't enough, as the estimators are seeded.
+
+    :rtype:     list of float
+
+    """
+    values = [float(value) for value in values][-size:]
+    return [0.0] * (size - len(values)) + values
@@ -1,32 +1,70 @@
-import time
+import clock
 import logging
+import os
+import pwm
 
 log = logging.getLogger("heater." + __name__)
+# The carrier frequency and mode of the background PWM thread. You can override them by setting the environment
+# variables PWM_FREQUENCY (in Hertz) and PWM_MODE ("pwm" or "sigma_delta").
+PWM_FREQUENCY = float(os.getenv('PWM_FREQUENCY', 1.0))
+PWM_MODE = os.getenv('PWM_MODE', pwm.PWMEngine.PWM)
+# If the control loop doesn't set the duty cycle for this many of its periods, e.g. because it has hung, the PWM thread
+# turns the heater off by itself
+WATCHDOG_PERIODS = 5
 
 
 class Heater(object):
     """
     Controls the pins that cause current to pass through the heating element.
-    We do PWM with 1 Hz cycles, just because the libraries that implement it
-    seem to not work well with Raspberry Pi B+, and because the things we're heating
-    take a long time to heat or cool, so 1 Hz is fine.
+    We do PWM ourselves, just because the libraries that implement it
+    seem to not work well with Raspberry Pi B+. By default we use 1 Hz cycles, because the things we're heating
+    take a long time to heat or cool, so 1 Hz is fine. The switching is done by a background thread (see pwm.py)
+    so that the control loop doesn't have to wait for it.
 
     """
+    # the pins of a controller with a single channel. Each channel of a multi-channel controller has its own
     PWM_PIN = 16
     ENABLE_PIN = 20
     DANGER = False
 
-    def __init__(self, gpio):
-        self._gpio = gpio
-        self._gpio.setup(Heater.ENABLE_PIN, self._gpio.OUT)
-        self._gpio.setup(Heater.PWM_PIN, self._gpio.OUT)
+    def __init__(self, gpio, frequency=PWM_FREQUENCY, mode=PWM_MODE, clock=clock.SystemClock(), engine_factory=None,
+                 pwm_pin=PWM_PIN, enable_pin=ENABLE_PIN):
+        """
+
+        :param gpio:              the GPIO module (or a mock of it)
+        :param frequency:         the carrier frequency of the PWM thread, in Hertz
+        :param mode:              the mode of the PWM thread (see PWMEngine)
+        :param clock:             used by heat() and pulse() to wait
+        :param engine_factory:    a function that returns something to do PWM in place of a PWMEngine, such as a
+                                  simulated ThermalPlant
+        :param pwm_pin:           the pin that switches the heating element
+        :param enable_pin:        the pin that has to be on for the heating element to be switched at all
 
-    def enable(self):
+        """
+        self._gpio = gpio
+        self._pwm_pin = pwm_pin
+        self._enable_pin = enable_pin
+        self._frequency = frequency
+        self._mode = mode
+        self._clock = clock
+        self._engine_factory = engine_factory
+        self._engine = None
+        self._watchdog = WATCHDOG_PERIODS * 1.0
+        self._gpio.setup(self._enable_pin, self._gpio.OUT)
+        self._gpio.setup(self._pwm_pin, self._gpio.OUT)
+
+    def enable(self, period=1.0):
         """
         Turn on one of two pins necessary to heat the heater cartridge. This one is turned on the entire time a program is running.
 
+        :param period:    how often, in seconds, the control loop will set the duty cycle. If it misses WATCHDOG_PERIODS
+                          of them, the heater is turned off
+
         """
-        self._gpio.output(Heater.ENABLE_PIN, self._gpio.HIGH)
+        self._watchdog = WATCHDOG_PERIODS * period
+        if isinstance(self._engine, pwm.PWMEngine):
+            self._engine.watchdog = self._watchdog
+        self._gpio.output(self._enable_pin, self._gpio.HIGH)
 
     def disable(self):
         """
@@ -34,42 +72,97 @@ class Heater(object):
 
         """
         try:
-            self._gpio.output(Heater.ENABLE_PIN, self._gpio.LOW)
+            self._gpio.output(self._enable_pin, self._gpio.LOW)
         except Exception:
             log.exception("Could not deactivate heater!")
             Heater.DANGER = True
+        try:
+            self._stop_engine()
+        except Exception:
+            log.exception("Could not stop the PWM thread!")
         # This next step may fail, but we've already turned off the heater so there's no danger worth reporting.
-        self._gpio.output(Heater.PWM_PIN, self._gpio.LOW)
+        self._gpio.output(self._pwm_pin, self._gpio.LOW)
 
-    def heat(self, duty_cycle):
+    def set_duty(self, duty_cycle):
         """
-        Turn on the heater for some percentage of one second.
+        Set the duty cycle of the background PWM thread, starting the thread if it isn't already running. This returns
+        immediately and the new value takes effect right away. Don't mix this with heat() or pulse(), which switch the
+        pin directly.
 
         :param duty_cycle:    the percentage of time the heater should be active, from 0 to 100
         :type duty_cycle:    float
 
         """
-        on_time, off_time = self._calculate_pwm(duty_cycle)
+        if self._engine is None:
+            if self._engine_factory is not None:
+                self._engine = self._engine_factory()
+            else:
+                self._engine = pwm.PWMEngine(self._gpio, self._pwm_pin, self._frequency, self._mode,
+                                             watchdog=self._watchdog)
+            self._engine.set_duty(duty_cycle)
+            self._engine.start()
+        else:
+            self._engine.set_duty(duty_cycle)
+
+    def _stop_engine(self):
+        """
+        Stop the background PWM thread, if there is one.
+
+        """
+        if self._engine is not None:
+            engine, self._engine = self._engine, None
+            engine.stop()
+
+    def heat(self, duty_cycle, period=1.0):
+        """
+        Turn on the heater for some percentage of one period. This blocks for the entire period.
+
+        :param duty_cycle:    the percentage of time the heater should be active, from 0 to 100
+        :type duty_cycle:    float
+        :param period:    the length of the PWM cycle, in seconds
+        :type period:    float
+
+        """
+        on_time, off_time = self.pulse(duty_cycle, period)
+        self._clock.sleep(off_time)
+
+    def pulse(self, duty_cycle, period=1.0):
+        """
+        Runs only the "on" phase of a PWM cycle and leaves the heater off afterwards. The caller is responsible for
+        the "off" phase, which lets it do useful work during that time instead of sleeping.
+
+        :param duty_cycle:    the percentage of time the heater should be active, from 0 to 100
+        :type duty_cycle:    float
+        :param period:    the length of the PWM cycle, in seconds
+        :type period:    float
+
+        :return:    seconds the heater was on, seconds it should now stay off
+        :rtype:     (float, float)
+
+        """
+        on_time, off_time = self._calculate_pwm(duty_cycle, period)
         if on_time:
             # don't want to rapidly switch this pin on and then off unless we need to
-            self._gpio.output(Heater.PWM_PIN, self._gpio.HIGH)
-            time.sleep(on_time)
-        self._gpio.output(Heater.PWM_PIN, self._gpio.LOW)
-        time.sleep(off_time)
+            self._gpio.output(self._pwm_pin, self._gpio.HIGH)
+            self._clock.sleep(on_time)
+        self._gpio.output(self._pwm_pin, self._gpio.LOW)
+        return on_time, off_time
 
-    def _calculate_pwm(self, duty_cycle):
+    def _calculate_pwm(self, duty_cycle, period=1.0):
         """
-        We do pulse-width modulation with a frequency of one Hertz, since the materials we use have such a high
-        heat capacity that anything faster won't make a difference. Here we just convert duty cycle to a float
+        We do pulse-width modulation with a frequency of one Hertz by default, since the materials we use have such
+        a high heat capacity that anything faster won't make a difference. Here we just convert duty cycle to a float
         essentially.
 
         :param duty_cycle:    the percentage of time the heater should be active, from 0 to 100
         :type duty_cycle:    float
+        :param period:    the length of the PWM cycle, in seconds
+        :type period:    float
 
-        :return:    percentage of one second to heat, percentage of one second to deactivate the heater
+        :return:    seconds to heat, seconds to deactivate the heater
         :rtype:     (float, float)
 
         """
         assert 0 <= duty_cycle <= 100
-        on_time = duty_cycle / 100.0
-        return on_time, 1.0 - on_time
+        on_time = duty_cycle / 100.0 * period
+        return on_time, period - on_time
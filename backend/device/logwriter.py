@@ -0,0 +1,155 @@
+"""
+Writes the temperature log of a run in a background thread, so that a slow write to the SD card can never hold up the
+control loop. Each tick only puts its record in a bounded queue, which never blocks: if the writer has fallen so far
+behind that the queue is full, the record is dropped and counted instead. The writer commits the records in groups,
+whenever enough of them have built up or enough time has passed, so the card sees a few large writes rather than one
+small one per tick.
+
+How far the records are pushed towards the disk is set by FSYNC:
+
+    never:    records are only handed to the operating system, which writes them out when it likes
+    close:    the log is also fsynced once, when the run ends (the default)
+    commit:   every group of records is fsynced, so at most one group is lost if the power goes
+
+"""
+from clock import monotonic
+import logging
+import os
+import Queue
+import threading
+
+log = logging.getLogger("heater." + __name__)
+# the most records that can be waiting to be written, which is over a minute's worth at the usual period
+CAPACITY = 512
+# records are committed once this many have built up...
+COMMIT_RECORDS = 32
+# ...or when the oldest has been waiting this many seconds
+COMMIT_INTERVAL = 2.0
+# how long, in seconds, closing the log waits for the records that are still queued to be written
+DRAIN_TIMEOUT = 5.0
+FSYNC_NEVER = "never"
+FSYNC_CLOSE = "close"
+FSYNC_COMMIT = "commit"
+FSYNC = os.environ.get("PIWARMER_TELEMETRY_FSYNC", FSYNC_CLOSE)
+# queued by close() to tell the writer that there's nothing more to come
+_CLOSE = object()
+
+
+class AsyncTelemetryWriter(threading.Thread):
+    """
+    Takes the place of a telemetry.TelemetryWriter, and passes the records on to it in the background.
+
+    """
+    def __init__(self, writer, capacity=CAPACITY, commit_records=COMMIT_RECORDS, commit_interval=COMMIT_INTERVAL,
+                 fsync=FSYNC):
+        """
+
+        :param writer:             the telemetry file to write to, which is closed along with this
+        :type writer:              telemetry.TelemetryWriter
+        :param capacity:           the most records that can be waiting to be written
+        :param commit_records:     how many records are written at once
+        :param commit_interval:    the longest, in seconds, that a record waits to be written
+        :param fsync:              when the file is fsynced: FSYNC_NEVER, FSYNC_CLOSE or FSYNC_COMMIT
+
+        """
+        super(AsyncTelemetryWriter, self).__init__(name="telemetry-writer")
+        assert fsync in (FSYNC_NEVER, FSYNC_CLOSE, FSYNC_COMMIT), "Unknown fsync policy: %s" % fsync
+        self.daemon = True
+        self._writer = writer
+        self._queue = Queue.Queue(maxsize=capacity)
+        self._commit_records = commit_records
+        self._commit_interval = commit_interval
+        self._fsync = fsync
+        # records that didn't fit in the queue, and records that couldn't be written
+        self.dropped = 0
+        self.failed = 0
+        self.written = 0
+        self._closed = False
+
+    @property
+    def path(self):
+        return self._writer.path
+
+    def write(self, timestamp, measured, target, duty, step, integral):
+        """
+        Queues a record to be written, as telemetry.TelemetryWriter.write() would write it. This never blocks.
+
+        :return:    whether the record was queued, rather than dropped
+        :rtype:     bool
+
+        """
+        try:
+            self._queue.put_nowait((timestamp, measured, target, duty, step, integral))
+        except Queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self, timeout=DRAIN_TIMEOUT):
+        """
+        Writes whatever is still queued and closes the file, giving up after a while so that a stuck SD card can't stop
+        the heater from being shut down. If it gives up, the writer carries on and closes the file when it's done.
+
+        :param timeout:    how long, in seconds, to wait for the queue to be written
+        :return:           whether every record was written and the file closed, rather than giving up
+        :rtype:            bool
+
+        """
+        if self._closed:
+            return not self.is_alive()
+        self._closed = True
+        if self.ident is None:
+            # it was never started, so there's nobody else to write the records
+            self.start()
+        deadline = monotonic() + timeout
+        try:
+            self._queue.put(_CLOSE, timeout=timeout)
+        except Queue.Full:
+            log.warning("Gave up waiting to close the temperature log %s" % self.path)
+            return False
+        self.join(max(0.0, deadline - monotonic()))
+        if self.is_alive():
+            log.warning("Gave up waiting for %d records to be written to %s" % (self._queue.qsize(), self.path))
+            return False
+        return True
+
+    def run(self):
+        records = []
+        deadline = None
+        while True:
+            try:
+                if deadline is None:
+                    record = self._queue.get()
+                else:
+                    record = self._queue.get(timeout=max(0.0, deadline - monotonic()))
+            except Queue.Empty:
+                record = None
+            if record is _CLOSE:
+                break
+            if record is not None:
+                if not records:
+                    deadline = monotonic() + self._commit_interval
+                records.append(record)
+            if records and (len(records) >= self._commit_records or monotonic() >= deadline):
+                self._commit(records, sync=self._fsync == FSYNC_COMMIT)
+                records = []
+                deadline = None
+        self._commit(records, sync=self._fsync != FSYNC_NEVER)
+        try:
+            self._writer.close()
+        except:
+            log.exception("Failed to close the temperature log %s!" % self.path)
+
+    def _commit(self, records, sync):
+        """
+        Writes a group of records, and flushes them.
+
+        """
+        try:
+            self._writer.write_packed(b"".join(self._writer.pack(*record) for record in records))
+            self._writer.flush(sync=sync)
+        except:
+            self.failed += len(records)
+            log.exception("Failed to write %d records to the temperature log %s!" % (len(records), self.path))
+        else:
+            self.written += len(records)
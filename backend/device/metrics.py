@@ -0,0 +1,154 @@
+"""
+Measures where the time in each control tick goes, cheaply enough to leave on all the time. Each phase of the tick is
+timed with the real clock (even in simulations, where the tick itself runs in virtual time), and the most recent
+timings of each phase are summarized as percentiles. Along with a few counters, the summaries are published to Redis
+every so often, and the API serves them to Prometheus at /metrics.
+
+"""
+from array import array
+from clock import monotonic
+import logging
+
+log = logging.getLogger("heater." + __name__)
+# the number of recent timings that each phase's percentiles are based on
+WINDOW = 1000
+# how often, in seconds, the metrics are published
+PUBLISH_INTERVAL = 10.0
+QUANTILES = (0.5, 0.99)
+
+
+class RollingSummary(object):
+    """
+    Keeps the most recent values in a fixed-size ring, so that recording one is just a store into an array. The
+    percentiles are only worked out when they're asked for.
+
+    """
+    def __init__(self, size=WINDOW):
+        assert size > 0
+        self._values = array('d', [0.0] * size)
+        self._next = 0
+        self._full = False
+        # over everything ever recorded, as Prometheus expects of a summary
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self._values[self._next] = value
+        self._next += 1
+        if self._next == len(self._values):
+            self._next = 0
+            self._full = True
+        self.count += 1
+        self.total += value
+
+    @property
+    def recent(self):
+        """
+        The values in the window, in no particular order.
+
+        :rtype:     list of float
+
+        """
+        return self._values.tolist() if self._full else self._values[:self._next].tolist()
+
+    def summary(self):
+        """
+        :return:    the nearest-rank percentiles in QUANTILES and the maximum of the recent values, keyed by "p50",
+                    "p99" and "max", along with the count and sum of every value ever recorded. The percentiles are
+                    None if nothing has been recorded.
+        :rtype:     dict
+
+        """
+        ordered = sorted(self.recent)
+        out = {"count": self.count, "sum": self.total, "max": ordered[-1] if ordered else None}
+        for quantile in QUANTILES:
+            key = "p%g" % (quantile * 100)
+            out[key] = ordered[min(len(ordered) - 1, int(quantile * len(ordered)))] if ordered else None
+        return out
+
+
+class Metrics(object):
+    """
+    Times the phases of each tick and counts events. A tick is timed by calling begin() at the start, lap() at the end
+    of each phase, and end() when the work is done, so that each phase costs a single clock read.
+
+    """
+    def __init__(self, timer=monotonic, window=WINDOW):
+        """
+
+        :param timer:     returns the current time in seconds
+        :param window:    the number of recent timings that each phase's percentiles are based on
+
+        """
+        self._timer = timer
+        self._window = window
+        self._phases = {}
+        self._counters = {}
+        self._tick_start = None
+        self._lap_start = None
+
+    def begin(self):
+        """
+        Marks the start of a tick.
+
+        """
+        self._tick_start = self._lap_start = self._timer()
+
+    def lap(self, phase):
+        """
+        Records the time since the end of the previous phase, or the start of the tick, as the time taken by a phase.
+
+        :param phase:    the name of the phase that just finished
+
+        """
+        now = self._timer()
+        self._record(phase, now - self._lap_start)
+        self._lap_start = now
+
+    def end(self):
+        """
+        Records the time since the start of the tick as the time taken by the whole tick, excluding the wait for the
+        next one.
+
+        """
+        now = self._timer()
+        self._record("tick", now - self._tick_start)
+        self._lap_start = now
+
+    def _record(self, phase, seconds):
+        summary = self._phases.get(phase)
+        if summary is None:
+            summary = self._phases[phase] = RollingSummary(self._window)
+        summary.add(seconds)
+
+    def count(self, name, increment=1):
+        """
+        Adds to a counter.
+
+        """
+        self._counters[name] = self._counters.get(name, 0) + increment
+
+    def set_counter(self, name, value):
+        """
+        Sets a counter that is kept somewhere else, e.g. the number of readings the thermometer has rejected.
+
+        """
+        self._counters[name] = value
+
+    def snapshot(self):
+        """
+        The current metrics as a flat dict that can be stored in a Redis hash: "<phase>:<statistic>" for the
+        statistics of each phase (see RollingSummary.summary()), and "counter:<name>" for each counter. Statistics
+        that don't have a value yet are left out.
+
+        :rtype:     dict
+
+        """
+        out = {}
+        for phase, summary in self._phases.items():
+            for statistic, value in summary.summary().items():
+                if value is not None:
+                    out["%s:%s" % (phase, statistic)] = value
+        for name, value in self._counters.items():
+            out["counter:%s" % name] = value
+        return out
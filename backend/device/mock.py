@@ -1,6 +1,7 @@
 import logging
 import random
 import os
+import time
 
 log = logging.getLogger("heater." + __name__)
 
@@ -23,17 +24,63 @@ class MockGPIO(object):
 
 class MockMAX31855(object):
     """ Allows testing of thermometer functionality outside of Raspberry Pi. """
-    def __init__(self, *args):
-        pass
+    def __init__(self, *args, **kwargs):
+        # the number of seconds each reading takes, to stand in for the time spent talking to the chip over SPI
+        self.latency = kwargs.get("latency", 0.0)
 
     @staticmethod
-    def MAX31855(*args):
+    def MAX31855(*args, **kwargs):
         # This is a hack to get around how the real module is structured
-        return MockMAX31855()
+        return MockMAX31855(*args, **kwargs)
 
     def readTempC(self):
+        if self.latency:
+            time.sleep(self.latency)
         # You can set the temperature through an environment variable to test it live,
         # or if you don't care about the value it will pick a random one for you
         temp = os.getenv('MOCKTEMP', random.randint(20, 99))
         log.debug("Fake temperature: %s C" % temp)
         return temp
+
+
+class MockAPIInterface(object):
+    """
+    Stands in for the Redis-backed APIInterface so that a runner can be driven without a Redis server, e.g. in
+    simulations. Every status update is recorded along with the time it was made.
+
+    """
+    def __init__(self, program, driver, clock, stop_after=None):
+        """
+
+        :param program:       the program steps, as they would be stored by the API
+        :param driver:        the PID values, as they would be stored by the API
+        :param clock:         the clock used to timestamp status updates
+        :param stop_after:    the number of seconds after which the runner is told to stop, if any
+
+        """
+        self.program = program
+        self.program_id = None
+        self.compiled_program = None
+        self.driver = driver
+        self.active = True
+        self.skip_time = 0
+        self.current_temp = None
+        self.history = []
+        self.metrics = None
+        self._clock = clock
+        self._start = clock.monotonic()
+        self._stop_after = stop_after
+
+    def clear(self):
+        self.active = False
+
+    def read_controls(self):
+        if self._stop_after is not None and self._clock.monotonic() - self._start >= self._stop_after:
+            self.active = False
+        return self.active, self.skip_time
+
+    def publish_status(self, **status):
+        self.history.append((self._clock.monotonic() - self._start, status))
+
+    def publish_metrics(self, metrics):
+        self.metrics = metrics
@@ -1,5 +1,4 @@
-import collections
-import numpy as np
+import derivative
 
 
 class Driver(object):
@@ -7,13 +6,14 @@ class Driver(object):
     Just a container for PID values.
 
     """
-    def __init__(self, name, kp, ki, kd, error_max, error_min):
+    def __init__(self, name, kp, ki, kd, error_max, error_min, period=1.0):
         self.name = name
         self.kp = kp
         self.ki = ki
         self.kd = kd
         self.error_max = error_max
         self.error_min = error_min
+        self.period = period
 
 
 class PID(object):
@@ -21,62 +21,211 @@ class PID(object):
     Calculates what duty cycle would be best to achieve a certain temperature, while attempting to minimize error and prevent oscillation around the target temperature.
 
     """
-    def __init__(self, driver, memory=4):
+    def __init__(self, driver, memory=4, derivative_estimator=None):
         """
 
         :param driver:    a Driver object that provides all the PID parameters
         :param memory:    the number of previous cycles to use in the calculation of the error derivative
+        :param derivative_estimator:    a DerivativeEstimator, which by default fits a line to the last few errors
 
         """
         memory = int(memory)
         assert memory > 2
+        self.update_gains(driver)
+        # the past errors are seeded with zeros. this will diminish the effect of the derivative for the
+        # first few (i.e. len(memory)) seconds, but after that it will be correct. It is therefore best
+        # to use a small value for memory, probably less than 10
+        self._derivative = derivative_estimator or derivative.IncrementalLeastSquaresDerivative(memory)
+
+    @property
+    def past_errors(self):
+        """
+        The recent errors that the derivative is based on.
+
+        """
+        return self._derivative.values
+
+    def restore(self, past_errors):
+        """
+        Carries on from the recent errors of another PID, e.g. from a checkpoint, so that the derivative doesn't start
+        over from zeros.
+
+        :param past_errors:    the other PID's recent errors, oldest first
+        :type past_errors:     list of float
+
+        """
+        self._derivative.restore(past_errors)
+
+    def update_gains(self, driver):
+        """
+        Use new PID values. The history of past errors is kept, so this can be done in the middle of a run.
+
+        :param driver:    a Driver object that provides all the PID parameters
+
+        """
         self._kp = driver.kp
         self._ki = driver.ki
         self._kd = driver.kd
         self._accumulated_error_max = driver.error_max
         self._accumulated_error_min = driver.error_min
-        # generate some things needed to calculate the derivative
-        ticks = np.array([float(i) for i in range(memory)])
-        self._ticks = np.vstack([ticks, np.ones(memory)]).T
-        # seed the past errors with zeros. this will diminish the effect of the derivative for the
-        # first few (i.e. len(memory)) seconds, but after that it will be correct. It is therefore best
-        # to use a small value for memory, probably less than 10
-        self._past_errors = collections.deque([0.0 for _ in range(memory)], maxlen=memory)
 
-    def update(self, cycle_data):
+    def update(self, cycle_data, dt=1.0):
         """
         Give the PID new data and get back what the duty cycle should be.
 
+        :param dt:    the number of seconds since the previous update
+
         """
         assert cycle_data.target_temperature is not None
         assert cycle_data.current_temperature is not None
         assert cycle_data.accumulated_error is not None
 
         error = cycle_data.target_temperature - cycle_data.current_temperature
-        self._past_errors.append(error)
-        error_integral = self._calculate_integral(error, cycle_data.accumulated_error)
+        error_integral = self._calculate_integral(error, cycle_data.accumulated_error, dt)
         p = self._kp * error
         i = self._ki * error_integral
-        d = self._calculate_derivative(self._kd, self._past_errors)
+        d = self._kd * self._derivative.update(error, cycle_data.current_temperature, dt)
         # duty cycle is bounded from 0% to 100%
         duty_cycle = max(0, min(100, int(p + i + d)))
         return duty_cycle, error_integral
 
-    def _calculate_integral(self, error, accumulated_error):
+    def _calculate_integral(self, error, accumulated_error, dt=1.0):
         """
         Calculates the value used by the integral part of the equation and ensures it's within the given bounds.
 
         """
-        # Add the current error to the accumulated error
-        new_accumulated_error = accumulated_error + error
+        # Add the current error, weighted by how long it was present, to the accumulated error
+        new_accumulated_error = accumulated_error + error * dt
         # Ensure the value is within the allowed limits
         new_accumulated_error = min(new_accumulated_error, self._accumulated_error_max)
         new_accumulated_error = max(new_accumulated_error, self._accumulated_error_min)
         return new_accumulated_error
 
-    def _calculate_derivative(self, kd, past_errors):
+    def _calculate_derivative(self, kd, past_errors, dt=1.0):
         """
         Computes the derivative of the recent differences between the target temperature and the actual temperature.
+        The fit is done per tick, so we divide by the length of a tick to get the change per second.
+
+        """
+        return kd * derivative.least_squares_slope(past_errors) / dt
+
+
+class BatchPID(object):
+    """
+    Runs many PIDs at once, with their gains, accumulated errors and recent errors held in numpy arrays, so that one
+    update call updates all of them. Each controller behaves exactly like a PID with the default derivative: the same
+    bounds on the accumulated error, the same least squares fit to the last few errors (seeded with zeros), and the
+    same truncation and bounds on the duty cycle. It's used to step every channel of a multi-channel controller and to
+    run many simulated controllers, e.g. in parameter sweeps. numpy is only imported when this is used, since it's
+    slow to import on a Pi.
+
+    """
+    def __init__(self, drivers, memory=4):
+        """
+
+        :param drivers:    a Driver for each controller
+        :param memory:     the number of previous cycles to use in the calculation of the error derivative
+
+        """
+        import numpy as np
+        self._np = np
+        memory = int(memory)
+        assert memory > 2 and drivers
+        count = len(drivers)
+        self._kp = np.zeros(count)
+        self._ki = np.zeros(count)
+        self._kd = np.zeros(count)
+        self._accumulated_error_max = np.zeros(count)
+        self._accumulated_error_min = np.zeros(count)
+        self.accumulated_errors = np.zeros(count)
+        # the recent errors of each controller, oldest first
+        self._past_errors = np.zeros((count, memory))
+        # the least squares slope of equally-spaced values is a fixed weighted sum of them
+        ticks = np.arange(memory, dtype=np.float64)
+        self._slope_weights = (ticks - ticks.mean()) / ((ticks - ticks.mean()) ** 2).sum()
+        for index, driver in enumerate(drivers):
+            self.update_gains(index, driver)
+
+    def __len__(self):
+        return len(self._kp)
+
+    def update_gains(self, index, driver):
+        """
+        Use new PID values for one controller. Its accumulated error and past errors are kept, so this can be done in
+        the middle of a run.
+
+        :param index:     which controller
+        :param driver:    a Driver object that provides all the PID parameters
+
+        """
+        self._kp[index] = driver.kp
+        self._ki[index] = driver.ki
+        self._kd[index] = driver.kd
+        self._accumulated_error_max[index] = driver.error_max
+        self._accumulated_error_min[index] = driver.error_min
+
+    def reset(self, index, driver=None, accumulated_error=0.0, past_errors=None):
+        """
+        Starts one controller over, as if it were a new PID, or carries on from the state of another one.
+
+        :param index:                which controller
+        :param driver:               new PID values, if they've changed
+        :param accumulated_error:    the accumulated error to start from
+        :param past_errors:          the recent errors to start from, oldest first, rather than zeros
+        :type past_errors:           list of float
 
         """
-        return kd * np.linalg.lstsq(self._ticks, np.array(past_errors))[0][0]
+        if driver is not None:
+            self.update_gains(index, driver)
+        self.accumulated_errors[index] = accumulated_error
+        self._past_errors[index] = 0.0
+        if past_errors:
+            past_errors = list(past_errors)[-self._past_errors.shape[1]:]
+            self._past_errors[index, self._past_errors.shape[1] - len(past_errors):] = past_errors
+
+    def past_errors(self, index):
+        """
+        The recent errors of one controller, oldest first.
+
+        :rtype:     list of float
+
+        """
+        return self._past_errors[index].tolist()
+
+    def update(self, targets, measurements, dt=1.0, indexes=None):
+        """
+        Give some or all of the controllers new data and get back what their duty cycles should be.
+
+        :param targets:         the target temperature of each controller that's being updated
+        :param measurements:    the measured temperature of each controller that's being updated
+        :param dt:              the number of seconds since each controller's previous update, or the same for all
+        :param indexes:         which controllers are being updated, or None for all of them in order
+
+        :return:    the duty cycles, from 0 to 100, and the new accumulated errors of the controllers that were updated
+        :rtype:     (numpy.ndarray, numpy.ndarray)
+
+        """
+        np = self._np
+        if indexes is None:
+            indexes = slice(None)
+        else:
+            indexes = np.asarray(indexes, dtype=np.intp)
+        dt = np.asarray(dt, dtype=np.float64)
+        errors = np.asarray(targets, dtype=np.float64) - np.asarray(measurements, dtype=np.float64)
+
+        # the same order of bounds as PID._calculate_integral(), so that they agree even if the bounds are crossed
+        integrals = self.accumulated_errors[indexes] + errors * dt
+        integrals = np.maximum(np.minimum(integrals, self._accumulated_error_max[indexes]),
+                               self._accumulated_error_min[indexes])
+        self.accumulated_errors[indexes] = integrals
+
+        past_errors = np.empty_like(self._past_errors[indexes])
+        past_errors[:, :-1] = self._past_errors[indexes, 1:]
+        past_errors[:, -1] = errors
+        self._past_errors[indexes] = past_errors
+        derivatives = past_errors.dot(self._slope_weights) / dt
+
+        total = self._kp[indexes] * errors + self._ki[indexes] * integrals + self._kd[indexes] * derivatives
+        # like int(), this truncates towards zero before the duty cycle is bounded from 0% to 100%
+        duty_cycles = np.clip(np.trunc(total), 0, 100).astype(int)
+        return duty_cycles, integrals
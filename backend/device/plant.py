@@ -0,0 +1,122 @@
+import bisect
+import math
+import random
+
+
+class ThermalPlant(object):
+    """
+    A simulated heating block, modelled as a first-order system with dead time: the block approaches a steady-state
+    temperature set by the duty cycle with a single time constant, and it only responds to a change in the duty cycle
+    after a delay. Heat is lost to the surroundings in proportion to the difference from the ambient temperature.
+
+    The temperature is solved exactly between changes of the duty cycle, so there is no integration step to tune and
+    the result doesn't depend on how often the temperature is read.
+
+    It can be used in place of the PWM thread (see Heater), since it takes a duty cycle through set_duty().
+
+    """
+    def __init__(self, clock, gain=80.0, time_constant=120.0, dead_time=5.0, ambient=22.0, initial=None):
+        """
+
+        :param clock:            the clock that drives the simulation, usually a VirtualClock
+        :param gain:             how far above ambient the block settles at 100% duty cycle, in Celsius
+        :param time_constant:    the number of seconds to get 63% of the way to the steady-state temperature
+        :param dead_time:        the number of seconds before a change in duty cycle has any effect
+        :param ambient:          the temperature of the surroundings, in Celsius
+        :param initial:          the starting temperature of the block, which is ambient if not given
+
+        """
+        assert time_constant > 0.0
+        assert dead_time >= 0.0
+        self._clock = clock
+        self._gain = gain
+        self._time_constant = time_constant
+        self._dead_time = dead_time
+        self._ambient = ambient
+        self._temperature = ambient if initial is None else float(initial)
+        self._time = clock.monotonic()
+        # every change of duty cycle, as (time, fraction from 0 to 1). The first entry covers the time before any input
+        self._change_times = [float('-inf')]
+        self._change_duties = [0.0]
+
+    @property
+    def temperature(self):
+        """
+        The temperature of the block right now, in Celsius.
+
+        :rtype:     float
+
+        """
+        self._advance(self._clock.monotonic())
+        return self._temperature
+
+    @property
+    def duty_log(self):
+        """
+        Every change of duty cycle, as (time, percentage) pairs.
+
+        :rtype:     list of (float, float)
+
+        """
+        return [(t, duty * 100.0) for t, duty in zip(self._change_times[1:], self._change_duties[1:])]
+
+    def set_duty(self, duty_cycle):
+        """
+        Change how much power is going into the block.
+
+        :param duty_cycle:    the percentage of time the heater is active, from 0 to 100
+        :type duty_cycle:     float
+
+        """
+        assert 0 <= duty_cycle <= 100
+        now = self._clock.monotonic()
+        self._advance(now)
+        self._change_times.append(now)
+        self._change_duties.append(duty_cycle / 100.0)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self.set_duty(0)
+
+    def _advance(self, until):
+        """
+        Brings the temperature up to date, one stretch of constant input at a time.
+
+        """
+        while self._time < until:
+            # the input that is acting on the block right now was applied dead_time seconds ago
+            i = bisect.bisect_right(self._change_times, self._time - self._dead_time) - 1
+            if i + 1 < len(self._change_times):
+                segment_end = min(until, self._change_times[i + 1] + self._dead_time)
+            else:
+                segment_end = until
+            steady_state = self._ambient + self._gain * self._change_duties[i]
+            decay = math.exp(-(segment_end - self._time) / self._time_constant)
+            self._temperature = steady_state + (self._temperature - steady_state) * decay
+            self._time = segment_end
+
+
+class PlantSensor(object):
+    """
+    A stand-in for the MAX31855 that reads the temperature of a ThermalPlant, with optional Gaussian noise.
+
+    """
+    def __init__(self, plant, noise=0.0, seed=None):
+        """
+
+        :param plant:    the ThermalPlant to measure
+        :param noise:    the standard deviation of the noise added to each reading, in Celsius
+        :param seed:     seeds the noise so that simulations are repeatable
+
+        """
+        self._plant = plant
+        self._noise = noise
+        self._random = random.Random(seed)
+
+    def readTempC(self):
+        temperature = self._plant.temperature
+        if self._noise:
+            temperature += self._random.gauss(0.0, self._noise)
+        return temperature
@@ -1,3 +1,13 @@
+from array import array
+import bisect
+import collections
+from interface import programs
+
+
+# index is the number of the step at the top level of the program, which for a setting inside a repeat is the repeat's
+Step = collections.namedtuple("Step", ["start", "stop", "setting", "target_temperature", "index"])
+
+
 class TemperatureSetting(object):
     """
     The instructions for a single step in a program. Something like "Set to 37C for 30 seconds"
@@ -10,6 +20,24 @@ class TemperatureSetting(object):
         self._final_temp = float(final_temp)
         self.duration = duration
 
+    @property
+    def slope(self):
+        """
+        The change in target temperature per second.
+
+        """
+        if self.duration is None:
+            return 0.0
+        return (self._final_temp - self._start_temp) / self.duration
+
+    @property
+    def intercept(self):
+        """
+        The target temperature at the start of the setting.
+
+        """
+        return self._start_temp
+
     def get_temperature(self, seconds_into_setting):
         """
         Figure out what temperature we're supposed to have at a given time. Linear gradients will change with each
@@ -25,25 +53,193 @@ class TemperatureSetting(object):
         return self._start_temp + offset
 
 
+class Repeat(object):
+    """
+    A block of settings that runs several times over. The block's schedule has times relative to the start of a
+    repetition, so a block that repeats ten thousand times takes no more memory than one that runs once.
+
+    """
+    def __init__(self, index, count, period, schedule):
+        """
+
+        :param index:       the number of the step
+        :param count:       the number of repetitions
+        :param period:      the number of seconds that one repetition takes
+        :param schedule:    the settings of one repetition
+        :type schedule:     CompiledSchedule
+
+        """
+        assert count >= 1 and period > 0.0
+        self.index = index
+        self.count = count
+        self.period = period
+        self.schedule = schedule
+        self.duration = count * period
+
+
+class CompiledSchedule(object):
+    """
+    An immutable, array-backed version of a program's settings, built once when the program is loaded so that the
+    control loop can find the current setting with a binary search instead of sorting and scanning every setting.
+
+    """
+    def __init__(self, settings):
+        """
+
+        :param settings:    TemperatureSetting and Repeat objects keyed by (start, stop) in seconds, as built by
+                            TemperatureProgram
+        :type settings:     dict
+
+        """
+        ordered = sorted(settings.items(), key=lambda item: item[0][0])
+        # a Hold setting has no stop time, so we give it one that every elapsed time is less than
+        self._starts = array('d', [float(start) for (start, stop), setting in ordered])
+        self._stops = array('d', [float('inf') if stop is None else float(stop) for (start, stop), setting in ordered])
+        # a Repeat has no target temperature of its own, only those of its settings
+        self._slopes = array('d', [0.0 if isinstance(setting, Repeat) else setting.slope for key, setting in ordered])
+        self._intercepts = array('d', [float('nan') if isinstance(setting, Repeat) else setting.intercept
+                                       for key, setting in ordered])
+        self._settings = tuple(setting for key, setting in ordered)
+        self._repeats = tuple(i for i, setting in enumerate(self._settings) if isinstance(setting, Repeat))
+        self._has_hold = bool(ordered) and ordered[-1][0][1] is None
+
+    def __len__(self):
+        return len(self._settings)
+
+    def __iter__(self):
+        """
+        Yields program settings in order along with their start and stop times (in seconds from the start of the program).
+        A Repeat is yielded once, not once per repetition.
+
+        """
+        for start, stop, setting in zip(self._starts, self._stops, self._settings):
+            yield start, None if stop == float('inf') else stop, setting
+
+    def lookup(self, seconds_elapsed):
+        """
+        Finds the setting that should be used at a given number of seconds into the program, and the target
+        temperature at that moment.
+
+        :param seconds_elapsed:    seconds since the start of the program
+        :type seconds_elapsed:     float
+
+        :return:    the current step, or None if the program is over
+        :rtype:     Step
+
+        """
+        i = bisect.bisect_right(self._starts, seconds_elapsed) - 1
+        if i < 0 or seconds_elapsed >= self._stops[i]:
+            if not self._has_hold:
+                return None
+            # a Hold setting applies whenever no other setting does
+            i = len(self._settings) - 1
+        start = self._starts[i]
+        setting = self._settings[i]
+        if isinstance(setting, Repeat):
+            # work out how far into the current repetition we are, rather than expanding the repeat into every setting
+            # of every repetition
+            repetition, offset = divmod(seconds_elapsed - start, setting.period)
+            step = setting.schedule.lookup(offset)
+            repetition_start = start + repetition * setting.period
+            return Step(repetition_start + step.start, repetition_start + step.stop, step.setting,
+                        step.target_temperature, setting.index)
+        stop = self._stops[i]
+        target_temperature = self._intercepts[i] + self._slopes[i] * (seconds_elapsed - start)
+        return Step(start, None if stop == float('inf') else stop, setting, target_temperature, setting.index)
+
+    def evaluate(self, times):
+        """
+        Finds the target temperature at many times at once, with the same rules as lookup(). numpy is only imported
+        when this is used, since it's slow to import on a Pi and the control loop doesn't need it.
+
+        :param times:    seconds since the start of the program
+        :type times:     numpy.ndarray
+
+        :return:    the target temperature at each time, or NaN where the program is over
+        :rtype:     numpy.ndarray
+
+        """
+        import numpy as np
+        times = np.asarray(times, dtype=np.float64)
+        targets = np.empty(times.shape)
+        targets.fill(np.nan)
+        if not self._settings:
+            return targets
+        starts = np.frombuffer(self._starts)
+        stops = np.frombuffer(self._stops)
+        i = np.searchsorted(starts, times, side='right') - 1
+        clipped = np.clip(i, 0, len(starts) - 1)
+        active = (i >= 0) & (times < stops[clipped])
+        if self._has_hold:
+            # a Hold setting applies whenever no other setting does
+            clipped = np.where(active, clipped, len(starts) - 1)
+            active = np.ones(times.shape, dtype=bool)
+        slopes = np.frombuffer(self._slopes)
+        intercepts = np.frombuffer(self._intercepts)
+        targets[active] = (intercepts[clipped] + slopes[clipped] * (times - starts[clipped]))[active]
+        for i in self._repeats:
+            repeat = self._settings[i]
+            within = active & (clipped == i)
+            if within.any():
+                targets[within] = repeat.schedule.evaluate(np.mod(times[within] - starts[i], repeat.period))
+        return targets
+
+
 class TemperatureProgram(object):
     """
     Converts user-supplied JSON, representing a set of temperatures, to a list of TemperatureSetting objects.
 
     """
     def __init__(self, steps):
-        self._settings = {}
-        self._has_hold = False
-        self._total_duration = 0.0
-        self._load_program(steps)
+        """
+
+        :param steps:    temperature settings for an experiment, as described in interface.programs
+        :type steps:     dict
+
+        """
+        self._load_compiled(programs.compile_steps(steps))
+
+    @classmethod
+    def from_compiled(cls, compiled):
+        """
+        Builds a program from steps that have already been checked and compiled by interface.programs.compile_steps(),
+        e.g. by the API when the program was saved, so that nothing has to be parsed.
+
+        :type compiled:    dict
+        :rtype:     TemperatureProgram
+        :raises:    interface.programs.ProgramError
+
+        """
+        if compiled.get("version") != programs.VERSION:
+            raise programs.ProgramError("The program was compiled by a different version (%s)" % compiled.get("version"))
+        program = cls.__new__(cls)
+        program._load_compiled(compiled)
+        return program
+
+    def _load_compiled(self, compiled):
+        self._settings = _load_settings(compiled["settings"])
+        self._total_duration = compiled["total_duration"]
+        self._content_hash = compiled["hash"]
+        self._schedule = CompiledSchedule(self._settings)
 
     @property
     def settings(self):
         """
-        An ordered list of TemperatureSetting objects.
+        TemperatureSetting and Repeat objects keyed by their (start, stop) times in seconds.
 
         """
         return self._settings
 
+    @property
+    def schedule(self):
+        """
+        The settings compiled into a structure that can be searched quickly.
+
+        :rtype:     CompiledSchedule
+
+        """
+        return self._schedule
+
     @property
     def total_duration(self):
         """
@@ -52,79 +248,53 @@ class TemperatureProgram(object):
         """
         return self._total_duration
 
-    def _load_program(self, steps):
+    @property
+    def has_hold(self):
         """
-        steps will be a dict like:
-        {
-          "1": {"mode": "set", "temperature": 80.0, "duration": "1:30:00"},
-          "2": {"mode": "linear", "start_temperature": 80.0, "end_temperature": 37.0, "duration": "12:00"},
-          "3": {"mode": "hold", "temperature": 37.0}
-        }
-        Note that indexes are 1-based!
+        Whether the program ends with a Hold setting, and so never ends by itself.
 
-        Modes and attributes supported:
-        set: temperature, duration
-        hold: temperature
-        linear: temperature, duration
-
-        :param steps:    temperature settings for an experiment
-        :type steps:     dict
+        :rtype:     bool
 
         """
-        action = {"set": self._set_temperature,
-                  "linear": self._linear,
-                  "hold": self._hold
-                  }
-        # Go through the list of steps, ordered by the integer value of the index
-        # (which is a string in the original JSON)
-        for index, parameters in sorted(steps.items(), key=lambda x: int(x[0])):
-            # Get the mode and remove it from the parameters
-            mode = parameters.pop("mode")
-            # Run the desired action using the parameters given
-            # Parameters of methods must match the keys exactly!
-            if not self._has_hold:
-                action[mode](int(index), **parameters)
+        return any(stop is None for start, stop in self._settings)
 
-    def _hhmmss_to_seconds(self, text):
+    def target_temperatures(self, times):
         """
-        Converts human-readable times to seconds.
+        The target temperature at each of many times, in one vectorized call. See CompiledSchedule.evaluate().
 
-        """
-        if type(text) == int:
-            return text
-        seconds = 0
-        multiplier = 1
-        for val in text.split(':')[::-1]:
-            seconds += int(val) * multiplier
-            multiplier *= 60
-        return seconds
+        :param times:    seconds since the start of the program
+        :type times:     numpy.ndarray
 
-    def _set_temperature(self, index, temperature=25.0, duration=60):
-        """
-        Keep the temperature constant.
+        :rtype:     numpy.ndarray
 
         """
-        temperature = float(temperature)
-        duration = self._hhmmss_to_seconds(duration)
-        setting = TemperatureSetting(index, temperature, temperature, duration)
-        self._settings[(self._total_duration, self._total_duration + duration)] = setting
-        self._total_duration += duration
+        return self._schedule.evaluate(times)
 
-    def _linear(self, index, start_temperature=60.0, end_temperature=37.0, duration=3600):
+    @property
+    def content_hash(self):
         """
-        Change the temperature evenly over a period of time.
+        A hash that is the same for any two programs that behave the same way.
 
-        """
-        duration = self._hhmmss_to_seconds(duration)
-        setting = TemperatureSetting(index, float(start_temperature), float(end_temperature), duration)
-        self._settings[(self._total_duration, self._total_duration + duration)] = setting
-        self._total_duration += duration
+        :rtype:     str
 
-    def _hold(self, index, temperature=25.0):
         """
-        Keep the temperature constant indefinitely and do not allow any more settings to be added to the program.
+        return self._content_hash
 
-        """
-        setting = TemperatureSetting(index, float(temperature), float(temperature), None)
-        self._settings[(self._total_duration, None)] = setting
-        self._has_hold = True
+
+def _load_settings(compiled_settings):
+    """
+    Builds the settings of a program, or of one repetition of a repeat, from their compiled form.
+
+    :rtype:     dict
+
+    """
+    settings = {}
+    for entry in compiled_settings:
+        if isinstance(entry, dict):
+            schedule = CompiledSchedule(_load_settings(entry["settings"]))
+            settings[(entry["start"], entry["stop"])] = Repeat(entry["index"], entry["count"], entry["period"], schedule)
+        else:
+            index, start, stop, start_temperature, end_temperature = entry
+            duration = None if stop is None else stop - start
+            settings[(start, stop)] = TemperatureSetting(index, start_temperature, end_temperature, duration)
+    return settings
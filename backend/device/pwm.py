@@ -0,0 +1,155 @@
+from clock import monotonic
+import logging
+import threading
+
+log = logging.getLogger("heater." + __name__)
+
+
+class PWMEngine(threading.Thread):
+    """
+    Switches the PWM pin in a background thread so that the control loop never has to block while the heater is on.
+    The duty cycle can be changed at any moment with set_duty(). In pwm mode the change takes effect immediately, even in
+    the middle of a period; in sigma_delta mode it takes effect at the start of the next (short) period.
+
+    Two modes are supported:
+    pwm: one on/off pulse per period, with the on time proportional to the duty cycle
+    sigma_delta: each period is entirely on or entirely off, and the error is carried forward so that the fraction of
+                 "on" periods converges on the duty cycle. This is useful at high carrier frequencies, where the sleep
+                 resolution of the Pi would otherwise limit how finely the on time can be set.
+
+    """
+    PWM = 'pwm'
+    SIGMA_DELTA = 'sigma_delta'
+
+    def __init__(self, gpio, pin, frequency=1.0, mode=PWM, watchdog=None):
+        """
+
+        :param gpio:         the GPIO module (or a mock of it)
+        :param pin:          the pin number that switches current through the heating element
+        :param frequency:    the carrier frequency, in Hertz
+        :param mode:         either PWMEngine.PWM or PWMEngine.SIGMA_DELTA
+        :param watchdog:     if the duty cycle isn't set for this many seconds, e.g. because the control loop has hung,
+                             the heater is turned off until it is. None leaves it on whatever it was last set to
+
+        """
+        super(PWMEngine, self).__init__(name="pwm")
+        assert frequency > 0.0
+        assert mode in (PWMEngine.PWM, PWMEngine.SIGMA_DELTA)
+        self.daemon = True
+        self._gpio = gpio
+        self._pin = pin
+        self._period = 1.0 / frequency
+        self._mode = mode
+        self._duty = 0.0
+        self._error = 0.0
+        self.watchdog = watchdog
+        self._last_set = monotonic()
+        self._stopping = False
+        self._changed = threading.Event()
+
+    @property
+    def duty(self):
+        """
+        The current duty cycle as a percentage, from 0 to 100.
+
+        :rtype:     float
+
+        """
+        return self._duty * 100.0
+
+    def set_duty(self, duty_cycle):
+        """
+        Change the duty cycle. Assigning a float is atomic, so no lock is needed; we just wake the thread up so it can
+        act on the new value right away.
+
+        :param duty_cycle:    the percentage of time the heater should be active, from 0 to 100
+        :type duty_cycle:     float
+
+        """
+        assert 0 <= duty_cycle <= 100
+        self._duty = duty_cycle / 100.0
+        self._last_set = monotonic()
+        if not duty_cycle:
+            # don't leave turning the heater off to the thread, which could be stuck partway through a pulse
+            self._gpio.output(self._pin, self._gpio.LOW)
+        self._changed.set()
+
+    def stop(self, timeout=1.0):
+        """
+        Stops switching and leaves the pin low.
+
+        """
+        self._stopping = True
+        self._changed.set()
+        if self.is_alive():
+            self.join(timeout)
+        self._gpio.output(self._pin, self._gpio.LOW)
+
+    def run(self):
+        try:
+            while not self._stopping:
+                self._check_watchdog()
+                if self._mode == PWMEngine.SIGMA_DELTA:
+                    self._run_sigma_delta_period()
+                else:
+                    self._run_pwm_period()
+        except Exception:
+            log.exception("PWM thread crashed!")
+        finally:
+            self._gpio.output(self._pin, self._gpio.LOW)
+
+    def _check_watchdog(self):
+        """
+        Turns the heater off if the duty cycle hasn't been set for too long. It's checked once a period, so the heater
+        may stay on for up to one more period.
+
+        """
+        if self.watchdog is not None and self._duty and monotonic() - self._last_set > self.watchdog:
+            log.error("The duty cycle hasn't been set for %s seconds, so the heater is being turned off" %
+                      self.watchdog)
+            self._duty = 0.0
+            self._gpio.output(self._pin, self._gpio.LOW)
+
+    def _run_pwm_period(self):
+        """
+        Runs a single pulse. If the duty cycle changes partway through, the pulse is lengthened or cut short to match
+        the new value.
+
+        """
+        start = monotonic()
+        end = start + self._period
+        high = None
+        while not self._stopping:
+            now = monotonic()
+            if now >= end:
+                break
+            # clear before reading the duty cycle, so that an update made after the read will still wake us up
+            self._changed.clear()
+            on_until = start + self._duty * self._period
+            should_be_high = now < on_until
+            if should_be_high != high:
+                self._gpio.output(self._pin, self._gpio.HIGH if should_be_high else self._gpio.LOW)
+                high = should_be_high
+            if self._changed.wait((on_until if high else end) - now):
+                # set_duty() may have switched the pin itself, so it's set again rather than assumed
+                high = None
+
+    def _run_sigma_delta_period(self):
+        """
+        Runs a single period that is either completely on or completely off, diffusing the rounding error into the
+        following periods.
+
+        """
+        self._error += self._duty
+        if self._error >= 1.0:
+            self._error -= 1.0
+            self._gpio.output(self._pin, self._gpio.HIGH)
+        else:
+            self._gpio.output(self._pin, self._gpio.LOW)
+        end = monotonic() + self._period
+        while not self._stopping:
+            remaining = end - monotonic()
+            if remaining <= 0:
+                break
+            self._changed.clear()
+            self._changed.wait(remaining)
@@ -1,13 +1,27 @@
 from abc import abstractmethod
+import checkpoint
+import clock
+import commands
 import cycle
-from datetime import datetime
+from interface import Command, catalog, programs, pyramid, telemetry
 import logging
+import logwriter
+import metrics
+import os
 import pid
 import program
-import time
+import scheduler
+import thermometer
+import threading
 
 
 log = logging.getLogger("heater." + __name__)
+# Commands arrive over pub/sub, but we still check the "active" key this often (in seconds) as a safety net in case a
+# stop message is ever lost
+CONTROL_CHECK_INTERVAL = 10.0
+# While a run is going, a thermometer that stops working only turns the heater off, in case it's a glitch or a loose
+# connection. The run is abandoned if it hasn't come back after this many seconds
+SENSOR_TIMEOUT = float(os.environ.get("PIWARMER_SENSOR_TIMEOUT", 60.0))
 
 
 class BaseRunner(object):
@@ -21,6 +35,10 @@ class BaseRunner(object):
         self._api_interface = api_interface
         self._thermometer = thermometer
         self._heater = heater
+        self._clock = clock.SystemClock()
+        self._commands = commands.CommandListener(api_interface, on_stop=self._cut_heater)
+        # whether the thermometer was unavailable the last time the temperature was published between runs
+        self._sensor_unavailable = False
 
     def run(self):
         """
@@ -28,6 +46,7 @@ class BaseRunner(object):
         then it resets all values and starts all over again.
 
         """
+        self._commands.start()
         while True:
             self._boot()
             self._listen()
@@ -38,12 +57,16 @@ class BaseRunner(object):
         log.debug("Exiting program runner.")
         if exc_type:
             log.exception("Abnormal termination!")
-        self._shutdown()
+        # after a crash, the run is left to be resumed when we're restarted, but not when we were interrupted or told
+        # to exit, e.g. by Ctrl-C or supervisord stopping us
+        self._shutdown(resumable=_crashed(exc_type))
 
-    def _shutdown(self):
+    def _shutdown(self, resumable=False):
         """
         Physically turns off the heater and clears the program from memory.
 
+        :param resumable:    whether to leave the program in place, so that the run can be resumed after a restart
+
         """
         log.debug("Shutting down heater...")
         try:
@@ -52,6 +75,8 @@ class BaseRunner(object):
             log.exception("DANGER! HEATER DID NOT SHUT DOWN")
         else:
             log.debug("Heater shutdown successful.")
+        if resumable:
+            return
         log.debug("Clearing API data.")
         try:
             self._api_interface.clear()
@@ -60,6 +85,14 @@ class BaseRunner(object):
         else:
             log.debug("API data cleared.")
 
+    def _cut_heater(self):
+        """
+        Turns the heater off as soon as a stop command arrives, without waiting for the control loop to notice.
+
+        """
+        log.info("Stop command received, cutting the heater.")
+        self._heater.disable()
+
     def __enter__(self):
         return self
 
@@ -74,22 +107,54 @@ class BaseRunner(object):
 
     def _listen(self):
         """
-        Wait until the "active" key is on in Redis before starting a program.
+        Wait until we're told to start a program.
 
         """
+        # anything that arrived while we weren't listening is stale
+        self._commands.drain()
+        # but we may have been activated after booting and before the listener subscribed to the command channel
+        if self._api_interface.active:
+            log.info("The system has been activated")
+            return
+        checked = self._clock.monotonic()
         while True:
-            if self._api_interface.active:
-                log.info("The system has been activated")
-                break
-            else:
-                try:
-                    # update the current temperature in Redis so that we can see how hot the heater is, even if we're not running a program
-                    self._api_interface.current_temp = self._thermometer.current_temperature
-                except:
-                    # absolutely do not allow this loop to terminate. Though if it did, supervisord would restart the process, but that's annoying and
-                    # results in some downtime
-                    log.exception("Something went wrong in the _listen() loop!")
-                time.sleep(1)
+            if self._clock.wait_for(self._commands.wait, 1.0):
+                if Command.START in [command['command'] for command in self._commands.drain()]:
+                    log.info("The system has been activated")
+                    break
+            try:
+                # a start command can be missed, e.g. while the listener is resubscribing, so we check the
+                # controls every so often as well
+                if self._clock.monotonic() - checked >= CONTROL_CHECK_INTERVAL:
+                    checked = self._clock.monotonic()
+                    if self._api_interface.active:
+                        log.info("The system has been activated")
+                        break
+                self.publish_temperature()
+            except:
+                # absolutely do not allow this loop to terminate. Though if it did, supervisord would restart the process, but that's annoying and
+                # results in some downtime
+                log.exception("Something went wrong in the _listen() loop!")
+
+    def publish_temperature(self):
+        """
+        Updates the current temperature in Redis so that we can see how hot the heater is, even if we're not running a
+        program. This happens every second, so a thermometer that isn't working is only logged when it stops and when
+        it starts again, and the temperature is published as missing in the meantime.
+
+        """
+        try:
+            temperature = self._thermometer.current_temperature
+        except thermometer.SensorUnavailable as e:
+            if not self._sensor_unavailable:
+                log.error("The thermometer isn't working: %s" % e)
+                self._sensor_unavailable = True
+            temperature = None
+        else:
+            if self._sensor_unavailable:
+                log.info("The thermometer is working again")
+                self._sensor_unavailable = False
+        self._api_interface.current_temp = temperature
 
     @abstractmethod
     def _prerun(self):
@@ -113,44 +178,446 @@ class ProgramRunner(BaseRunner):
     Runs a pre-defined program, and ensures that shutdown.
 
     """
-    def __init__(self, current_state, thermometer, heater, log_dir='/var/log/piwarmer'):
+    def __init__(self, current_state, thermometer, heater, log_dir='/var/log/piwarmer', clock=clock.SystemClock(),
+                 build_pyramids=True, run_catalog=None, channel=None, run_metrics=None, checkpoint_dir=None,
+                 resume_grace_period=checkpoint.GRACE_PERIOD):
         super(ProgramRunner, self).__init__(current_state, thermometer, heater)
+        # the name of the channel of a multi-channel controller, which is included in the names of its logs
+        self.channel = channel
         self._accumulated_error = None
+        self._build_pyramids = build_pyramids
+        # the checkpoints of the current run, which are kept with the logs unless told otherwise
+        checkpoint_name = "checkpoint.json" if channel is None else "checkpoint-%s.json" % channel
+        self._checkpoint = checkpoint.CheckpointFile(os.path.join(checkpoint_dir or log_dir, checkpoint_name))
+        self._resume_grace_period = resume_grace_period
+        # the checkpoint of the run we're resuming, between booting and starting it again
+        self._resuming = None
+        # how many times in a row the current run has been resumed
+        self._resumes = 0
+        self._ticks = 0
+        self._run_catalog = run_catalog
+        self._run_id = None
+        self._run_summary = None
+        self._clock = clock
+        self._driver = None
         self._log_dir = log_dir.rstrip("/")
+        # timings of each phase of the tick, and counts of things going wrong
+        self._metrics = run_metrics or metrics.Metrics()
+        self._metrics_published = None
         self._pid = None
+        self._period = None
         self._program = None
+        self._scheduler = None
+        # when the thermometer stopped working during the run, or None if it's working
+        self._sensor_lost = None
+        self._skip_time = 0
         self._start_time = None
         self._temperature_log = None
 
+    @property
+    def accumulated_error(self):
+        """
+        The accumulated error of the PID, or None if no program has been started.
+
+        """
+        return self._accumulated_error
+
+    @property
+    def driver(self):
+        """
+        The PID values of the current run, which can change partway through it.
+
+        :rtype:     pid.Driver
+
+        """
+        return self._driver
+
+    @property
+    def pid(self):
+        """
+        The PID of the current run, or None if no program has been started.
+
+        :rtype:     pid.PID
+
+        """
+        return self._pid
+
+    @property
+    def api_interface(self):
+        """
+        Where the program, the controls and the status of this runner's channel are kept.
+
+        """
+        return self._api_interface
+
+    @property
+    def thermometer(self):
+        """
+        The thermometer of this runner's channel.
+
+        """
+        return self._thermometer
+
+    @property
+    def metrics(self):
+        """
+        Timings of each phase of the tick, and counts of things going wrong. A MultiChannelRunner shares one between
+        all of its channels.
+
+        :rtype:     metrics.Metrics
+
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, run_metrics):
+        self._metrics = run_metrics
+
+    def start_listening(self):
+        """
+        Starts listening for commands in the background, which is done once, before the first run.
+
+        """
+        self._commands.start()
+
+    def drain_commands(self):
+        """
+        Takes every command that has arrived and hasn't been handled yet, in the order they arrived.
+
+        :rtype:     list of dict
+
+        """
+        return self._commands.drain()
+
+    def boot(self):
+        """
+        Resumes the run that was interrupted, if there is one, and otherwise clears whatever was left of the last one.
+        This is done before waiting for a program to start.
+
+        """
+        self._boot()
+
+    def start(self):
+        """
+        Gets ready to run the program that's been activated, or to carry on with the run that was interrupted: sets up
+        the PID, the temperature log and the heater. The program is then run a tick at a time with step(), or by
+        begin_step() and finish_step() when something else updates the PID.
+
+        """
+        self._prerun()
+
+    def run_loop(self):
+        """
+        Runs the program that was started with start() until it ends, or we're told to stop it, and then stops.
+
+        """
+        self._run()
+
+    def stop(self, resumable=False):
+        """
+        Turns the heater off and ends the run, or leaves it to be resumed after a restart.
+
+        :param resumable:    whether the run can be resumed
+
+        """
+        self._shutdown(resumable)
+
+    def step(self, dt):
+        """
+        Runs one tick of the program: works out the target, reads the temperature, updates the PID and acts on it.
+        Its phases are timed as part of the tick, so metrics.begin() has to be called first and metrics.end() after.
+
+        :param dt:    the number of seconds since the previous tick
+        :return:      whether the program should carry on
+        :rtype:       bool
+
+        """
+        current_cycle = self.begin_step()
+        if current_cycle is None:
+            return False
+        self._metrics.lap("program")
+
+        # I/O - read the temperature. This is blocking, unless the thermometer is sampled in the background
+        try:
+            current_cycle.current_temperature = self._thermometer.current_temperature
+        except thermometer.SensorUnavailable as e:
+            return self.sensor_unavailable(e)
+        self._metrics.lap("thermometer")
+
+        # make calculations based on I/O having worked
+        current_cycle.duty_cycle, accumulated_error = self._pid.update(current_cycle, dt)
+        self._metrics.lap("pid")
+        self.finish_step(current_cycle, accumulated_error, self._pid.past_errors)
+        return True
+
+    def sensor_unavailable(self, error):
+        """
+        Turns the heater off for a tick in which the thermometer isn't working, and publishes the temperature as
+        missing. The run carries on, in case the thermometer comes back, unless it has been out for SENSOR_TIMEOUT
+        seconds.
+
+        :param error:    what the thermometer raised
+        :type error:     thermometer.SensorUnavailable
+        :return:         whether the program should carry on
+        :rtype:          bool
+
+        """
+        name = "The thermometer" if self.channel is None else "The thermometer of channel %s" % self.channel
+        now = self._clock.monotonic()
+        if self._sensor_lost is None:
+            log.error("%s has stopped working, so the heater is off until it's back: %s" % (name, error))
+            self._sensor_lost = now
+        elif now - self._sensor_lost >= SENSOR_TIMEOUT:
+            log.error("%s hasn't worked for %s seconds! Shutting down..." % (name, now - self._sensor_lost))
+            return False
+        self._heater.set_duty(0)
+        self._api_interface.current_temp = None
+        return True
+
     def _prerun(self):
         """
         Set up the PID for temperature control.
 
         """
-        driver = self._api_interface.driver
-        driver = pid.Driver(driver['name'], driver['kp'], driver['ki'], driver['kd'],
-                            driver['max_accumulated_error'], driver['min_accumulated_error'])
-        self._pid = pid.PID(driver)
-        self._accumulated_error = 0.0
-        self._start_time = datetime.utcnow()
-        log.info("Program start time: %s" % self._start_time)
-        self._temperature_log = self._get_temperature_log()
-        self._program = program.TemperatureProgram(self._api_interface.program)
-        self._heater.enable()
+        resuming, self._resuming = self._resuming, None
+        self._sensor_lost = None
+        self._driver = self._make_driver(self._api_interface.driver)
+        self._pid = pid.PID(self._driver)
+        self._period = self._driver.period
+        # waiting for the next tick is cut short whenever a command arrives
+        self._scheduler = scheduler.DeadlineScheduler(self._period, clock=self._clock.monotonic, sleep=self._sleep)
+        self._ticks = 0
+        self._program = self._load_program()
+        self._run_summary = catalog.RunSummary()
+        if resuming is None:
+            self._resumes = 0
+            self._accumulated_error = 0.0
+            self._skip_time = 0
+            self._start_time = self._clock.now()
+            log.info("Program start time: %s" % self._start_time)
+            self._temperature_log = self._get_temperature_log()
+            self._run_id = self._catalog_run()
+        else:
+            # carry on as if we'd never stopped, without the windup of a PID starting from nothing
+            self._accumulated_error = resuming.accumulated_error
+            self._pid.restore(resuming.past_errors)
+            self._skip_time = resuming.skip_time
+            self._start_time = resuming.start_time
+            log.info("Resuming the program that started at %s" % self._start_time)
+            self._temperature_log = self._resume_temperature_log(resuming.log_path)
+            self._run_id = resuming.run_id
+            self._resumes = resuming.resumes
+        self._wait_for_thermometer()
+        self._heater.enable(self._period)
+
+    def _wait_for_thermometer(self):
+        """
+        Waits for a thermometer that's sampled in the background to have a reading, since a run can start, or be
+        resumed, right after the process has started, before the thermometer has been read.
+
+        """
+        if hasattr(self._thermometer, "wait_for_reading") and not self._thermometer.wait_for_reading(SENSOR_TIMEOUT):
+            log.warning("The thermometer still hasn't given a believable reading, so the heater stays off until it "
+                        "does")
+
+    def _load_program(self):
+        """
+        Uses the program as the API compiled it when it was saved, or parses the steps if it wasn't compiled, or was
+        compiled by a different version.
+
+        :rtype:     program.TemperatureProgram
+
+        """
+        compiled = self._api_interface.compiled_program
+        if compiled is not None:
+            try:
+                return program.TemperatureProgram.from_compiled(compiled)
+            except programs.ProgramError:
+                log.warning("Could not use the compiled program, so the steps will be parsed instead", exc_info=True)
+        return program.TemperatureProgram(self._api_interface.program)
+
+    def _sleep(self, seconds):
+        """
+        Waits until it's time for the next tick, but wakes up early if a command arrives.
+
+        :return:    whether a command arrived
+        :rtype:     bool
+
+        """
+        return self._clock.wait_for(self._commands.wait, seconds)
+
+    def _make_driver(self, driver):
+        """
+        Converts PID values from the API into a Driver.
+
+        :type driver:    dict
+        :rtype:     pid.Driver
+
+        """
+        return pid.Driver(driver['name'], driver['kp'], driver['ki'], driver['kd'],
+                          driver['max_accumulated_error'], driver['min_accumulated_error'],
+                          float(driver.get('period') or 1.0))
 
     def _get_temperature_log(self):
         """
-        Creates a machine-readable log of the temperature, the target temperature, and the duty cycle at 1-second intervals.
+        Creates a machine-readable log of the temperature, the target temperature, the duty cycle, the step and the
+        accumulated error at every tick, in the binary format described in interface.telemetry.
+
+        """
+        name = self._start_time.strftime("%Y-%m-%d-%H-%M-%S")
+        if self.channel is not None:
+            # channels can start at the same moment, so their logs need different names
+            name = "%s-%s" % (self.channel, name)
+        path = '%s/temperature-%s%s' % (self._log_dir, name, telemetry.EXTENSION)
+        return _write_in_background(telemetry.TelemetryWriter(path, self._start_time))
 
+    def _resume_temperature_log(self, path):
         """
-        # Set up another logger for temperature logs
-        temperature_log = logging.getLogger("temperatures")
-        handler = logging.FileHandler('%s/temperature-%s.log' % (self._log_dir, self._start_time.strftime("%Y-%m-%d-%H-%M-%S")))
-        formatter = logging.Formatter('%(asctime)s\t%(message)s')
-        handler.setFormatter(formatter)
-        temperature_log.addHandler(handler)
-        temperature_log.setLevel(logging.INFO)
-        return temperature_log
+        Carries on with the temperature log of the run we're resuming, or starts a new one if that isn't possible.
+
+        """
+        if path and os.path.exists(path):
+            try:
+                return _write_in_background(telemetry.TelemetryWriter(path, self._start_time, append=True))
+            except (IOError, telemetry.TelemetryError):
+                log.exception("Could not add to the temperature log of the run, so a new one will be started")
+        return self._get_temperature_log()
+
+    def _boot(self):
+        """
+        Resumes the run that was interrupted, if we were restarted partway through one (see device.checkpoint).
+        Otherwise, everything is cleared as usual.
+
+        """
+        self._resuming = self._resumable_checkpoint()
+        if self._resuming is None:
+            self._checkpoint.remove()
+            super(ProgramRunner, self)._boot()
+
+    def _resumable_checkpoint(self):
+        """
+        Finds the checkpoint of the run we were in the middle of, if the run can still be resumed: it must have been
+        written since the machine booted and within the grace period, the same program must still be active, and the
+        run mustn't have been resumed checkpoint.MAX_RESUMES times in a row already. Resuming it counts as soon as it's
+        found, so that a run that crashes before its first tick still runs out of resumes.
+
+        :rtype:     checkpoint.Checkpoint
+
+        """
+        saved = self._checkpoint.load()
+        if saved is None:
+            return None
+        age = (self._clock.now() - saved.written).total_seconds()
+        if saved.boot_id != checkpoint.boot_id() or not 0.0 <= age <= self._resume_grace_period:
+            log.info("Found a checkpoint from %s, but it's too old to resume" % saved.written)
+            return None
+        try:
+            if not self._api_interface.active or self._load_program().content_hash != saved.program_hash:
+                log.info("Found a checkpoint, but its program isn't running any more")
+                return None
+        except:
+            log.exception("Could not tell whether the program in the checkpoint can be resumed!")
+            return None
+        if saved.resumes >= checkpoint.MAX_RESUMES:
+            log.error("The run has already been resumed %d times in a row, so it won't be resumed again"
+                      % saved.resumes)
+            return None
+        saved = saved._replace(resumes=saved.resumes + 1)
+        try:
+            self._checkpoint.save(saved)
+        except:
+            log.exception("Failed to count the resume in the checkpoint!")
+        log.info("Resuming the run from the checkpoint written at %s" % saved.written)
+        return saved
+
+    def _save_checkpoint(self, past_errors):
+        """
+        Saves a checkpoint every checkpoint.INTERVAL ticks, starting with the first. A problem saving one shouldn't
+        stop the run, so it's only logged. Once a resumed run has got through checkpoint.INTERVAL ticks, it's no
+        longer counted as resumed.
+
+        :param past_errors:    the PID's recent errors, oldest first
+
+        """
+        self._ticks += 1
+        if (self._ticks - 1) % checkpoint.INTERVAL:
+            return
+        if self._ticks > checkpoint.INTERVAL:
+            self._resumes = 0
+        try:
+            self._checkpoint.save(checkpoint.Checkpoint(written=self._clock.now(),
+                                                        boot_id=checkpoint.boot_id(),
+                                                        program_hash=self._program.content_hash,
+                                                        start_time=self._start_time,
+                                                        skip_time=self._skip_time,
+                                                        accumulated_error=self._accumulated_error,
+                                                        past_errors=list(past_errors),
+                                                        log_path=self._temperature_log.path,
+                                                        run_id=self._run_id,
+                                                        resumes=self._resumes))
+        except:
+            log.exception("Failed to save a checkpoint!")
+
+    def _catalog_run(self):
+        """
+        Adds the run to the run catalog, if there is one. A problem with the catalog shouldn't stop the run, so it's
+        only logged.
+
+        :return:    the ID of the run in the catalog, or None
+        :rtype:     int
+
+        """
+        if self._run_catalog is None:
+            return None
+        driver = self._api_interface.driver or {}
+        try:
+            return self._run_catalog.start_run(self._temperature_log.path, self._start_time,
+                                               self._api_interface.program_id, driver.get('id'))
+        except:
+            log.exception("Failed to add the run to the catalog!")
+            return None
+
+    def _shutdown(self, resumable=False):
+        """
+        Physically turns off the heater, clears the program from memory and closes the temperature log. The pyramid of
+        the log is built in the background, so that it can't delay the next run, but only once every record has been
+        written, since a pyramid is never rebuilt.
+
+        :param resumable:    whether to leave the program and the checkpoint in place, so that the run can be resumed
+                             after a restart. The run isn't over, so it isn't finished in the catalog either
+
+        """
+        super(ProgramRunner, self)._shutdown(resumable)
+        if resumable:
+            if self._temperature_log is not None:
+                try:
+                    self._temperature_log.close()
+                except:
+                    log.exception("Failed to close the temperature log!")
+                self._temperature_log = None
+            return
+        self._checkpoint.remove()
+        if self._run_id is not None:
+            try:
+                self._run_catalog.finish_run(self._run_id, self._clock.now(), self._run_summary)
+            except:
+                log.exception("Failed to record the end of the run in the catalog!")
+            self._run_id = None
+        if self._temperature_log is not None:
+            try:
+                closed = self._temperature_log.close()
+            except:
+                log.exception("Failed to close the temperature log!")
+            else:
+                if self._build_pyramids and not closed:
+                    log.warning("The pyramid of %s won't be built, since the log is still being written"
+                                % self._temperature_log.path)
+                elif self._build_pyramids:
+                    builder = threading.Thread(target=_build_pyramid, args=(self._temperature_log.path,),
+                                               name="pyramid-builder")
+                    builder.daemon = True
+                    builder.start()
+            self._temperature_log = None
 
     def _run(self):
         """
@@ -161,39 +628,403 @@ class ProgramRunner(BaseRunner):
         assert self._start_time is not None
         assert self._thermometer is not None
         assert self._accumulated_error is not None
+        assert self._scheduler is not None
 
-        while self._api_interface.active:
-            # make some safe assignments that should never fail
-            current_cycle = cycle.CurrentCycle()
-            current_cycle.accumulated_error = self._accumulated_error
-            current_cycle.current_time = datetime.utcnow()
-            current_cycle.start_time = self._start_time
-            current_cycle.program = self._program
-            current_cycle.skip_time = self._api_interface.skip_time
-
-            if current_cycle.current_step is None:
-                # the program is over and we're not using a Hold setting
-                log.info("There are no more steps to run in the current program. Shutting down...")
+        # the first tick has nothing to measure against, so we assume it took exactly one period
+        dt = self._period
+        # check the controls on the first tick, since the start command only tells us that we've started
+        since_control_check = CONTROL_CHECK_INTERVAL
+        self._scheduler.start()
+        while True:
+            self._metrics.begin()
+            if since_control_check >= CONTROL_CHECK_INTERVAL:
+                since_control_check = 0.0
+                if not self.check_controls():
+                    break
+                self._metrics.lap("controls")
+            if not self.step(dt):
                 break
+            self._metrics.end()
+            self._publish_metrics()
 
-            # I/O - read the temperature. This operation is blocking!
-            current_cycle.current_temperature = self._thermometer.current_temperature
+            # wait until the next deadline, less whatever time the work above took
+            overruns = self._scheduler.overruns
+            dt = self._wait_for_next_tick()
+            self._metrics.count("overruns", self._scheduler.overruns - overruns)
+            if dt is None:
+                break
+            since_control_check += dt
 
-            # make calculations based on I/O having worked
-            current_cycle.duty_cycle, self._accumulated_error = self._pid.update(current_cycle)
+        if self._scheduler.overruns:
+            log.warning("The control loop overran its deadline %d times during this run" % self._scheduler.overruns)
+        self._publish_metrics(force=True)
+        self._shutdown()
 
-            # save the temperature information to a machine-readable log file
-            self._temperature_log.info("%s\t%s\t%s" % (current_cycle.current_temperature,
-                                                       current_cycle.target_temperature,
-                                                       current_cycle.duty_cycle))
-            # physically activate the heater, if necessary
-            self._heater.heat(current_cycle.duty_cycle)
+    def _publish_metrics(self, force=False):
+        """
+        Publishes the metrics every PUBLISH_INTERVAL seconds.
 
-            # update the API data so the frontend can know what's happening
-            self._api_interface.current_temp = current_cycle.current_temperature
-            self._api_interface.target_temp = current_cycle.target_temperature
-            self._api_interface.current_step = current_cycle.current_step
-            self._api_interface.program_time_remaining = current_cycle.seconds_left
-            self._api_interface.step_time_remaining = current_cycle.step_time_remaining
+        :param force:    publish them even if they were published recently
 
-        self._shutdown()
+        """
+        now = self._clock.monotonic()
+        if not force and self._metrics_published is not None \
+                and now - self._metrics_published < metrics.PUBLISH_INTERVAL:
+            return
+        self._metrics_published = now
+        _publish_metrics(self._api_interface, self._metrics, [self._thermometer])
+
+    def check_controls(self):
+        """
+        Reads the controls from the API, in case a command was missed.
+
+        :return:    whether we should still be running the program
+        :rtype:     bool
+
+        """
+        active, self._skip_time = self._api_interface.read_controls()
+        if not active:
+            log.info("The system is no longer active. Shutting down...")
+        return active
+
+    def begin_step(self):
+        """
+        Works out where we are in the program, before the temperature is read.
+
+        :return:    the cycle, or None if the program is over
+        :rtype:     cycle.CurrentCycle
+
+        """
+        # make some safe assignments that should never fail
+        current_cycle = cycle.CurrentCycle()
+        current_cycle.accumulated_error = self._accumulated_error
+        current_cycle.current_time = self._clock.now()
+        current_cycle.start_time = self._start_time
+        current_cycle.program = self._program
+        current_cycle.skip_time = self._skip_time
+        if current_cycle.current_step is None:
+            # the program is over and we're not using a Hold setting
+            log.info("There are no more steps to run in the current program. Shutting down...")
+            return None
+        return current_cycle
+
+    def finish_step(self, current_cycle, accumulated_error, past_errors):
+        """
+        Acts on a cycle once the temperature has been read and the PID has been updated: logs it, sets the heater,
+        publishes the status and saves a checkpoint.
+
+        :type current_cycle:        cycle.CurrentCycle
+        :param accumulated_error:   the PID's new accumulated error
+        :param past_errors:         the PID's recent errors, oldest first
+
+        """
+        if self._sensor_lost is not None:
+            log.info("The thermometer is working again")
+            self._sensor_lost = None
+        self._accumulated_error = accumulated_error
+        # save the temperature information to a machine-readable log file. This only queues the record, so that a slow
+        # SD card can't stretch the tick, and if the queue is full the record is lost
+        if not self._temperature_log.write(current_cycle.current_time,
+                                           current_cycle.current_temperature,
+                                           current_cycle.target_temperature,
+                                           current_cycle.duty_cycle,
+                                           current_cycle.current_step,
+                                           self._accumulated_error):
+            self._metrics.count("telemetry_dropped")
+        self._run_summary.add(current_cycle.current_temperature, current_cycle.target_temperature)
+        self._metrics.lap("log")
+        # physically activate the heater, if necessary. The PWM thread picks up the new duty cycle immediately
+        self._heater.set_duty(current_cycle.duty_cycle)
+        self._metrics.lap("heater")
+
+        # update the API data so the frontend can know what's happening
+        self._api_interface.publish_status(current_temp=current_cycle.current_temperature,
+                                           target_temp=current_cycle.target_temperature,
+                                           current_step=current_cycle.current_step,
+                                           program_time_remaining=current_cycle.seconds_left,
+                                           step_time_remaining=current_cycle.step_time_remaining)
+        self._metrics.lap("publish")
+        self._save_checkpoint(past_errors)
+        self._metrics.lap("checkpoint")
+
+    def _wait_for_next_tick(self):
+        """
+        Waits for the next scheduled tick, acting on any commands that arrive in the meantime.
+
+        :return:    the number of seconds since the previous tick, or None if we've been told to stop
+        :rtype:     float
+
+        """
+        while True:
+            dt = self._scheduler.wait()
+            if dt is not None:
+                return dt
+            if not self.handle_commands():
+                return None
+
+    def handle_commands(self):
+        """
+        Acts on any commands that have arrived.
+
+        :return:    whether we should still be running the program
+        :rtype:     bool
+
+        """
+        for command in self._commands.drain():
+            if command['command'] == Command.STOP:
+                log.info("Received stop command. Shutting down...")
+                return False
+            elif command['command'] == Command.SKIP:
+                self._skip_time = int(command['skip_time'])
+            elif command['command'] == Command.UPDATE_GAINS:
+                # the control period can't change partway through a run, so only the gains are used
+                self._driver = self._make_driver(command['driver'])
+                self._pid.update_gains(self._driver)
+                log.info("Updated PID gains.")
+        return True
+
+
+class MultiChannelRunner(object):
+    """
+    Runs several channels from one process. Each channel is a ProgramRunner with its own program, driver, thermometer
+    and heater, and channels start and stop independently of each other.
+
+    Every running channel is stepped in the same scheduled tick: their targets are worked out, their thermometers are
+    read in one pass, their PIDs are updated together by a BatchPID, and then their heaters, logs and statuses are
+    updated. A channel that isn't running a program just has its temperature published, as a lone ProgramRunner does
+    while it waits.
+
+    """
+    def __init__(self, channels, period=1.0, clock=clock.SystemClock(), api_interface=None):
+        """
+
+        :param channels:         a ProgramRunner for each channel, each with an APIInterface for its own channel
+        :param period:           the number of seconds between ticks, which is the same for every channel
+        :param clock:            the clock used to pace the ticks
+        :param api_interface:    an APIInterface to publish the metrics of the whole controller through, if any
+
+        """
+        assert channels
+        self._channels = list(channels)
+        self._period = float(period)
+        self._clock = clock
+        self._api_interface = api_interface
+        # the channels are stepped together, so the phases of the tick are timed for all of them at once
+        self._metrics = metrics.Metrics()
+        self._metrics_published = None
+        for channel in self._channels:
+            channel.metrics = self._metrics
+        self._running = []
+        self._since_control_check = CONTROL_CHECK_INTERVAL
+        # every channel has a controller in the batch, whether it's running or not. Each is reset when its channel
+        # starts, with the driver it's started with
+        self._indexes = {channel: index for index, channel in enumerate(self._channels)}
+        self._drivers = [pid.Driver(None, 0.0, 0.0, 0.0, 0.0, 0.0) for _ in self._channels]
+        self._pid = pid.BatchPID(self._drivers)
+        self._scheduler = scheduler.DeadlineScheduler(self._period, clock=clock.monotonic, sleep=clock.sleep)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        log.debug("Exiting multi-channel runner.")
+        if exc_type:
+            log.exception("Abnormal termination!")
+        for channel in self._channels:
+            # after a crash, the runs are left to be resumed when we're restarted
+            channel.stop(resumable=_crashed(exc_type))
+
+    def run(self):
+        """
+        Steps every channel once per period, forever.
+
+        """
+        for channel in self._channels:
+            channel.start_listening()
+            channel.boot()
+            # anything that arrived before we were listening is stale
+            channel.drain_commands()
+        # the first tick has nothing to measure against, so we assume it took exactly one period
+        dt = self._period
+        self._scheduler.start()
+        while True:
+            self._tick(dt)
+            overruns = self._scheduler.overruns
+            dt = self._scheduler.wait()
+            self._metrics.count("overruns", self._scheduler.overruns - overruns)
+            self._since_control_check += dt
+
+    def _tick(self, dt):
+        """
+        Starts and stops channels as they've been told to, and steps every channel that's running.
+
+        :param dt:    the number of seconds since the previous tick
+
+        """
+        self._metrics.begin()
+        check_controls = self._since_control_check >= CONTROL_CHECK_INTERVAL
+        if check_controls:
+            self._since_control_check = 0.0
+        started = []
+        for channel in self._channels:
+            if channel in self._running:
+                if not channel.handle_commands() or (check_controls and not channel.check_controls()):
+                    self._stop(channel)
+            elif self._start_requested(channel, check_controls):
+                log.info("Channel %s has been activated" % channel.channel)
+                channel.start()
+                if channel.driver.period != self._period:
+                    log.warning("Channel %s's driver has a period of %s seconds, but every channel is stepped every %s "
+                                "seconds" % (channel.channel, channel.driver.period, self._period))
+                # the start command only tells us that we've started, so the controls are checked right away
+                if channel.check_controls():
+                    self._running.append(channel)
+                    started.append(channel)
+                    self._drivers[self._indexes[channel]] = channel.driver
+                    # a channel that's resuming a run carries on with the state of its PID from the checkpoint
+                    self._pid.reset(self._indexes[channel], channel.driver, channel.accumulated_error,
+                                    channel.pid.past_errors)
+                else:
+                    channel.stop()
+        self._metrics.lap("controls")
+
+        cycles = []
+        for channel in list(self._running):
+            current_cycle = channel.begin_step()
+            if current_cycle is None:
+                self._stop(channel)
+            else:
+                cycles.append((channel, current_cycle))
+        self._metrics.lap("program")
+
+        # read every thermometer in one pass, so that the readings are from as close to the same moment as possible
+        stepped = []
+        for channel, current_cycle in cycles:
+            try:
+                current_cycle.current_temperature = channel.thermometer.current_temperature
+            except thermometer.SensorUnavailable as e:
+                if not channel.sensor_unavailable(e):
+                    self._stop(channel)
+            else:
+                stepped.append((channel, current_cycle))
+        self._metrics.lap("thermometer")
+
+        accumulated_errors = self._update_pids(stepped, started, dt) if stepped else []
+        self._metrics.lap("pid")
+        # each of these times its own phases
+        for (channel, current_cycle), accumulated_error in zip(stepped, accumulated_errors):
+            channel.finish_step(current_cycle, accumulated_error, self._pid.past_errors(self._indexes[channel]))
+
+        for channel in self._channels:
+            if channel not in self._running:
+                try:
+                    # so that we can see how hot each heater is, even if it isn't running a program
+                    channel.publish_temperature()
+                except:
+                    # one channel's problems must never stop the others
+                    log.exception("Could not publish the temperature of channel %s" % channel.channel)
+        self._metrics.lap("idle")
+        self._metrics.end()
+
+        now = self._clock.monotonic()
+        if self._api_interface is not None and (self._metrics_published is None
+                                                or now - self._metrics_published >= metrics.PUBLISH_INTERVAL):
+            self._metrics_published = now
+            _publish_metrics(self._api_interface, self._metrics, [channel.thermometer for channel in self._channels])
+
+    def _update_pids(self, stepped, started, dt):
+        """
+        Updates the PIDs of every channel that's being stepped in one call.
+
+        :param stepped:    each channel and its cycle, with the temperature read
+        :param started:    the channels that have only just started
+        :param dt:         the number of seconds since the previous tick
+
+        :return:    the new accumulated error of each channel
+        :rtype:     list of float
+
+        """
+        indexes = [self._indexes[channel] for channel, current_cycle in stepped]
+        for channel, current_cycle in stepped:
+            # gains can be changed partway through a run
+            if channel.driver is not self._drivers[self._indexes[channel]]:
+                self._drivers[self._indexes[channel]] = channel.driver
+                self._pid.update_gains(self._indexes[channel], channel.driver)
+        duty_cycles, accumulated_errors = self._pid.update(
+            [current_cycle.target_temperature for channel, current_cycle in stepped],
+            [current_cycle.current_temperature for channel, current_cycle in stepped],
+            # a channel that has only just started has nothing to measure against, like the first tick of a
+            # ProgramRunner
+            [self._period if channel in started else dt for channel, current_cycle in stepped],
+            indexes)
+        for (channel, current_cycle), duty_cycle in zip(stepped, duty_cycles.tolist()):
+            current_cycle.duty_cycle = duty_cycle
+        return accumulated_errors.tolist()
+
+    @staticmethod
+    def _start_requested(channel, check_controls):
+        """
+        Whether a channel that isn't running has been told to start.
+
+        """
+        if Command.START in [command['command'] for command in channel.drain_commands()]:
+            return True
+        # a start command could have been missed, e.g. while the process was starting up
+        return check_controls and channel.api_interface.active
+
+    def _stop(self, channel):
+        if channel in self._running:
+            self._running.remove(channel)
+        channel.stop()
+
+
+def _crashed(exc_type):
+    """
+    Whether the runner was stopped by an error, rather than being interrupted or told to exit. Only a crash leaves the
+    run to be resumed.
+
+    :param exc_type:    the type of the exception that stopped the runner, or None if nothing did
+    :rtype:             bool
+
+    """
+    return exc_type is not None and issubclass(exc_type, Exception)
+
+
+def _publish_metrics(api_interface, run_metrics, thermometers):
+    """
+    Publishes metrics, along with the counts that the thermometers keep themselves. They aren't needed to run a
+    program, so a problem publishing them is only logged.
+
+    """
+    for name, attribute in (("sensor_rejections", "rejected"), ("thermometer_retries", "retries")):
+        values = [getattr(thermometer, attribute) for thermometer in thermometers if hasattr(thermometer, attribute)]
+        if values:
+            run_metrics.set_counter(name, sum(values))
+    try:
+        api_interface.publish_metrics(run_metrics.snapshot())
+    except:
+        log.exception("Failed to publish metrics!")
+
+
+def _write_in_background(writer):
+    """
+    Hands a temperature log over to a thread that writes it, so that the control loop never waits for the disk.
+
+    :type writer:    telemetry.TelemetryWriter
+    :rtype:          logwriter.AsyncTelemetryWriter
+
+    """
+    background = logwriter.AsyncTelemetryWriter(writer)
+    background.start()
+    return background
+
+
+def _build_pyramid(path):
+    """
+    Summarizes a finished temperature log at several resolutions, for plotting. See interface.pyramid.
+
+    """
+    try:
+        log.info("Built %s" % pyramid.build(path))
+    except:
+        log.exception("Failed to build the pyramid of %s" % path)
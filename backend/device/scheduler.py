@@ -0,0 +1,88 @@
+from clock import monotonic
+import logging
+import time
+
+log = logging.getLogger("heater." + __name__)
+
+
+class DeadlineScheduler(object):
+    """
+    Paces the control loop. Each tick is scheduled on an absolute deadline rather than by sleeping for a fixed
+    amount of time, so the time spent reading the thermometer, running the PID and talking to Redis is absorbed
+    into the wait instead of accumulating into drift.
+
+    """
+    def __init__(self, period=1.0, clock=monotonic, sleep=time.sleep):
+        """
+
+        :param period:    the number of seconds between control ticks
+        :param clock:     a function that returns a monotonically increasing time in seconds
+        :param sleep:     a function that blocks for a given number of seconds. If it returns True, the wait was
+                          interrupted and wait() returns early
+
+        """
+        assert period > 0.0
+        self.period = float(period)
+        self.overruns = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._deadline = None
+        self._last_tick = None
+
+    def start(self):
+        """
+        Sets the first deadline one period from now.
+
+        """
+        now = self._clock()
+        self._last_tick = now
+        self._deadline = now + self.period
+
+    @property
+    def deadline(self):
+        """
+        The time (according to the scheduler's clock) at which the next tick should begin.
+
+        :rtype:     float
+
+        """
+        return self._deadline
+
+    @property
+    def time_remaining(self):
+        """
+        The number of seconds until the next tick should begin.
+
+        :rtype:     float
+
+        """
+        assert self._deadline is not None
+        return max(0.0, self._deadline - self._clock())
+
+    def wait(self):
+        """
+        Blocks until the next deadline and then schedules the one after it. If the deadline has already passed, we
+        count an overrun and skip ahead to the next deadline that is still in the future, rather than trying to
+        catch up with a burst of short ticks.
+
+        :return:    the actual number of seconds since the previous tick, or None if the wait was interrupted, in
+                    which case the deadline is unchanged and wait() can simply be called again
+        :rtype:     float
+
+        """
+        assert self._deadline is not None
+        now = self._clock()
+        if now < self._deadline:
+            while now < self._deadline:
+                if self._sleep(self._deadline - now):
+                    return None
+                now = self._clock()
+            self._deadline += self.period
+        else:
+            self.overruns += 1
+            missed = int((now - self._deadline) // self.period)
+            log.warning("Control tick overran its deadline by %.3f seconds (%d overruns so far)" % (now - self._deadline, self.overruns))
+            self._deadline += (missed + 1) * self.period
+        dt = now - self._last_tick
+        self._last_tick = now
+        return dt
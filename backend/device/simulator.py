@@ -0,0 +1,69 @@
+"""
+Runs a program against a simulated heating block in virtual time, so that drivers and programs can be tried out
+before committing an experiment to them. A multi-hour program takes a few seconds.
+
+"""
+import bisect
+import clock
+import collections
+import heater
+import mock
+import plant
+import runner
+import shutil
+import tempfile
+import thermometer
+
+
+Trace = collections.namedtuple("Trace", ["times", "temperatures", "targets", "duty_cycles"])
+
+
+def simulate(steps, driver, plant_parameters=None, noise=0.0, seed=0, max_duration=None):
+    """
+    Runs a program from start to finish against a ThermalPlant.
+
+    :param steps:               the program, in the same form as Program.steps
+    :type steps:                dict
+    :param driver:              the PID values, in the same form as the API provides them
+    :type driver:               dict
+    :param plant_parameters:    keyword arguments for ThermalPlant
+    :type plant_parameters:     dict
+    :param noise:               the standard deviation of the thermometer noise, in Celsius
+    :param seed:                seeds the thermometer noise
+    :param max_duration:        the number of seconds after which to stop, which is required for programs that end in a
+                                Hold setting
+
+    :return:    the measured temperature, target temperature and duty cycle at every tick
+    :rtype:     Trace
+
+    """
+    virtual_clock = clock.VirtualClock()
+    block = plant.ThermalPlant(virtual_clock, **(plant_parameters or {}))
+    api_interface = mock.MockAPIInterface(steps, driver, virtual_clock, stop_after=max_duration)
+    sensor = thermometer.Thermometer(plant.PlantSensor(block, noise=noise, seed=seed))
+    simulated_heater = heater.Heater(mock.MockGPIO, clock=virtual_clock, engine_factory=lambda: block)
+    log_dir = tempfile.mkdtemp()
+    program_runner = runner.ProgramRunner(api_interface, sensor, simulated_heater, log_dir=log_dir, clock=virtual_clock,
+                                           build_pyramids=False)
+    try:
+        program_runner.start()
+        program_runner.run_loop()
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+    return _make_trace(api_interface.history, block.duty_log)
+
+
+def _make_trace(history, duty_log):
+    """
+    Combines the status updates with the duty cycle that was in effect at each one.
+
+    """
+    change_times = [t for t, duty in duty_log]
+    times, temperatures, targets, duty_cycles = [], [], [], []
+    for t, status in history:
+        i = bisect.bisect_right(change_times, t) - 1
+        times.append(t)
+        temperatures.append(status['current_temp'])
+        targets.append(status['target_temp'])
+        duty_cycles.append(duty_log[i][1] if i >= 0 else 0.0)
+    return Trace(times, temperatures, targets, duty_cycles)
@@ -1,6 +1,9 @@
+import clock
+import collections
 import logging
 import math
 import os
+import threading
 
 # The temperature sensor sometimes erroneously reports temperatures between -100 and -200 degrees
 # To be safe, we ignore any results that are less than 10 degrees since the room will never get that
@@ -8,6 +11,16 @@ import os
 MINIMUM_BELIEVABLE_TEMPERATURE = float(os.getenv('MINIMUM_BELIEVABLE_TEMPERATURE', 10.0))
 log = logging.getLogger("heater." + __name__)
 
+Reading = collections.namedtuple("Reading", ["temperature", "age", "samples"])
+
+
+class SensorUnavailable(Exception):
+    """
+    Signals that the thermometer hasn't given us a believable temperature recently, e.g. because it was unplugged.
+
+    """
+    pass
+
 
 class Thermometer(object):
     """
@@ -16,6 +29,8 @@ class Thermometer(object):
     """
     def __init__(self, sensor):
         self._sensor = sensor
+        # the number of readings that were thrown away and read again
+        self.retries = 0
         log.debug("Successfully connected to temperature probe.")
 
     @property
@@ -32,7 +47,211 @@ class Thermometer(object):
         :rtype:     float
 
         """
-        temperature = float('NaN')
+        temperature = float(self._sensor.readTempC())
         while math.isnan(temperature) or temperature < MINIMUM_BELIEVABLE_TEMPERATURE:
+            self.retries += 1
             temperature = float(self._sensor.readTempC())
         return temperature
+
+
+class ThermometerSampler(threading.Thread):
+    """
+    Reads the temperature probe as fast as it can produce new values in a background thread, and keeps a filtered
+    temperature ready so that the control loop never has to wait for the probe.
+
+    Readings that are NaN or unbelievably cold are thrown away, as are outliers: readings further from the median of
+    the recent readings than a few times their median absolute deviation (a Hampel filter). The reported temperature
+    is the median of the recent readings, which is much less noisy than a single reading.
+
+    If the probe stops producing believable readings, current_temperature raises SensorUnavailable instead of
+    blocking. The first reading takes a moment after the sampler starts, so until then current_temperature waits for
+    it, for up to max_age seconds.
+
+    """
+    # The MAX31855 needs about 100 ms per conversion, so there's no point in reading it faster than this
+    SAMPLE_INTERVAL = 0.1
+    # Readings this many (scaled) median absolute deviations from the median are rejected
+    OUTLIER_THRESHOLD = 3.0
+    # The deviation is never considered to be less than the resolution of the MAX31855, so that a run of identical
+    # readings doesn't cause the next slightly different one to be rejected
+    MINIMUM_DEVIATION = 0.25
+
+    def __init__(self, sensor, window=15, max_age=5.0, clock=clock.SystemClock()):
+        """
+
+        :param sensor:     the MAX31855 object (or a mock of it)
+        :param window:     how many recent readings the filter uses
+        :param max_age:    how old, in seconds, the latest good reading can be before the sensor is considered unavailable
+        :param clock:      the clock used to timestamp readings and to wait between them
+
+        """
+        super(ThermometerSampler, self).__init__(name="thermometer")
+        assert window > 2
+        self.daemon = True
+        self._sensor = sensor
+        self._max_age = max_age
+        self._clock = clock
+        self._readings = collections.deque(maxlen=window)
+        self._latest = None
+        self._first_reading = threading.Event()
+        # when the sampler was started, or None if it hasn't been
+        self._started = None
+        self._stopping = False
+        self.samples = 0
+        self.rejected = 0
+
+    def start(self):
+        self._begin()
+        super(ThermometerSampler, self).start()
+
+    def run(self):
+        while not self._stopping:
+            self._sample()
+            self._clock.sleep(ThermometerSampler.SAMPLE_INTERVAL)
+
+    def stop(self):
+        self._stopping = True
+
+    def wait_for_reading(self, timeout):
+        """
+        Waits until there's been a good reading, e.g. right after the sampler has started.
+
+        :param timeout:    the maximum number of seconds to wait
+        :return:           whether there's been a good reading
+        :rtype:            bool
+
+        """
+        return self._clock.wait_for(self._first_reading.wait, timeout)
+
+    @property
+    def reading(self):
+        """
+        The latest filtered temperature, how many seconds ago it was measured, and how many good readings we've had in
+        total. This never blocks.
+
+        :return:    the reading, or None if there has never been a good one
+        :rtype:     Reading
+
+        """
+        latest = self._latest
+        if latest is None:
+            return None
+        temperature, timestamp, samples = latest
+        return Reading(temperature, self._clock.monotonic() - timestamp, samples)
+
+    @property
+    def current_temperature(self):
+        """
+        The latest filtered temperature. This can be used in place of Thermometer.current_temperature.
+
+        :rtype:     float
+        :raises:    SensorUnavailable
+
+        """
+        reading = self.reading
+        if reading is None and self._started is not None:
+            remaining = self._max_age - (self._clock.monotonic() - self._started)
+            if remaining > 0.0 and self.wait_for_reading(remaining):
+                reading = self.reading
+        if reading is None:
+            raise SensorUnavailable("No believable temperature reading since the thermometer was started")
+        if reading.age > self._max_age:
+            raise SensorUnavailable("No believable temperature reading in the last %s seconds" % self._max_age)
+        return reading.temperature
+
+    def _begin(self):
+        """
+        Marks the sampler as started, before its first reading is taken.
+
+        """
+        self._started = self._clock.monotonic()
+
+    def _sample(self):
+        """
+        Takes one reading from the probe and updates the filtered temperature if it's believable.
+
+        """
+        try:
+            temperature = float(self._sensor.readTempC())
+        except Exception:
+            log.exception("Could not read the temperature probe.")
+            self.rejected += 1
+            return
+        if math.isnan(temperature) or temperature < MINIMUM_BELIEVABLE_TEMPERATURE or self._is_outlier(temperature):
+            self.rejected += 1
+            return
+        self._readings.append(temperature)
+        self.samples += 1
+        # a single assignment, so readers in other threads always see a consistent value
+        self._latest = (_median(self._readings), self._clock.monotonic(), self.samples)
+        self._first_reading.set()
+
+    def _is_outlier(self, temperature):
+        """
+        Hampel filter: decides whether a reading is too far from the recent ones to be believed. We need a few readings
+        before we can tell.
+
+        """
+        if len(self._readings) < 3:
+            return False
+        median = _median(self._readings)
+        # 1.4826 scales the median absolute deviation to the standard deviation of normally-distributed data
+        deviation = 1.4826 * _median([abs(reading - median) for reading in self._readings])
+        deviation = max(deviation, ThermometerSampler.MINIMUM_DEVIATION)
+        outlier = abs(temperature - median) > ThermometerSampler.OUTLIER_THRESHOLD * deviation
+        if outlier:
+            # If the temperature really is changing quickly, every new reading would look like an outlier and we'd
+            # never accept any of them. Dropping the oldest reading each time lets the window catch up.
+            self._readings.popleft()
+        return outlier
+
+
+class SamplerGroup(threading.Thread):
+    """
+    Reads several probes from a single background thread, one after the other in each pass. The MAX31855s of a
+    multi-channel controller share the clock and data pins of the SPI bus, so they can't be read from a thread each
+    at the same time. Each ThermometerSampler keeps its own filter and reports its own temperature, but isn't started
+    by itself.
+
+    """
+    def __init__(self, samplers, clock=clock.SystemClock()):
+        """
+
+        :param samplers:    ThermometerSampler objects that haven't been started
+        :param clock:       the clock used to wait between passes
+
+        """
+        super(SamplerGroup, self).__init__(name="thermometers")
+        self.daemon = True
+        self._samplers = list(samplers)
+        self._clock = clock
+        self._stopping = False
+
+    def start(self):
+        for sampler in self._samplers:
+            sampler._begin()
+        super(SamplerGroup, self).start()
+
+    def run(self):
+        while not self._stopping:
+            self.sample()
+            self._clock.sleep(ThermometerSampler.SAMPLE_INTERVAL)
+
+    def stop(self):
+        self._stopping = True
+
+    def sample(self):
+        """
+        Takes one reading from every probe.
+
+        """
+        for sampler in self._samplers:
+            sampler._sample()
+
+
+def _median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
@@ -0,0 +1,203 @@
+"""
+Finds good PID values for a heating block by running a program against a simulated block with many candidate values,
+spread across every CPU core. Everything is seeded, so the same inputs always give the same answer.
+
+"""
+import collections
+import itertools
+import multiprocessing
+import simulator
+
+
+# How much each part of the score counts. IAE is in Celsius-seconds, overshoot in Celsius and settling time in seconds.
+DEFAULT_WEIGHTS = {"iae": 1.0, "overshoot": 100.0, "settling_time": 1.0}
+# The error (in Celsius) that we consider close enough to the target temperature
+SETTLING_TOLERANCE = 0.5
+
+Gains = collections.namedtuple("Gains", ["kp", "ki", "kd", "error_limit"])
+Score = collections.namedtuple("Score", ["cost", "iae", "overshoot", "settling_time"])
+
+
+def score_trace(trace, weights=None, tolerance=SETTLING_TOLERANCE):
+    """
+    Measures how well a simulated run followed its program.
+
+    Since programs can have many steps, settling time is the total time spent further than the tolerance from the
+    target temperature, rather than the time until the first step settles.
+
+    :type trace:    simulator.Trace
+    :param weights:    how much each part counts towards the cost, see DEFAULT_WEIGHTS
+    :param tolerance:    the error, in Celsius, within which the temperature is considered settled
+
+    :rtype:     Score
+
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    iae = 0.0
+    overshoot = 0.0
+    settling_time = 0.0
+    previous_time = None
+    for time, temperature, target in zip(trace.times, trace.temperatures, trace.targets):
+        dt = 1.0 if previous_time is None else time - previous_time
+        previous_time = time
+        error = temperature - target
+        iae += abs(error) * dt
+        overshoot = max(overshoot, error)
+        if abs(error) > tolerance:
+            settling_time += dt
+    cost = weights["iae"] * iae + weights["overshoot"] * overshoot + weights["settling_time"] * settling_time
+    return Score(cost, iae, overshoot, settling_time)
+
+
+def evaluate(job):
+    """
+    Simulates one set of PID values and scores it. This has to be a module-level function that takes a single
+    argument so that multiprocessing can send it to worker processes.
+
+    :param job:    the program steps, the Gains, and a dict of options for simulate() and score_trace()
+    :type job:     tuple
+
+    :rtype:     Score
+
+    """
+    steps, gains, options = job
+    # gains can't be negative, but the simplex search is allowed to wander there
+    gains = Gains(*[max(0.0, value) for value in gains])
+    driver = {"name": "tuning",
+              "kp": gains.kp,
+              "ki": gains.ki,
+              "kd": gains.kd,
+              "max_accumulated_error": gains.error_limit,
+              "min_accumulated_error": -gains.error_limit,
+              "period": options.get("period", 1.0)}
+    trace = simulator.simulate(steps, driver,
+                               plant_parameters=options.get("plant_parameters"),
+                               noise=options.get("noise", 0.0),
+                               seed=options.get("seed", 0),
+                               max_duration=options.get("max_duration"))
+    return score_trace(trace, options.get("weights"))
+
+
+class Tuner(object):
+    """
+    Searches for the PID values that give the lowest score on a program.
+
+    """
+    def __init__(self, steps, processes=None, **options):
+        """
+
+        :param steps:        the program to tune against, in the same form as Program.steps
+        :param processes:    the number of worker processes, which defaults to the number of CPUs
+        :param options:      plant_parameters, noise, seed, max_duration and period for the simulation, and weights
+                             for scoring
+
+        """
+        self._steps = steps
+        self._processes = processes or multiprocessing.cpu_count()
+        self._options = options
+        self._pool = None
+        self.evaluations = 0
+
+    def __enter__(self):
+        if self._processes > 1:
+            self._pool = multiprocessing.Pool(self._processes)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def evaluate_all(self, candidates):
+        """
+        Scores a batch of candidates in parallel. Results come back in the same order as the candidates.
+
+        :type candidates:    list of Gains
+        :rtype:     list of Score
+
+        """
+        jobs = [(self._steps, Gains(*candidate), self._options) for candidate in candidates]
+        self.evaluations += len(jobs)
+        if self._pool is None:
+            return [evaluate(job) for job in jobs]
+        return self._pool.map(evaluate, jobs)
+
+    def grid_search(self, kp_values, ki_values, kd_values, error_limits):
+        """
+        Tries every combination of the given values.
+
+        :return:    the best gains and their score
+        :rtype:     (Gains, Score)
+
+        """
+        candidates = [Gains(*values) for values in itertools.product(kp_values, ki_values, kd_values, error_limits)]
+        scores = self.evaluate_all(candidates)
+        # ties go to whichever candidate came first, so the result doesn't depend on the number of processes
+        best = min(range(len(candidates)), key=lambda i: (scores[i].cost, i))
+        return candidates[best], scores[best]
+
+    def nelder_mead(self, initial, step=None, iterations=50, tolerance=1e-3):
+        """
+        Searches from a starting point with the Nelder-Mead simplex method. Each iteration evaluates the reflected,
+        expanded and both contracted points at the same time, so that the work can be spread across processes.
+
+        :param initial:       the Gains to start from
+        :param step:          the size of the initial simplex along each axis, which defaults to half of each value
+        :param iterations:    the maximum number of iterations
+        :param tolerance:     stop when the costs of the simplex are this close together
+
+        :return:    the best gains and their score
+        :rtype:     (Gains, Score)
+
+        """
+        initial = [float(value) for value in initial]
+        step = step or [0.5 * value if value else 1.0 for value in initial]
+        simplex = [initial]
+        for axis in range(len(initial)):
+            vertex = list(initial)
+            vertex[axis] += step[axis]
+            simplex.append(vertex)
+        scores = self.evaluate_all(simplex)
+
+        for _ in range(iterations):
+            order = sorted(range(len(simplex)), key=lambda i: (scores[i].cost, i))
+            simplex = [simplex[i] for i in order]
+            scores = [scores[i] for i in order]
+            if scores[-1].cost - scores[0].cost <= tolerance:
+                break
+            centroid = [sum(values) / len(simplex[:-1]) for values in zip(*simplex[:-1])]
+            worst = simplex[-1]
+            reflected = _along(centroid, worst, -1.0)
+            expanded = _along(centroid, worst, -2.0)
+            outside = _along(centroid, worst, -0.5)
+            inside = _along(centroid, worst, 0.5)
+            reflected_score, expanded_score, outside_score, inside_score = self.evaluate_all(
+                [reflected, expanded, outside, inside])
+
+            if reflected_score.cost < scores[0].cost:
+                if expanded_score.cost < reflected_score.cost:
+                    simplex[-1], scores[-1] = expanded, expanded_score
+                else:
+                    simplex[-1], scores[-1] = reflected, reflected_score
+            elif reflected_score.cost < scores[-2].cost:
+                simplex[-1], scores[-1] = reflected, reflected_score
+            elif reflected_score.cost < scores[-1].cost and outside_score.cost <= reflected_score.cost:
+                simplex[-1], scores[-1] = outside, outside_score
+            elif reflected_score.cost >= scores[-1].cost and inside_score.cost < scores[-1].cost:
+                simplex[-1], scores[-1] = inside, inside_score
+            else:
+                # shrink everything towards the best vertex
+                simplex = [simplex[0]] + [_along(simplex[0], vertex, 0.5) for vertex in simplex[1:]]
+                scores = [scores[0]] + self.evaluate_all(simplex[1:])
+
+        best = min(range(len(simplex)), key=lambda i: (scores[i].cost, i))
+        return Gains(*[max(0.0, value) for value in simplex[best]]), scores[best]
+
+
+def _along(origin, point, fraction):
+    """
+    The point that is some fraction of the way from origin to point. Negative fractions go in the other direction.
+
+    """
+    return [o + fraction * (p - o) for o, p in zip(origin, point)]
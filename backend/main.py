@@ -1,8 +1,8 @@
-from device import ProgramRunner
+from device import MultiChannelRunner, ProgramRunner
 import logging
 from logging.handlers import RotatingFileHandler
 from device import heater
-from interface import APIInterface
+from interface import APIInterface, catalog, channels
 from device import thermometer
 import Adafruit_MAX31855.MAX31855 as MAX31855
 import RPi.GPIO as GPIO
@@ -24,8 +24,22 @@ log.setLevel(logging.DEBUG)
 
 
 if __name__ == "__main__":
-    api_interface = APIInterface()
-    thermometer = thermometer.Thermometer(MAX31855.MAX31855(24, 23, 18))
-    heater = heater.Heater(GPIO)
-    with ProgramRunner(api_interface, thermometer, heater) as program:
+    # there's just one channel, with the usual pins, unless channels are configured
+    config = channels.load()
+    run_catalog = catalog.RunCatalog()
+    # the probes are read continuously in the background, so the control loop never waits for them. They share the
+    # SPI bus, so a single thread reads each of them in turn
+    samplers = [thermometer.ThermometerSampler(MAX31855.MAX31855(channel.clock_pin, channel.chip_select_pin,
+                                                                 channel.data_pin))
+                for channel in config.channels]
+    thermometer.SamplerGroup(samplers).start()
+    runners = [ProgramRunner(APIInterface(channel=channel.name), sampler,
+                             heater.Heater(GPIO, pwm_pin=channel.pwm_pin, enable_pin=channel.enable_pin),
+                             run_catalog=run_catalog, channel=channel.name)
+               for channel, sampler in zip(config.channels, samplers)]
+    if len(runners) == 1:
+        program = runners[0]
+    else:
+        program = MultiChannelRunner(runners, config.period, api_interface=APIInterface())
+    with program:
         program.run()
@@ -1,8 +1,13 @@
 """
 Runs the backend and supplies it with fake temperature data. This allows for functional testing of the entire process.
 
+With --virtual, a program is instead run against a simulated heating block in virtual time, without Redis, and the
+temperature at each tick is printed as tab-separated values.
+
 """
+import argparse
 from device import ProgramRunner
+import json
 import logging
 from device import heater
 from interface import APIInterface
@@ -17,7 +22,28 @@ log.addHandler(handler)
 log.setLevel(logging.DEBUG)
 
 
+def run_virtual(program_path, driver_path, max_duration):
+    from device import simulator
+    with open(program_path) as f:
+        steps = json.load(f)
+    with open(driver_path) as f:
+        driver = json.load(f)
+    trace = simulator.simulate(steps, driver, max_duration=max_duration)
+    for row in zip(*trace):
+        print("\t".join(str(value) for value in row))
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--virtual", nargs=2, metavar=("PROGRAM", "DRIVER"),
+                        help="JSON files with the program steps and the PID values to simulate")
+    parser.add_argument("--max-duration", type=float, default=None,
+                        help="stop the virtual simulation after this many seconds")
+    args = parser.parse_args()
+    if args.virtual:
+        run_virtual(args.virtual[0], args.virtual[1], args.max_duration)
+        raise SystemExit(0)
+
     api_interface = APIInterface()
     thermometer = thermometer.Thermometer(MockMAX31855())
     heater = heater.Heater(MockGPIO)
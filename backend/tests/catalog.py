@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from interface import catalog, telemetry
+from backend.device import clock, heater, mock, plant, runner, thermometer
+
+
+class RunCatalogTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.catalog = catalog.RunCatalog(os.path.join(self.directory, "runs.sqlite3"))
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.directory)
+
+    def test_start_and_finish(self):
+        run_id = self.catalog.start_run("/logs/temperature-2016-01-01-12-00-00.telemetry", datetime(2016, 1, 1, 12),
+                                        program_id=3, driver_id=4)
+        count, runs = self.catalog.query()
+        self.assertEqual(count, 1)
+        self.assertEqual(runs[0]["name"], "2016-01-01-12-00-00")
+        self.assertEqual(runs[0]["start_time"], 1451649600.0)
+        self.assertIsNone(runs[0]["end_time"])
+        summary = catalog.RunSummary()
+        summary.add(36.0, 37.0)
+        summary.add(38.0, None)
+        self.catalog.finish_run(run_id, datetime(2016, 1, 1, 13), summary)
+        run = self.catalog.query()[1][0]
+        self.assertEqual(run["end_time"], 1451653200.0)
+        self.assertEqual(run["samples"], 2)
+        self.assertEqual(run["min_temperature"], 36.0)
+        self.assertEqual(run["max_temperature"], 38.0)
+        self.assertEqual(run["mean_absolute_error"], 1.0)
+
+    def test_connect(self):
+        self.catalog.start_run("/logs/temperature-1.telemetry", datetime(2016, 1, 1))
+        counts = []
+
+        def count():
+            # a connection can only be used by the thread that opened it
+            connection = self.catalog.connect()
+            try:
+                counts.append(connection.query()[0])
+            finally:
+                connection.close()
+        thread = threading.Thread(target=count)
+        thread.start()
+        thread.join()
+        self.assertEqual(counts, [1])
+
+    def test_query(self):
+        for hour in range(10):
+            self.catalog.start_run("/logs/temperature-%d.telemetry" % hour, datetime(2016, 1, 1, hour),
+                                   program_id=hour % 2, driver_id=1)
+        count, runs = self.catalog.query(limit=3)
+        self.assertEqual(count, 10)
+        self.assertEqual([run["name"] for run in runs], ["9", "8", "7"])
+        count, runs = self.catalog.query(program_id=1, limit=2, offset=2)
+        self.assertEqual(count, 5)
+        self.assertEqual([run["name"] for run in runs], ["5", "3"])
+        count, runs = self.catalog.query(after=1451610000.0, before=1451620800.0)
+        self.assertEqual([run["name"] for run in runs], ["3", "2", "1"])
+        self.assertEqual(self.catalog.query(driver_id=2)[0], 0)
+
+    def test_import_logs(self):
+        path = os.path.join(self.directory, "temperature-2016-01-01-12-00-00" + telemetry.EXTENSION)
+        writer = telemetry.TelemetryWriter(path, datetime(2016, 1, 1, 12))
+        for i in range(10):
+            writer.write(datetime(2016, 1, 1, 12) + timedelta(seconds=i), 30.0 + i, 35.0, 50.0, 0, 0.0)
+        writer.close()
+        self.assertEqual(catalog.import_logs(self.catalog, self.directory), 1)
+        # importing again doesn't add it twice
+        self.assertEqual(catalog.import_logs(self.catalog, self.directory), 0)
+        run = self.catalog.query()[1][0]
+        self.assertEqual(run["samples"], 10)
+        self.assertEqual(run["max_temperature"], 39.0)
+        self.assertEqual(run["mean_absolute_error"], 2.5)
+        self.assertEqual(run["end_time"], 1451649609.0)
+
+
+class RunnerCatalogTests(unittest.TestCase):
+    def test_runner_records_run(self):
+        directory = tempfile.mkdtemp()
+        try:
+            run_catalog = catalog.RunCatalog(os.path.join(directory, "runs.sqlite3"))
+            virtual_clock = clock.VirtualClock()
+            block = plant.ThermalPlant(virtual_clock)
+            api_interface = mock.MockAPIInterface({"1": {"mode": "set", "temperature": 40.0, "duration": 60}},
+                                                  {"id": 7, "name": "test", "kp": 8.0, "ki": 0.05, "kd": 20.0,
+                                                   "max_accumulated_error": 500.0, "min_accumulated_error": -500.0},
+                                                  virtual_clock)
+            api_interface.program_id = 5
+            program_runner = runner.ProgramRunner(api_interface, thermometer.Thermometer(plant.PlantSensor(block)),
+                                                  heater.Heater(mock.MockGPIO, clock=virtual_clock,
+                                                                engine_factory=lambda: block),
+                                                  log_dir=directory, clock=virtual_clock, build_pyramids=False,
+                                                  run_catalog=run_catalog)
+            program_runner.start()
+            program_runner.run_loop()
+            count, runs = run_catalog.query(program_id=5)
+            self.assertEqual(count, 1)
+            self.assertEqual(runs[0]["driver_id"], 7)
+            self.assertEqual(runs[0]["samples"], 60)
+            self.assertAlmostEqual(runs[0]["end_time"] - runs[0]["start_time"], 60.0)
+            run_catalog.close()
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+import unittest
+from interface import channels
+
+
+class ChannelConfigTests(unittest.TestCase):
+    CONFIG = {"period": 2.0,
+              "clock_pin": 5,
+              "channels": [{"name": "a", "pwm_pin": 16, "enable_pin": 20, "chip_select_pin": 23},
+                           {"name": "b", "pwm_pin": 12, "enable_pin": 21, "chip_select_pin": 25, "data_pin": 6}]}
+
+    def test_parse(self):
+        config = channels.parse(self.CONFIG)
+        self.assertEqual(config.period, 2.0)
+        self.assertEqual(config.channels[0], channels.Channel("a", 16, 20, 5, 23, 18))
+        self.assertEqual(config.channels[1], channels.Channel("b", 12, 21, 5, 25, 6))
+
+    def test_default_without_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            config = channels.load(os.path.join(directory, "channels.json"))
+            self.assertEqual(config, channels.DEFAULT_CONFIG)
+            self.assertEqual(channels.names(os.path.join(directory, "channels.json")), [])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_invalid(self):
+        channel = {"name": "a", "pwm_pin": 16, "enable_pin": 20, "chip_select_pin": 23}
+        for config in ({},
+                       {"channels": []},
+                       {"channels": [channel], "period": 0},
+                       {"channels": [dict(channel, name="a b")]},
+                       {"channels": [dict(channel, pwm_pin="16")]},
+                       {"channels": [channel, dict(channel, pwm_pin=12, enable_pin=21, chip_select_pin=25)]},
+                       {"channels": [channel, dict(channel, name="b", pwm_pin=12, enable_pin=21)]},
+                       {"channels": [channel, dict(channel, name="b", enable_pin=21, chip_select_pin=25)]}):
+            self.assertRaises(channels.ChannelError, channels.parse, config)
@@ -0,0 +1,194 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from backend.device import checkpoint, clock, heater, mock, plant, runner, thermometer
+from interface import telemetry
+
+DRIVER = {"name": "test", "kp": 8.0, "ki": 0.05, "kd": 10.0, "max_accumulated_error": 500.0,
+          "min_accumulated_error": -500.0}
+PROGRAM = {"1": {"mode": "set", "temperature": 40.0, "duration": 120}}
+
+
+class CrashingSensor(object):
+    """
+    Reads a ThermalPlant, but fails after a number of readings, as if the controller had hit a bug.
+
+    """
+    def __init__(self, block, readings):
+        self._sensor = plant.PlantSensor(block)
+        self._readings = readings
+
+    def readTempC(self):
+        self._readings -= 1
+        if self._readings < 0:
+            raise RuntimeError("crashed")
+        return self._sensor.readTempC()
+
+
+class SlowSensor(object):
+    """
+    Reads a ThermalPlant, taking a while over each reading as the MAX31855 does.
+
+    """
+    def __init__(self, block):
+        self._sensor = plant.PlantSensor(block)
+
+    def readTempC(self):
+        time.sleep(0.05)
+        return self._sensor.readTempC()
+
+
+class CheckpointFileTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoints = checkpoint.CheckpointFile(os.path.join(self.directory, "checkpoint.json"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        saved = checkpoint.Checkpoint(written=datetime(2016, 1, 1, 12, 0, 30, 250000), boot_id="boot",
+                                      program_hash="abc", start_time=datetime(2016, 1, 1, 12), skip_time=10,
+                                      accumulated_error=3.5, past_errors=[1.0, 0.5], log_path="/tmp/log", run_id=4,
+                                      resumes=1)
+        self.checkpoints.save(saved)
+        self.checkpoints.save(saved._replace(accumulated_error=4.0))
+        self.assertEqual(self.checkpoints.load(), saved._replace(accumulated_error=4.0))
+        self.assertEqual(os.listdir(self.directory), ["checkpoint.json"])
+        self.checkpoints.remove()
+        self.assertIsNone(self.checkpoints.load())
+        # there's nothing to remove any more
+        self.checkpoints.remove()
+
+    def test_unreadable(self):
+        with open(self.checkpoints.path, "w") as f:
+            f.write('{"written": "2016')
+        self.assertIsNone(self.checkpoints.load())
+
+
+class ResumeTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = clock.VirtualClock()
+        self.block = plant.ThermalPlant(self.clock)
+        self.api_interface = mock.MockAPIInterface(PROGRAM, DRIVER, self.clock)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_runner(self, sensor):
+        return runner.ProgramRunner(self.api_interface, thermometer.Thermometer(sensor),
+                                    heater.Heater(mock.MockGPIO, clock=self.clock, engine_factory=lambda: self.block),
+                                    log_dir=self.directory, clock=self.clock, build_pyramids=False)
+
+    def crash(self, readings, boot=False):
+        crashed = self.make_runner(CrashingSensor(self.block, readings))
+        if boot:
+            crashed.boot()
+        crashed.start()
+        try:
+            crashed.run_loop()
+        except RuntimeError as e:
+            crashed.__exit__(RuntimeError, e, None)
+        return crashed
+
+    def logs(self):
+        return [name for name in os.listdir(self.directory) if name.startswith("temperature-")]
+
+    def test_resumes_after_a_crash(self):
+        crashed = self.crash(12)
+        self.assertTrue(self.api_interface.active)
+        saved = crashed._checkpoint.load()
+        # checkpoints are written on the first tick and every few after that
+        self.assertEqual(saved.written, crashed._start_time + timedelta(seconds=10))
+        self.clock.sleep(5.0)
+        resumed = self.make_runner(plant.PlantSensor(self.block))
+        resumed.boot()
+        resumed.start()
+        self.assertEqual(resumed._start_time, crashed._start_time)
+        self.assertEqual(resumed._accumulated_error, saved.accumulated_error)
+        self.assertEqual(resumed.pid.past_errors, saved.past_errors)
+        resumed.run_loop()
+        resumed.stop()
+        # the run carries on in the same log, and is finished where it would have been without the crash
+        self.assertEqual(len(self.logs()), 1)
+        start_time, records = telemetry.read_telemetry(os.path.join(self.directory, self.logs()[0]))
+        self.assertEqual(records["timestamp"][0], start_time)
+        self.assertAlmostEqual(records["timestamp"][-1] - start_time, 120.0, delta=2.0)
+        self.assertNotIn("checkpoint.json", os.listdir(self.directory))
+        self.assertFalse(self.api_interface.active)
+
+    def test_resumes_with_a_sampled_thermometer(self):
+        crashed = self.crash(12)
+        # as it is right after the controller has been restarted, with the probe not read yet
+        sampler = thermometer.ThermometerSampler(SlowSensor(self.block), clock=clock.SystemClock())
+        resumed = runner.ProgramRunner(self.api_interface, sampler,
+                                       heater.Heater(mock.MockGPIO, clock=self.clock,
+                                                     engine_factory=lambda: self.block),
+                                       log_dir=self.directory, clock=self.clock, build_pyramids=False)
+        sampler.start()
+        try:
+            resumed.boot()
+            resumed.start()
+            self.assertIsNotNone(sampler.reading)
+            resumed.run_loop()
+        finally:
+            sampler.stop()
+        self.assertEqual(resumed._start_time, crashed._start_time)
+        self.assertNotIn("checkpoint.json", os.listdir(self.directory))
+        start_time, records = telemetry.read_telemetry(os.path.join(self.directory, self.logs()[0]))
+        self.assertAlmostEqual(records["timestamp"][-1] - start_time, 120.0, delta=2.0)
+
+    def test_does_not_resume_a_stale_run(self):
+        self.crash(12)
+        self.clock.sleep(checkpoint.GRACE_PERIOD + 1.0)
+        restarted = self.make_runner(plant.PlantSensor(self.block))
+        restarted.boot()
+        self.assertFalse(self.api_interface.active)
+        self.assertIsNone(restarted._resuming)
+        self.assertNotIn("checkpoint.json", os.listdir(self.directory))
+
+    def test_does_not_resume_another_program(self):
+        self.crash(12)
+        self.api_interface.program = {"1": {"mode": "set", "temperature": 50.0, "duration": 120}}
+        restarted = self.make_runner(plant.PlantSensor(self.block))
+        restarted.boot()
+        self.assertFalse(self.api_interface.active)
+
+    def test_gives_up_on_a_run_that_keeps_crashing(self):
+        self.crash(12)
+        for resumes in range(1, checkpoint.MAX_RESUMES + 1):
+            crashed = self.crash(0, boot=True)
+            self.assertEqual(crashed._checkpoint.load().resumes, resumes)
+            self.assertTrue(self.api_interface.active)
+        restarted = self.make_runner(plant.PlantSensor(self.block))
+        restarted.boot()
+        self.assertIsNone(restarted._resuming)
+        self.assertFalse(self.api_interface.active)
+        self.assertNotIn("checkpoint.json", os.listdir(self.directory))
+
+    def test_keeps_resuming_a_run_that_gets_somewhere(self):
+        self.crash(12)
+        for _ in range(checkpoint.MAX_RESUMES + 1):
+            crashed = self.crash(checkpoint.INTERVAL + 1, boot=True)
+            self.assertEqual(crashed._checkpoint.load().resumes, 0)
+        self.assertTrue(self.api_interface.active)
+
+    def test_interrupting_forgets_the_run(self):
+        interrupted = self.make_runner(plant.PlantSensor(self.block))
+        interrupted.start()
+        interrupted._save_checkpoint([])
+        interrupted.__exit__(KeyboardInterrupt, KeyboardInterrupt(), None)
+        self.assertEqual(os.listdir(self.directory), self.logs())
+        self.assertFalse(self.api_interface.active)
+
+    def test_stopping_forgets_the_run(self):
+        self.api_interface._stop_after = 30
+        stopped = self.make_runner(plant.PlantSensor(self.block))
+        stopped.start()
+        stopped.run_loop()
+        self.assertEqual(os.listdir(self.directory), self.logs())
+        self.assertFalse(self.api_interface.active)
@@ -0,0 +1,16 @@
+import time
+import unittest
+from backend.device import clock
+
+
+class MonotonicTests(unittest.TestCase):
+    def test_not_the_wall_clock(self):
+        # the wall clock can be stepped backwards by NTP, so it's only used if there's no other choice
+        self.assertIsNot(clock.monotonic, time.time)
+
+    def test_never_goes_backwards(self):
+        readings = [clock.monotonic() for _ in range(1000)]
+        self.assertEqual(readings, sorted(readings))
+        before = clock.monotonic()
+        time.sleep(0.01)
+        self.assertGreaterEqual(clock.monotonic() - before, 0.01)
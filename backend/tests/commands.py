@@ -0,0 +1,23 @@
+import unittest
+from backend.device.commands import CommandListener
+from interface import Command
+
+
+class CommandListenerTests(unittest.TestCase):
+    def setUp(self):
+        self.stops = []
+        self.listener = CommandListener(None, on_stop=lambda: self.stops.append(True))
+
+    def test_wait_times_out(self):
+        self.assertFalse(self.listener.wait(0.01))
+
+    def test_commands_in_order(self):
+        self.listener._receive({"command": Command.SKIP, "skip_time": 30})
+        self.listener._receive({"command": Command.STOP})
+        self.assertTrue(self.listener.wait(0.01))
+        self.assertEqual([command['command'] for command in self.listener.drain()], [Command.SKIP, Command.STOP])
+        self.assertFalse(self.listener.wait(0.01))
+
+    def test_stop_acts_immediately(self):
+        self.listener._receive({"command": Command.STOP})
+        self.assertEqual(self.stops, [True])
@@ -0,0 +1,72 @@
+import os
+import unittest
+import redis
+from interface import APIInterface, connection
+
+
+class RecordingConnection(object):
+    """
+    Stands in for a connection to Redis, and can be made to fail.
+
+    """
+    def __init__(self, **kwargs):
+        self.pid = os.getpid()
+        self.commands = []
+        self.disconnects = 0
+        self.dead = False
+
+    def send_command(self, *args):
+        if self.dead:
+            raise redis.ConnectionError("Connection reset by peer")
+        self.commands.append(args)
+
+    def read_response(self):
+        return "PONG"
+
+    def disconnect(self):
+        self.disconnects += 1
+        self.dead = False
+
+
+class HealthCheckedConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = connection.HealthCheckedConnectionPool(health_check_interval=10.0,
+                                                           connection_class=RecordingConnection)
+
+    def test_reuses_connections(self):
+        first = self.pool.get_connection("GET")
+        self.pool.release(first)
+        self.assertIs(self.pool.get_connection("GET"), first)
+
+    def test_recently_used_not_checked(self):
+        conn = self.pool.get_connection("GET")
+        self.pool.release(conn)
+        self.pool.get_connection("GET")
+        self.assertEqual(conn.commands, [])
+
+    def test_idle_connection_checked(self):
+        conn = self.pool.get_connection("GET")
+        self.pool.release(conn)
+        conn.last_used -= 11.0
+        self.pool.get_connection("GET")
+        self.assertEqual(conn.commands, [("PING",)])
+        self.assertEqual(conn.disconnects, 0)
+
+    def test_dead_connection_reset(self):
+        conn = self.pool.get_connection("GET")
+        self.pool.release(conn)
+        conn.last_used -= 11.0
+        conn.dead = True
+        self.assertIs(self.pool.get_connection("GET"), conn)
+        self.assertEqual(conn.disconnects, 1)
+
+
+class SharedPoolTests(unittest.TestCase):
+    def test_api_interfaces_share_pool(self):
+        self.assertIs(APIInterface().store.connection_pool, APIInterface().store.connection_pool)
+        self.assertIs(APIInterface().store.connection_pool, connection.shared_pool())
+
+    def test_unix_socket(self):
+        pool = connection.make_pool(socket_path="/var/run/redis/redis.sock")
+        self.assertIs(pool.connection_class, redis.UnixDomainSocketConnection)
+        self.assertEqual(pool.connection_kwargs["path"], "/var/run/redis/redis.sock")
@@ -0,0 +1,31 @@
+import random
+import unittest
+from backend.device.derivative import FilteredDerivative, IncrementalLeastSquaresDerivative, LeastSquaresDerivative
+
+
+class DerivativeEstimatorTests(unittest.TestCase):
+    def test_incremental_matches_lstsq(self):
+        rng = random.Random(1)
+        reference = LeastSquaresDerivative(6)
+        incremental = IncrementalLeastSquaresDerivative(6)
+        for _ in range(2500):
+            error = rng.uniform(-20.0, 20.0)
+            dt = rng.uniform(0.9, 1.1)
+            self.assertAlmostEqual(incremental.update(error, 0.0, dt), reference.update(error, 0.0, dt))
+
+    def test_incremental_line(self):
+        incremental = IncrementalLeastSquaresDerivative(4)
+        for error in [2.0, 4.0, 6.0, 8.0]:
+            slope = incremental.update(error, 0.0, 2.0)
+        self.assertAlmostEqual(slope, 1.0)
+
+    def test_filtered_uses_measurement(self):
+        filtered = FilteredDerivative(time_constant=0.0)
+        filtered.update(10.0, 30.0)
+        # the target jumped, but the temperature only rose by 1 degree
+        self.assertAlmostEqual(filtered.update(50.0, 31.0), -1.0)
+
+    def test_filtered_smooths(self):
+        filtered = FilteredDerivative(time_constant=9.0)
+        filtered.update(0.0, 30.0)
+        self.assertAlmostEqual(filtered.update(0.0, 40.0), -1.0)
@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+from interface import downsample
+
+
+class MinMaxTests(unittest.TestCase):
+    def test_short_series_untouched(self):
+        self.assertEqual(list(downsample.minmax(np.arange(5.0), 10)), [0, 1, 2, 3, 4])
+
+    def test_keeps_extremes(self):
+        values = np.zeros(1000)
+        values[123] = 50.0
+        values[777] = -50.0
+        keep = downsample.minmax(values, 20)
+        self.assertLessEqual(len(keep), 20)
+        self.assertIn(123, keep)
+        self.assertIn(777, keep)
+        self.assertEqual(list(keep), sorted(keep))
+
+    def test_ignores_nan(self):
+        values = np.ones(100)
+        values[:50] = np.nan
+        values[60] = 5.0
+        keep = downsample.minmax(values, 4)
+        self.assertIn(60, keep)
+        # the first bucket is entirely missing, so only its first point is kept
+        self.assertIn(0, keep)
+
+
+class LTTBTests(unittest.TestCase):
+    def test_keeps_ends_and_count(self):
+        times = np.arange(1000.0)
+        values = np.sin(times / 50.0)
+        keep = downsample.lttb(times, values, 50)
+        self.assertEqual(len(keep), 50)
+        self.assertEqual(keep[0], 0)
+        self.assertEqual(keep[-1], 999)
+        self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_keeps_spike(self):
+        times = np.arange(1000.0)
+        values = np.zeros(1000)
+        values[500] = 10.0
+        self.assertIn(500, downsample.lttb(times, values, 30))
+
+
+class DownsampleTests(unittest.TestCase):
+    def test_shared_rows(self):
+        times = np.arange(1000.0)
+        measured = np.zeros(1000)
+        measured[10] = 1.0
+        duty = np.zeros(1000)
+        duty[900] = 1.0
+        keep = downsample.downsample(times, [measured, duty], 40)
+        self.assertLessEqual(len(keep), 40)
+        self.assertIn(10, keep)
+        self.assertIn(900, keep)
+
+    def test_zero_keeps_everything(self):
+        self.assertEqual(len(downsample.downsample(np.arange(100.0), [np.arange(100.0)], 0)), 100)
+        self.assertEqual(len(downsample.downsample(np.arange(100.0), [np.arange(100.0)], 10, "lttb")), 10)
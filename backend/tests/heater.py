@@ -27,3 +27,25 @@ class HeaterTests(unittest.TestCase):
         on_time, off_time = self.heater._calculate_pwm(100)
         self.assertEqual(on_time, 1.0)
         self.assertEqual(off_time, 0.0)
+
+    def test_calculate_pwm_period(self):
+        on_time, off_time = self.heater._calculate_pwm(25, 2.0)
+        self.assertEqual(on_time, 0.5)
+        self.assertEqual(off_time, 1.5)
+
+
+class RecordingGPIO(MockGPIO):
+    outputs = []
+
+    @staticmethod
+    def output(pin, state):
+        RecordingGPIO.outputs.append((pin, state))
+
+
+class HeaterPinTests(unittest.TestCase):
+    def test_uses_its_own_pins(self):
+        RecordingGPIO.outputs = []
+        heater = Heater(RecordingGPIO, pwm_pin=12, enable_pin=21)
+        heater.enable()
+        heater.disable()
+        self.assertEqual(RecordingGPIO.outputs, [(21, MockGPIO.HIGH), (21, MockGPIO.LOW), (12, MockGPIO.LOW)])
@@ -0,0 +1,132 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from backend.device import logwriter
+from interface import telemetry
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class StuckWriter(object):
+    """
+    A telemetry file on an SD card that doesn't finish writing until it's told to.
+
+    """
+    def __init__(self, writer):
+        self._writer = writer
+        self.path = writer.path
+        self.pack = writer.pack
+        self.released = threading.Event()
+        self.syncs = []
+
+    def write_packed(self, data):
+        self.released.wait()
+        self._writer.write_packed(data)
+
+    def flush(self, sync=False):
+        self.syncs.append(sync)
+        self._writer.flush(sync)
+
+    def close(self):
+        self._writer.close()
+
+
+class AsyncTelemetryWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "temperature.telemetry")
+        self.start = datetime(2016, 1, 1)
+        self.writer = telemetry.TelemetryWriter(self.path, self.start)
+        self.handler = RecordingHandler()
+        logwriter.log.addHandler(self.handler)
+
+    def tearDown(self):
+        logwriter.log.removeHandler(self.handler)
+        shutil.rmtree(self.directory)
+
+    def write(self, background, count):
+        return [background.write(self.start + timedelta(seconds=i), 30.0 + i, 40.0, 50.0, 1, 0.5)
+                for i in range(count)]
+
+    def test_writes_every_record(self):
+        background = logwriter.AsyncTelemetryWriter(self.writer, commit_records=8)
+        background.start()
+        self.write(background, 100)
+        self.assertTrue(background.close())
+        start_time, records = telemetry.read_telemetry(self.path)
+        self.assertEqual(len(records), 100)
+        self.assertEqual(records['measured'][99], 129.0)
+        self.assertEqual((background.written, background.dropped, background.failed), (100, 0, 0))
+        # closing again does nothing
+        self.assertTrue(background.close())
+
+    def test_commits_after_an_interval(self):
+        background = logwriter.AsyncTelemetryWriter(self.writer, commit_interval=0.01)
+        background.start()
+        self.write(background, 3)
+        for _ in range(100):
+            if background.written:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(telemetry.read_telemetry(self.path)[1]), 3)
+        background.close()
+
+    def test_never_blocks(self):
+        stuck = StuckWriter(self.writer)
+        background = logwriter.AsyncTelemetryWriter(stuck, capacity=4, commit_records=1)
+        background.start()
+        queued = self.write(background, 10)
+        # one record is being written, four are waiting and the rest don't fit
+        self.assertFalse(all(queued))
+        self.assertEqual(background.dropped, queued.count(False))
+        stuck.released.set()
+        background.close()
+        self.assertEqual(len(telemetry.read_telemetry(self.path)[1]), queued.count(True))
+
+    def test_gives_up_draining(self):
+        stuck = StuckWriter(self.writer)
+        background = logwriter.AsyncTelemetryWriter(stuck)
+        background.start()
+        self.write(background, 3)
+        self.assertFalse(background.close(timeout=0.05))
+        self.assertTrue(background.is_alive())
+        self.assertEqual([record.levelno for record in self.handler.records], [logging.WARNING])
+        # once the disk comes back, the records are written after all
+        stuck.released.set()
+        background.join(1.0)
+        self.assertEqual(len(telemetry.read_telemetry(self.path)[1]), 3)
+        self.assertTrue(background.close())
+
+    def test_fsync_policy(self):
+        stuck = StuckWriter(self.writer)
+        stuck.released.set()
+        background = logwriter.AsyncTelemetryWriter(stuck, commit_records=2, fsync=logwriter.FSYNC_COMMIT)
+        background.start()
+        self.write(background, 4)
+        background.close()
+        self.assertTrue(all(stuck.syncs))
+        stuck = StuckWriter(telemetry.TelemetryWriter(self.path, self.start))
+        stuck.released.set()
+        background = logwriter.AsyncTelemetryWriter(stuck, commit_records=2, fsync=logwriter.FSYNC_CLOSE)
+        background.start()
+        self.write(background, 4)
+        background.close()
+        self.assertEqual(stuck.syncs, [False, False, True])
+
+    def test_closed_without_starting(self):
+        background = logwriter.AsyncTelemetryWriter(self.writer)
+        self.write(background, 2)
+        background.close()
+        self.assertEqual(len(telemetry.read_telemetry(self.path)[1]), 2)
@@ -0,0 +1,24 @@
+import unittest
+from backend.api.rpidapi.lru import LRUCache
+
+
+class LRUCacheTests(unittest.TestCase):
+    def test_remembers_values(self):
+        cache = LRUCache(2)
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+        self.assertEqual(cache.get("a", compute), 1)
+        self.assertEqual(cache.get("a", compute), 1)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_forgets_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.get("a", lambda: 1)
+        cache.get("b", lambda: 2)
+        # using "a" makes "b" the least recently used
+        cache.get("a", lambda: None)
+        cache.get("c", lambda: 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a", lambda: None), 1)
+        self.assertEqual(cache.get("b", lambda: "recomputed"), "recomputed")
@@ -0,0 +1,118 @@
+import shutil
+import tempfile
+import unittest
+from backend.api.rpidapi import prometheus
+from backend.device import clock, heater, metrics, mock, plant, runner, thermometer
+
+DRIVER = {"name": "test", "kp": 8.0, "ki": 0.05, "kd": 10.0, "max_accumulated_error": 500.0,
+          "min_accumulated_error": -500.0}
+
+
+class FakeTimer(object):
+    def __init__(self, *times):
+        self.times = list(times)
+
+    def __call__(self):
+        return self.times.pop(0)
+
+
+class RollingSummaryTests(unittest.TestCase):
+    def test_empty(self):
+        summary = metrics.RollingSummary(10).summary()
+        self.assertEqual(summary, {"count": 0, "sum": 0.0, "max": None, "p50": None, "p99": None})
+
+    def test_percentiles(self):
+        summary = metrics.RollingSummary(100)
+        for value in range(100, 0, -1):
+            summary.add(float(value))
+        result = summary.summary()
+        self.assertEqual(result["p50"], 51.0)
+        self.assertEqual(result["p99"], 100.0)
+        self.assertEqual(result["max"], 100.0)
+        self.assertEqual(result["count"], 100)
+        self.assertEqual(result["sum"], 5050.0)
+
+    def test_only_recent_values_are_summarized(self):
+        summary = metrics.RollingSummary(3)
+        for value in (100.0, 1.0, 2.0, 3.0):
+            summary.add(value)
+        self.assertEqual(sorted(summary.recent), [1.0, 2.0, 3.0])
+        self.assertEqual(summary.summary()["max"], 3.0)
+        # but the count and sum cover everything
+        self.assertEqual(summary.count, 4)
+        self.assertEqual(summary.total, 106.0)
+
+
+class MetricsTests(unittest.TestCase):
+    def test_laps(self):
+        run_metrics = metrics.Metrics(timer=FakeTimer(10.0, 10.5, 12.0, 12.25))
+        run_metrics.begin()
+        run_metrics.lap("thermometer")
+        run_metrics.lap("pid")
+        run_metrics.end()
+        snapshot = run_metrics.snapshot()
+        self.assertEqual(snapshot["thermometer:max"], 0.5)
+        self.assertEqual(snapshot["pid:p50"], 1.5)
+        self.assertEqual(snapshot["tick:sum"], 2.25)
+        self.assertEqual(snapshot["tick:count"], 1)
+
+    def test_counters(self):
+        run_metrics = metrics.Metrics()
+        run_metrics.count("overruns")
+        run_metrics.count("overruns", 2)
+        run_metrics.count("overruns", 0)
+        run_metrics.set_counter("sensor_rejections", 7)
+        self.assertEqual(run_metrics.snapshot(), {"counter:overruns": 3, "counter:sensor_rejections": 7})
+
+
+class RunnerMetricsTests(unittest.TestCase):
+    def test_publishes_metrics(self):
+        directory = tempfile.mkdtemp()
+        virtual_clock = clock.VirtualClock()
+        block = plant.ThermalPlant(virtual_clock)
+        api_interface = mock.MockAPIInterface({"1": {"mode": "set", "temperature": 40.0, "duration": 30}}, DRIVER,
+                                              virtual_clock)
+        program_runner = runner.ProgramRunner(api_interface, thermometer.Thermometer(plant.PlantSensor(block)),
+                                              heater.Heater(mock.MockGPIO, clock=virtual_clock,
+                                                            engine_factory=lambda: block),
+                                              log_dir=directory, clock=virtual_clock, build_pyramids=False)
+        try:
+            program_runner.start()
+            program_runner.run_loop()
+        finally:
+            shutil.rmtree(directory)
+        published = api_interface.metrics
+        for phase in ("program", "thermometer", "pid", "log", "heater", "publish", "tick"):
+            self.assertGreaterEqual(published["%s:count" % phase], 30)
+            self.assertGreaterEqual(published["%s:max" % phase], 0.0)
+        self.assertEqual(published["counter:thermometer_retries"], 0)
+        # a plain Thermometer doesn't filter its readings, so it never rejects any
+        self.assertNotIn("counter:sensor_rejections", published)
+
+
+class PrometheusTests(unittest.TestCase):
+    def test_render(self):
+        text = prometheus.render({None: {"tick:p50": 0.001, "tick:p99": 0.004, "tick:max": 0.005, "tick:sum": 2.0,
+                                         "tick:count": 1000.0, "counter:overruns": 2.0, "time": 90.0},
+                                  "a": {"pid:p50": 0.0001, "time": 100.0},
+                                  "b": {}}, now=100.0)
+        lines = text.splitlines()
+        self.assertIn('piwarmer_tick_phase_seconds{phase="tick",quantile="0.99"} 0.004', lines)
+        self.assertIn('piwarmer_tick_phase_seconds{channel="a",phase="pid",quantile="0.5"} 0.0001', lines)
+        self.assertIn('piwarmer_tick_phase_seconds_count{phase="tick"} 1000.0', lines)
+        self.assertIn('piwarmer_tick_phase_max_seconds{phase="tick"} 0.005', lines)
+        self.assertIn('piwarmer_overruns_total 2.0', lines)
+        self.assertIn('piwarmer_metrics_age_seconds 10.0', lines)
+        self.assertIn('piwarmer_metrics_age_seconds{channel="a"} 0.0', lines)
+        self.assertIn("# TYPE piwarmer_tick_phase_seconds summary", lines)
+        # the parts of a summary are all described once, by the summary itself
+        self.assertEqual(len([line for line in lines if line.startswith("# TYPE")]), 4)
+        self.assertNotIn('channel="b"', text)
+
+    def test_counters_are_described(self):
+        lines = prometheus.render({None: {"counter:telemetry_dropped": 3.0}}).splitlines()
+        self.assertIn("# HELP piwarmer_telemetry_dropped_total %s" % prometheus.COUNTERS["telemetry_dropped"], lines)
+        self.assertIn("piwarmer_telemetry_dropped_total 3.0", lines)
+
+    def test_nothing_published(self):
+        self.assertEqual(prometheus.render({None: {}}), "\n")
@@ -1,5 +1,6 @@
+import random
 import unittest
-from backend.device.pid import PID, Driver
+from backend.device.pid import BatchPID, PID, Driver
 
 
 class PIDTests(unittest.TestCase):
@@ -8,7 +9,7 @@ class PIDTests(unittest.TestCase):
         self.pid = PID(driver, memory=6)
 
     def test_calculate_derivative_default_values(self):
-        d = self.pid._calculate_derivative(1.0, self.pid._past_errors)
+        d = self.pid._calculate_derivative(1.0, self.pid.past_errors)
         self.assertEqual(d, 0.0)
 
     def test_calculate_derivative_some_values(self):
@@ -22,3 +23,69 @@ class PIDTests(unittest.TestCase):
     def test_negative_derivative(self):
         d = self.pid._calculate_derivative(1.0, [12.0, 10.0, 8.0, 6.0, 4.0, 2.0])
         self.assertAlmostEqual(d, -2.0)
+
+    def test_derivative_scaled_by_dt(self):
+        d = self.pid._calculate_derivative(1.0, [2.0, 4.0, 6.0, 8.0, 10.0, 12.0], 2.0)
+        self.assertAlmostEqual(d, 1.0)
+
+    def test_integral_scaled_by_dt(self):
+        self.assertAlmostEqual(self.pid._calculate_integral(2.0, 1.0, 0.5), 2.0)
+        self.assertAlmostEqual(self.pid._calculate_integral(8.0, 1.0, 2.0), 10.0)
+
+
+class Cycle(object):
+    def __init__(self, target_temperature, current_temperature, accumulated_error):
+        self.target_temperature = target_temperature
+        self.current_temperature = current_temperature
+        self.accumulated_error = accumulated_error
+
+
+class BatchPIDTests(unittest.TestCase):
+    DRIVERS = [Driver('a', 8.0, 0.05, 20.0, 500.0, -500.0),
+               Driver('b', 1.0, 1.0, 1.0, 10.0, -10.0),
+               Driver('c', 30.0, 2.0, -5.0, 3.0, -1.0)]
+
+    def setUp(self):
+        self.rng = random.Random(0)
+
+    def compare(self, batch, pids, indexes, dts):
+        targets = [self.rng.uniform(20.0, 90.0) for _ in indexes]
+        measurements = [self.rng.uniform(20.0, 90.0) for _ in indexes]
+        duty_cycles, integrals = batch.update(targets, measurements, dts, indexes)
+        for i, index in enumerate(indexes):
+            duty_cycle, integral = pids[index].update(Cycle(targets[i], measurements[i], self.accumulated[index]), dts[i])
+            self.accumulated[index] = integral
+            self.assertEqual(duty_cycles[i], duty_cycle)
+            self.assertAlmostEqual(integrals[i], integral)
+
+    def test_matches_pid(self):
+        batch = BatchPID(self.DRIVERS, memory=5)
+        pids = [PID(driver, memory=5) for driver in self.DRIVERS]
+        self.accumulated = [0.0] * len(pids)
+        for _ in range(200):
+            dts = [self.rng.uniform(0.5, 2.0) for _ in pids]
+            self.compare(batch, pids, range(len(pids)), dts)
+
+    def test_matches_pid_for_some_controllers(self):
+        batch = BatchPID(self.DRIVERS)
+        pids = [PID(driver) for driver in self.DRIVERS]
+        self.accumulated = [0.0] * len(pids)
+        for tick in range(100):
+            indexes = [0, 2] if tick % 3 else [1]
+            self.compare(batch, pids, indexes, [1.0] * len(indexes))
+
+    def test_clamping(self):
+        batch = BatchPID(self.DRIVERS[1:2])
+        duty_cycles, integrals = batch.update([100.0], [20.0], 1.0)
+        self.assertEqual((duty_cycles[0], integrals[0]), (100, 10.0))
+        duty_cycles, integrals = batch.update([20.0], [100.0], 1.0)
+        self.assertEqual((duty_cycles[0], integrals[0]), (0, -10.0))
+
+    def test_reset(self):
+        batch = BatchPID(self.DRIVERS[1:2])
+        batch.update([30.0], [20.0], 1.0)
+        batch.reset(0, accumulated_error=2.0)
+        duty_cycles, integrals = batch.update([21.0], [20.0], 1.0)
+        self.assertEqual(integrals[0], 3.0)
+        pid = PID(self.DRIVERS[1])
+        self.assertEqual(duty_cycles[0], pid.update(Cycle(21.0, 20.0, 2.0), 1.0)[0])
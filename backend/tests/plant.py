@@ -0,0 +1,44 @@
+import math
+import unittest
+from backend.device.clock import VirtualClock
+from backend.device.plant import ThermalPlant, PlantSensor
+
+
+class ThermalPlantTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.plant = ThermalPlant(self.clock, gain=50.0, time_constant=100.0, dead_time=10.0, ambient=20.0)
+
+    def test_starts_at_ambient(self):
+        self.assertEqual(self.plant.temperature, 20.0)
+
+    def test_dead_time(self):
+        self.plant.set_duty(100)
+        self.clock.sleep(10.0)
+        self.assertAlmostEqual(self.plant.temperature, 20.0)
+
+    def test_time_constant(self):
+        self.plant.set_duty(100)
+        self.clock.sleep(110.0)
+        self.assertAlmostEqual(self.plant.temperature, 70.0 - 50.0 * math.exp(-1.0))
+
+    def test_independent_of_read_rate(self):
+        other = ThermalPlant(self.clock, gain=50.0, time_constant=100.0, dead_time=10.0, ambient=20.0)
+        self.plant.set_duty(60)
+        other.set_duty(60)
+        for _ in range(300):
+            self.clock.sleep(1.0)
+            other.temperature
+        self.assertAlmostEqual(self.plant.temperature, other.temperature)
+
+    def test_cools_to_ambient(self):
+        self.plant.set_duty(100)
+        self.clock.sleep(1000.0)
+        self.plant.set_duty(0)
+        self.clock.sleep(5000.0)
+        self.assertAlmostEqual(self.plant.temperature, 20.0)
+
+    def test_sensor_noise_is_repeatable(self):
+        first = PlantSensor(self.plant, noise=0.5, seed=3)
+        second = PlantSensor(self.plant, noise=0.5, seed=3)
+        self.assertEqual([first.readTempC() for _ in range(5)], [second.readTempC() for _ in range(5)])
@@ -1,7 +1,9 @@
+import json
 import unittest
 from backend.device.cycle import CurrentCycle
 from backend.device.program import TemperatureProgram, TemperatureSetting
 from datetime import datetime
+from interface import programs
 
 
 class LinearGradientTests(unittest.TestCase):
@@ -74,3 +76,130 @@ class TemperatureProgramTests(unittest.TestCase):
         self.rd.current_time = datetime(2012, 12, 12, 12, 15, 42)
         self.rd.start_time = datetime(2012, 12, 12, 12, 10, 12)
         self.assertAlmostEqual(self.rd.target_temperature, 79.583333333)
+
+
+class CompiledScheduleTests(unittest.TestCase):
+    def setUp(self):
+        self.program = TemperatureProgram({
+              "1": {"mode": "set", "temperature": 80.0, "duration": 300},
+              "2": {"mode": "linear", "start_temperature": 80.0, "end_temperature": 30.0, "duration": 3600}})
+
+    def test_lookup_boundaries(self):
+        self.assertEqual(self.program.schedule.lookup(0).setting.index, 1)
+        self.assertEqual(self.program.schedule.lookup(299.9).setting.index, 1)
+        self.assertEqual(self.program.schedule.lookup(300).setting.index, 2)
+        self.assertEqual(self.program.schedule.lookup(300).target_temperature, 80.0)
+
+    def test_lookup_program_over(self):
+        self.assertIsNone(self.program.schedule.lookup(3900))
+        self.assertIsNone(self.program.schedule.lookup(-1))
+
+    def test_steps_in_order(self):
+        self.assertEqual([(start, stop) for start, stop, setting in self.program.schedule],
+                         [(0.0, 300.0), (300.0, 3900.0)])
+
+    def test_many_steps(self):
+        steps = {str(i): {"mode": "set", "temperature": 20.0 + i % 50, "duration": 30} for i in range(1, 5001)}
+        program = TemperatureProgram(steps)
+        self.assertEqual(program.schedule.lookup(30 * 4321 + 12).setting.index, 4322)
+        self.assertEqual(program.schedule.lookup(30 * 4321 + 12).target_temperature, 20.0 + 4322 % 50)
+
+    def test_current_step_over(self):
+        rd = CurrentCycle()
+        rd.program = self.program
+        rd.start_time = datetime(2012, 12, 12, 12, 10, 12)
+        rd.current_time = datetime(2012, 12, 12, 14, 10, 12)
+        self.assertIsNone(rd.current_step)
+        self.assertIsNone(rd.target_temperature)
+
+
+class CompiledProgramTests(unittest.TestCase):
+    STEPS = {"1": {"mode": "set", "temperature": 80.0, "duration": "5:00"},
+             "2": {"mode": "linear", "start_temperature": 80.0, "end_temperature": 30.0, "duration": 3600},
+             "3": {"mode": "hold", "temperature": 37.0}}
+
+    def test_from_compiled_matches_steps(self):
+        compiled = json.loads(json.dumps(programs.compile_steps(self.STEPS)))
+        from_steps = TemperatureProgram(self.STEPS)
+        from_compiled = TemperatureProgram.from_compiled(compiled)
+        self.assertEqual(from_compiled.total_duration, from_steps.total_duration)
+        self.assertEqual(from_compiled.content_hash, from_steps.content_hash)
+        for seconds in (0, 299, 300, 2000, 3900, 10 ** 6):
+            self.assertEqual(from_compiled.schedule.lookup(seconds).target_temperature,
+                             from_steps.schedule.lookup(seconds).target_temperature)
+
+    def test_rejects_other_versions(self):
+        for version in (programs.VERSION - 1, programs.VERSION + 1, None):
+            compiled = dict(programs.compile_steps(self.STEPS), version=version)
+            self.assertRaises(programs.ProgramError, TemperatureProgram.from_compiled, compiled)
+
+    def test_target_temperatures_match_lookup(self):
+        import numpy as np
+        program = TemperatureProgram(self.STEPS)
+        times = np.array([0.0, 150.0, 299.9, 300.0, 1000.0, 3899.0, 3900.0, 10.0 ** 6])
+        targets = program.target_temperatures(times)
+        for seconds, target in zip(times, targets):
+            self.assertAlmostEqual(target, program.schedule.lookup(seconds).target_temperature)
+
+    def test_target_temperatures_after_program_is_over(self):
+        import numpy as np
+        steps = {"1": {"mode": "linear", "start_temperature": 20.0, "end_temperature": 40.0, "duration": 100}}
+        program = TemperatureProgram(steps)
+        self.assertFalse(program.has_hold)
+        targets = program.target_temperatures(np.array([-1.0, 0.0, 50.0, 100.0, 200.0]))
+        self.assertTrue(np.isnan(targets[0]))
+        self.assertEqual(targets[1:3].tolist(), [20.0, 30.0])
+        self.assertTrue(np.isnan(targets[3:]).all())
+
+
+class RepeatTests(unittest.TestCase):
+    # a thermocycling protocol: 95C for 30s, 55C for 30s, then 72C rising to 74C over 60s, forty times over
+    CYCLE = {"1": {"mode": "set", "temperature": 95.0, "duration": 30},
+             "2": {"mode": "set", "temperature": 55.0, "duration": 30},
+             "3": {"mode": "linear", "start_temperature": 72.0, "end_temperature": 74.0, "duration": 60}}
+
+    def setUp(self):
+        self.program = TemperatureProgram({"1": {"mode": "set", "temperature": 98.0, "duration": 120},
+                                           "2": {"mode": "repeat", "count": 40, "steps": self.CYCLE},
+                                           "3": {"mode": "hold", "temperature": 4.0}})
+
+    def test_duration(self):
+        self.assertEqual(self.program.total_duration, 120.0 + 40 * 120.0)
+
+    def test_compact(self):
+        self.assertEqual(len(self.program.schedule), 3)
+
+    def test_lookup(self):
+        step = self.program.schedule.lookup(120 + 7 * 120 + 45)
+        self.assertEqual((step.start, step.stop), (120 + 7 * 120 + 30, 120 + 7 * 120 + 60))
+        self.assertEqual(step.target_temperature, 55.0)
+        self.assertEqual(step.setting.index, 2)
+        self.assertEqual(step.index, 2)
+        self.assertEqual(self.program.schedule.lookup(120 + 39 * 120 + 90).target_temperature, 73.0)
+        self.assertEqual(self.program.schedule.lookup(120 + 40 * 120).target_temperature, 4.0)
+        self.assertEqual(self.program.schedule.lookup(60).index, 1)
+
+    def test_nested(self):
+        program = TemperatureProgram({"1": {"mode": "repeat", "count": 10000, "steps": {
+            "1": {"mode": "repeat", "count": 3, "steps": self.CYCLE},
+            "2": {"mode": "set", "temperature": 20.0, "duration": 10}}}})
+        self.assertEqual(program.total_duration, 10000 * 370.0)
+        self.assertEqual(program.schedule.lookup(9999 * 370 + 2 * 120 + 45).target_temperature, 55.0)
+        self.assertEqual(program.schedule.lookup(9999 * 370 + 365).target_temperature, 20.0)
+        self.assertIsNone(program.schedule.lookup(10000 * 370))
+
+    def test_target_temperatures_match_lookup(self):
+        import numpy as np
+        times = np.arange(-10.0, self.program.total_duration + 100.0, 7.5)
+        targets = self.program.target_temperatures(times)
+        for seconds, target in zip(times, targets):
+            step = self.program.schedule.lookup(seconds)
+            self.assertAlmostEqual(target, step.target_temperature)
+
+    def test_current_step(self):
+        rd = CurrentCycle()
+        rd.program = self.program
+        rd.start_time = datetime(2012, 12, 12, 12, 0, 0)
+        rd.current_time = datetime(2012, 12, 12, 12, 4, 10)
+        self.assertEqual(rd.current_step, 2)
+        self.assertEqual(rd.step_time_remaining, 20)
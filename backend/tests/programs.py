@@ -0,0 +1,92 @@
+import json
+import unittest
+from interface import programs
+
+STEPS = {"1": {"mode": "set", "temperature": 80.0, "duration": "1:30"},
+         "2": {"mode": "linear", "start_temperature": 80.0, "end_temperature": 30.0, "duration": 600},
+         "3": {"mode": "hold", "temperature": 37.0}}
+
+
+class ParseDurationTests(unittest.TestCase):
+    def test_formats(self):
+        self.assertEqual(programs.parse_duration(90), 90.0)
+        self.assertEqual(programs.parse_duration(1.5), 1.5)
+        self.assertEqual(programs.parse_duration("90"), 90.0)
+        self.assertEqual(programs.parse_duration("1:30"), 90.0)
+        self.assertEqual(programs.parse_duration(u"1:00:30"), 3630.0)
+
+    def test_invalid(self):
+        for value in ("", "1:2:3:4", "1:-30", "ten", 0, -5, True, None):
+            self.assertRaises(programs.ProgramError, programs.parse_duration, value)
+
+
+class CompileStepsTests(unittest.TestCase):
+    def test_compile(self):
+        compiled = programs.compile_steps(STEPS)
+        self.assertEqual(compiled["version"], programs.VERSION)
+        self.assertEqual(compiled["settings"], [[1, 0.0, 90.0, 80.0, 80.0],
+                                                [2, 90.0, 690.0, 80.0, 30.0],
+                                                [3, 690.0, None, 37.0, 37.0]])
+        self.assertEqual(compiled["total_duration"], 690.0)
+        # the compiled form has to survive being stored as JSON
+        self.assertEqual(json.loads(json.dumps(compiled)), compiled)
+
+    def test_accepts_json(self):
+        self.assertEqual(programs.compile_steps(json.dumps(STEPS)), programs.compile_steps(STEPS))
+
+    def test_orders_by_number(self):
+        steps = {"10": {"mode": "set", "temperature": 40, "duration": 10},
+                 "2": {"mode": "set", "temperature": 20, "duration": 10}}
+        self.assertEqual([setting[0] for setting in programs.compile_steps(steps)["settings"]], [2, 10])
+
+    def test_ignores_steps_after_hold(self):
+        steps = {"1": {"mode": "hold", "temperature": 37}, "2": {"mode": "set", "temperature": 20, "duration": 10}}
+        self.assertEqual(len(programs.compile_steps(steps)["settings"]), 1)
+
+    def test_defaults(self):
+        compiled = programs.compile_steps({"1": {"mode": "set"}})
+        self.assertEqual(compiled["settings"], [[1, 0.0, 60.0, 25.0, 25.0]])
+
+    def test_hash_depends_on_behaviour_only(self):
+        same = dict(STEPS, **{"1": {"mode": "set", "temperature": 80, "duration": 90}})
+        different = dict(STEPS, **{"1": {"mode": "set", "temperature": 81, "duration": 90}})
+        self.assertEqual(programs.compile_steps(STEPS)["hash"], programs.compile_steps(same)["hash"])
+        self.assertNotEqual(programs.compile_steps(STEPS)["hash"], programs.compile_steps(different)["hash"])
+
+    def test_invalid(self):
+        for steps in ("not json",
+                      [],
+                      {"one": {"mode": "set"}},
+                      {"1": "set"},
+                      {"1": {"mode": "boil"}},
+                      {"1": {"temperature": 37}},
+                      {"1": {"mode": "set", "temp": 37}},
+                      {"1": {"mode": "set", "temperature": "warm"}},
+                      {"1": {"mode": "hold", "temperature": float('nan')}},
+                      {"1": {"mode": "linear", "start_temperature": 20, "end_temperature": 30, "duration": 0}}):
+            self.assertRaises(programs.ProgramError, programs.compile_steps, steps)
+
+    def test_repeat(self):
+        steps = {"1": {"mode": "set", "temperature": 95, "duration": 180},
+                 "2": {"mode": "repeat", "count": 40, "steps": {
+                     "1": {"mode": "set", "temperature": 95, "duration": 30},
+                     "2": {"mode": "repeat", "count": 2, "steps": {
+                         "1": {"mode": "set", "temperature": 55, "duration": 15}}}}},
+                 "3": {"mode": "hold", "temperature": 4}}
+        compiled = programs.compile_steps(steps)
+        self.assertEqual(compiled["total_duration"], 180.0 + 40 * 60.0)
+        repeat = compiled["settings"][1]
+        self.assertEqual((repeat["start"], repeat["stop"], repeat["count"], repeat["period"]), (180.0, 2580.0, 40, 60.0))
+        self.assertEqual(repeat["settings"][0], [1, 0.0, 30.0, 95.0, 95.0])
+        self.assertEqual(repeat["settings"][1]["settings"], [[1, 0.0, 15.0, 55.0, 55.0]])
+        self.assertEqual(compiled["settings"][2], [3, 2580.0, None, 4.0, 4.0])
+
+    def test_invalid_repeats(self):
+        set_step = {"mode": "set", "temperature": 37, "duration": 10}
+        for repeat in ({"mode": "repeat", "count": 0, "steps": {"1": set_step}},
+                       {"mode": "repeat", "count": 2.5, "steps": {"1": set_step}},
+                       {"mode": "repeat", "count": True, "steps": {"1": set_step}},
+                       {"mode": "repeat", "count": 2},
+                       {"mode": "repeat", "count": 2, "steps": [set_step]},
+                       {"mode": "repeat", "count": 2, "steps": {"1": {"mode": "hold", "temperature": 37}}}):
+            self.assertRaises(programs.ProgramError, programs.compile_steps, {"1": repeat})
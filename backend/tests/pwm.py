@@ -0,0 +1,99 @@
+import threading
+import time
+import unittest
+from backend.device.heater import Heater
+from backend.device.pwm import PWMEngine
+
+
+class RecordingGPIO(object):
+    OUT = 'OUT'
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self):
+        self.states = []
+        self.lock = threading.Lock()
+
+    def setup(self, pin, state):
+        pass
+
+    def output(self, pin, state):
+        with self.lock:
+            self.states.append((pin, state))
+
+
+class PWMEngineTests(unittest.TestCase):
+    def test_sigma_delta_averages_fractional_duty(self):
+        gpio = RecordingGPIO()
+        engine = PWMEngine(gpio, 16, frequency=1000.0, mode=PWMEngine.SIGMA_DELTA)
+        engine.set_duty(12.5)
+        # drive the periods by hand so the test doesn't depend on timing
+        engine._period = 0.0
+        for _ in range(800):
+            engine._run_sigma_delta_period()
+        self.assertEqual(sum(state for pin, state in gpio.states), 100)
+
+    def test_stop_leaves_pin_low(self):
+        gpio = RecordingGPIO()
+        engine = PWMEngine(gpio, 16, frequency=10.0)
+        engine.set_duty(100)
+        engine.start()
+        time.sleep(0.05)
+        engine.stop()
+        self.assertFalse(engine.is_alive())
+        self.assertEqual(gpio.states[-1], (16, 0))
+
+    def wait_for_state(self, gpio, state, timeout=0.5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with gpio.lock:
+                if gpio.states and gpio.states[-1] == (16, state):
+                    return True
+            time.sleep(0.005)
+        return False
+
+    def test_pwm_duty_changes_partway_through_a_period(self):
+        gpio = RecordingGPIO()
+        engine = PWMEngine(gpio, 16, frequency=0.5)
+        engine.set_duty(100)
+        engine.start()
+        try:
+            self.assertTrue(self.wait_for_state(gpio, 1))
+            # the pulse is cut short straight away, not at the end of the two second period
+            engine.set_duty(0)
+            self.assertEqual(gpio.states[-1], (16, 0))
+            self.assertTrue(self.wait_for_state(gpio, 0))
+            # and lengthened again
+            engine.set_duty(100)
+            self.assertTrue(self.wait_for_state(gpio, 1))
+            # the pulse has already lasted longer than 1% of the period, so it ends now
+            engine.set_duty(1)
+            self.assertTrue(self.wait_for_state(gpio, 0))
+        finally:
+            engine.stop()
+
+    def test_watchdog_turns_the_heater_off(self):
+        gpio = RecordingGPIO()
+        engine = PWMEngine(gpio, 16, frequency=50.0, watchdog=0.1)
+        engine.set_duty(100)
+        engine.start()
+        try:
+            self.assertTrue(self.wait_for_state(gpio, 1))
+            # as if the control loop had hung
+            self.assertTrue(self.wait_for_state(gpio, 0))
+            self.assertEqual(engine.duty, 0.0)
+            time.sleep(0.05)
+            self.assertEqual(gpio.states[-1], (16, 0))
+        finally:
+            engine.stop()
+
+    def test_set_duty_does_not_block(self):
+        gpio = RecordingGPIO()
+        heater = Heater(gpio, frequency=1.0)
+        start = time.time()
+        heater.set_duty(50)
+        heater.set_duty(70)
+        self.assertLess(time.time() - start, 0.1)
+        self.assertEqual(heater._engine.duty, 70.0)
+        heater.disable()
+        self.assertIsNone(heater._engine)
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+import math
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+from interface import pyramid, telemetry
+
+
+class PyramidTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "temperature-run" + telemetry.EXTENSION)
+        start = datetime(2016, 1, 1)
+        writer = telemetry.TelemetryWriter(self.path, start)
+        # two readings per second for 25 minutes, with the target missing for the first ten seconds
+        for i in range(3000):
+            writer.write(start + timedelta(seconds=i * 0.5), 20.0 + i, None if i < 20 else 37.0, i % 100, 0, 0.0)
+        writer.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_build(self):
+        path = pyramid.build(self.path)
+        self.assertEqual(path, os.path.join(self.directory, "temperature-run" + pyramid.EXTENSION))
+        self.assertFalse(os.path.exists(path + ".tmp"))
+        seconds = pyramid.read_level(path, 1)
+        self.assertEqual(len(seconds), 1500)
+        self.assertEqual(seconds["count"][0], 2)
+        self.assertEqual(seconds["measured_min"][1], 22.0)
+        self.assertEqual(seconds["measured_max"][1], 23.0)
+        self.assertEqual(seconds["measured_mean"][1], 22.5)
+        self.assertTrue(math.isnan(seconds["target_mean"][0]))
+        ten_minutes = pyramid.read_level(path, 600)
+        self.assertEqual(list(ten_minutes["time"]), [0.0, 600.0, 1200.0])
+        self.assertEqual(list(ten_minutes["count"]), [1200, 1200, 600])
+        self.assertEqual(ten_minutes["duty_max"][0], 99.0)
+        self.assertEqual(ten_minutes["target_min"][0], 37.0)
+
+    def test_read_range(self):
+        path = pyramid.build(self.path)
+        minutes = pyramid.read_level(path, 60, start=90.0, end=200.0)
+        # the bucket that starts at 60 seconds holds the start of the range
+        self.assertEqual(list(minutes["time"]), [60.0, 120.0, 180.0])
+
+    def test_levels_are_memory_mapped(self):
+        path = pyramid.build(self.path)
+        self.assertEqual(sorted(os.listdir(path)), sorted("level_%d.npy" % width for width in pyramid.LEVELS))
+        self.assertIsInstance(pyramid.read_level(path, 10, start=100.0, end=120.0), np.memmap)
+        # building it again replaces it
+        self.assertEqual(pyramid.build(self.path), path)
+        self.assertEqual(len(pyramid.read_level(path, 600)), 3)
+
+    def test_choose_level(self):
+        self.assertEqual(pyramid.choose_level(500, 1000), 1)
+        self.assertEqual(pyramid.choose_level(5000, 1000), 10)
+        self.assertEqual(pyramid.choose_level(50000, 1000), 60)
+        self.assertEqual(pyramid.choose_level(10 ** 7, 1000), 600)
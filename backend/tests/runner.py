@@ -0,0 +1,247 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from backend.device import clock, heater, mock, plant, runner, simulator, thermometer
+
+DRIVER = {"name": "test", "kp": 8.0, "ki": 0.05, "kd": 20.0,
+          "max_accumulated_error": 500.0, "min_accumulated_error": -500.0}
+
+
+class UnpluggedThermometer(object):
+    def __init__(self):
+        self.plugged_in = False
+
+    @property
+    def current_temperature(self):
+        if not self.plugged_in:
+            raise thermometer.SensorUnavailable("No believable temperature reading in the last 5.0 seconds")
+        return 25.0
+
+
+class StartingThermometer(object):
+    """
+    Starts the program the first time it's read, without the start command ever reaching the runner.
+
+    """
+    def __init__(self, api_interface):
+        self._api_interface = api_interface
+
+    @property
+    def current_temperature(self):
+        self._api_interface.active = True
+        return 25.0
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class IdleTemperatureTests(unittest.TestCase):
+    def test_unavailable_thermometer_is_logged_once(self):
+        virtual_clock = clock.VirtualClock()
+        api_interface = mock.MockAPIInterface({}, DRIVER, virtual_clock)
+        probe = UnpluggedThermometer()
+        program_runner = runner.ProgramRunner(api_interface, probe, heater.Heater(mock.MockGPIO),
+                                              log_dir=tempfile.gettempdir(), clock=virtual_clock)
+        handler = RecordingHandler()
+        runner.log.addHandler(handler)
+        level = runner.log.level
+        runner.log.setLevel(logging.INFO)
+        try:
+            for _ in range(5):
+                program_runner.publish_temperature()
+            self.assertIsNone(api_interface.current_temp)
+            probe.plugged_in = True
+            program_runner.publish_temperature()
+            program_runner.publish_temperature()
+        finally:
+            runner.log.removeHandler(handler)
+            runner.log.setLevel(level)
+        self.assertEqual(api_interface.current_temp, 25.0)
+        self.assertEqual([record.levelno for record in handler.records], [logging.ERROR, logging.INFO])
+        self.assertIsNone(handler.records[0].exc_info)
+
+
+class ListenTests(unittest.TestCase):
+    def test_notices_a_missed_start_command(self):
+        virtual_clock = clock.VirtualClock()
+        api_interface = mock.MockAPIInterface({}, DRIVER, virtual_clock)
+        api_interface.active = False
+        program_runner = runner.ProgramRunner(api_interface, StartingThermometer(api_interface),
+                                              heater.Heater(mock.MockGPIO),
+                                              log_dir=tempfile.gettempdir(), clock=virtual_clock)
+        program_runner._listen()
+        self.assertLessEqual(virtual_clock.monotonic(), runner.CONTROL_CHECK_INTERVAL + 1.0)
+
+
+class StepTests(unittest.TestCase):
+    def test_carries_on_while_the_thermometer_is_out(self):
+        virtual_clock = clock.VirtualClock()
+        api_interface = mock.MockAPIInterface({"1": {"mode": "set", "temperature": 40.0, "duration": 600}}, DRIVER,
+                                              virtual_clock)
+        probe = UnpluggedThermometer()
+        probe.plugged_in = True
+        directory = tempfile.mkdtemp()
+        block = plant.ThermalPlant(virtual_clock)
+        program_runner = runner.ProgramRunner(api_interface, probe,
+                                              heater.Heater(mock.MockGPIO, clock=virtual_clock,
+                                                            engine_factory=lambda: block),
+                                              log_dir=directory, clock=virtual_clock, build_pyramids=False)
+
+        def step():
+            program_runner.metrics.begin()
+            stepping = program_runner.step(1.0)
+            program_runner.metrics.end()
+            virtual_clock.sleep(1.0)
+            return stepping
+
+        handler = RecordingHandler()
+        runner.log.addHandler(handler)
+        try:
+            program_runner.start()
+            self.assertTrue(step())
+            self.assertEqual(len(api_interface.history), 1)
+            probe.plugged_in = False
+            for _ in range(5):
+                self.assertTrue(step())
+            self.assertIsNone(api_interface.current_temp)
+            self.assertEqual(block.duty_log[-1][1], 0)
+            # a glitch doesn't end the run
+            probe.plugged_in = True
+            self.assertTrue(step())
+            self.assertEqual(len(api_interface.history), 2)
+            probe.plugged_in = False
+            for _ in range(int(runner.SENSOR_TIMEOUT)):
+                self.assertTrue(step())
+            self.assertFalse(step())
+        finally:
+            runner.log.removeHandler(handler)
+            program_runner.stop()
+            shutil.rmtree(directory)
+        # the thermometer going out is logged once each time, and giving up once
+        self.assertEqual(len([record for record in handler.records if record.levelno == logging.ERROR]), 3)
+
+    def test_steps_through_a_program(self):
+        directory = tempfile.mkdtemp()
+        virtual_clock = clock.VirtualClock()
+        block = plant.ThermalPlant(virtual_clock)
+        api_interface = mock.MockAPIInterface({"1": {"mode": "set", "temperature": 40.0, "duration": 10}}, DRIVER,
+                                              virtual_clock)
+        program_runner = runner.ProgramRunner(api_interface, thermometer.Thermometer(plant.PlantSensor(block)),
+                                              heater.Heater(mock.MockGPIO, clock=virtual_clock,
+                                                            engine_factory=lambda: block),
+                                              log_dir=directory, clock=virtual_clock, build_pyramids=False)
+        try:
+            program_runner.start()
+            self.assertEqual(program_runner.accumulated_error, 0.0)
+            ticks = 0
+            while True:
+                program_runner.metrics.begin()
+                if not program_runner.step(1.0):
+                    break
+                program_runner.metrics.end()
+                ticks += 1
+                virtual_clock.sleep(1.0)
+            program_runner.stop()
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(ticks, 10)
+        self.assertEqual(len(api_interface.history), 10)
+        # the block starts out below the target, so the error has been building up
+        self.assertGreater(program_runner.accumulated_error, 0.0)
+        self.assertGreater(program_runner.pid.past_errors[-1], 0.0)
+
+
+class UndrainedLog(object):
+    """
+    A temperature log that's still being written when the run ends.
+
+    """
+    path = "/logs/temperature-2016-01-01-12-00-00.telemetry"
+
+    def close(self):
+        return False
+
+
+class PyramidTests(unittest.TestCase):
+    def test_not_built_from_a_log_still_being_written(self):
+        built = []
+        build_pyramid = runner._build_pyramid
+        runner._build_pyramid = built.append
+        try:
+            program_runner = runner.ProgramRunner(mock.MockAPIInterface({}, DRIVER, clock.VirtualClock()),
+                                                  UnpluggedThermometer(), heater.Heater(mock.MockGPIO),
+                                                  log_dir=tempfile.gettempdir())
+            program_runner._temperature_log = UndrainedLog()
+            program_runner.stop()
+        finally:
+            runner._build_pyramid = build_pyramid
+        self.assertEqual(built, [])
+        self.assertIsNone(program_runner._temperature_log)
+
+
+class MultiChannelRunnerTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = clock.VirtualClock()
+        self.api_interfaces = {}
+        channels = []
+        for name, temperature, duration in (("a", 40.0, 30), ("b", 50.0, 10)):
+            block = plant.ThermalPlant(self.clock)
+            api_interface = mock.MockAPIInterface({"1": {"mode": "set", "temperature": temperature,
+                                                         "duration": duration}}, DRIVER, self.clock)
+            self.api_interfaces[name] = api_interface
+            channels.append(runner.ProgramRunner(api_interface, thermometer.Thermometer(plant.PlantSensor(block)),
+                                                 heater.Heater(mock.MockGPIO, clock=self.clock,
+                                                               engine_factory=lambda block=block: block),
+                                                 log_dir=self.directory, clock=self.clock, build_pyramids=False,
+                                                 channel=name))
+        self.runner = runner.MultiChannelRunner(channels, period=1.0, clock=self.clock)
+
+    def tearDown(self):
+        # closes the temperature logs of any channels that are still running
+        self.runner.__exit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+    def run_for(self, ticks):
+        for _ in range(ticks):
+            self.runner._tick(1.0)
+            self.clock.sleep(1.0)
+            self.runner._since_control_check += 1.0
+
+    def test_channels_run_independently(self):
+        self.run_for(40)
+        first, second = self.api_interfaces["a"], self.api_interfaces["b"]
+        self.assertEqual(len(first.history), 30)
+        self.assertEqual(len(second.history), 10)
+        self.assertEqual(set(status['target_temp'] for t, status in first.history), {40.0})
+        self.assertEqual(set(status['target_temp'] for t, status in second.history), {50.0})
+        # every channel is stepped in the same tick
+        self.assertEqual([t for t, status in first.history[:10]], [t for t, status in second.history])
+        self.assertFalse(first.active or second.active)
+        self.assertEqual(self.runner._running, [])
+
+    def test_matches_a_lone_runner(self):
+        self.run_for(30)
+        trace = simulator.simulate({"1": {"mode": "set", "temperature": 40.0, "duration": 30}}, DRIVER)
+        self.assertEqual([status['current_temp'] for t, status in self.api_interfaces["a"].history],
+                         trace.temperatures)
+
+    def test_logs_are_named_by_channel(self):
+        self.run_for(1)
+        self.assertEqual(sorted(name.split("-")[1] for name in os.listdir(self.directory)
+                                if name.startswith("temperature-")), ["a", "b"])
+
+    def test_idle_channel_publishes_temperature(self):
+        self.api_interfaces["b"].active = False
+        self.run_for(1)
+        self.assertEqual(len(self.api_interfaces["a"].history), 1)
+        self.assertEqual(self.api_interfaces["b"].history, [])
+        self.assertIsNotNone(self.api_interfaces["b"].current_temp)
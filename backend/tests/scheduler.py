@@ -0,0 +1,47 @@
+import unittest
+from backend.device.scheduler import DeadlineScheduler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class DeadlineSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = DeadlineScheduler(0.5, clock=self.clock.time, sleep=self.clock.sleep)
+        self.scheduler.start()
+
+    def test_work_is_absorbed(self):
+        self.clock.now += 0.2
+        dt = self.scheduler.wait()
+        self.assertAlmostEqual(dt, 0.5)
+        self.assertAlmostEqual(self.clock.now, 100.5)
+        self.assertEqual(self.scheduler.overruns, 0)
+
+    def test_no_drift(self):
+        for _ in range(1000):
+            self.clock.now += 0.1
+            self.scheduler.wait()
+        self.assertAlmostEqual(self.clock.now, 600.0)
+
+    def test_overrun(self):
+        self.clock.now += 1.2
+        dt = self.scheduler.wait()
+        self.assertAlmostEqual(dt, 1.2)
+        self.assertEqual(self.scheduler.overruns, 1)
+        # the next deadline stays aligned with the original schedule
+        self.assertAlmostEqual(self.scheduler.deadline, 101.5)
+
+    def test_interrupted_wait(self):
+        interrupted = DeadlineScheduler(0.5, clock=self.clock.time, sleep=lambda seconds: True)
+        interrupted.start()
+        self.assertIsNone(interrupted.wait())
+        self.assertAlmostEqual(interrupted.deadline, 100.5)
@@ -0,0 +1,22 @@
+import unittest
+from backend.device.simulator import simulate
+
+DRIVER = {"name": "test", "kp": 8.0, "ki": 0.05, "kd": 20.0,
+          "max_accumulated_error": 500.0, "min_accumulated_error": -500.0}
+
+
+class SimulatorTests(unittest.TestCase):
+    def test_runs_program_in_virtual_time(self):
+        trace = simulate({"1": {"mode": "set", "temperature": 50.0, "duration": "1:00:00"}}, DRIVER)
+        self.assertEqual(len(trace.times), 3600)
+        self.assertEqual(trace.times[-1], 3599.0)
+        self.assertAlmostEqual(trace.temperatures[-1], 50.0, delta=2.0)
+
+    def test_hold_needs_max_duration(self):
+        trace = simulate({"1": {"mode": "hold", "temperature": 40.0}}, DRIVER, max_duration=600)
+        self.assertEqual(len(trace.times), 600)
+        self.assertTrue(all(target == 40.0 for target in trace.targets))
+
+    def test_deterministic(self):
+        steps = {"1": {"mode": "set", "temperature": 45.0, "duration": 600}}
+        self.assertEqual(simulate(steps, DRIVER, noise=0.2, seed=1), simulate(steps, DRIVER, noise=0.2, seed=1))
@@ -0,0 +1,215 @@
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import unittest
+from backend.device.commands import CommandListener
+from interface import APIInterface, Command, STATUS_FIELDS, stores
+from interface.main import STATUS_HISTORY, STATUS_HISTORY_LENGTH
+
+
+class LocalStoreTests(object):
+    """
+    What every local store must do, whatever it keeps its state in.
+
+    """
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+
+    def test_strings(self):
+        self.assertIsNone(self.store.get("missing"))
+        self.store.set("active", 1)
+        self.store.set("temperature", 37.5)
+        self.assertEqual(self.store.get("active"), "1")
+        self.assertEqual(self.store.mget("active", "temperature", "missing"), ["1", "37.5", None])
+        self.assertEqual(self.store.mget(["active"]), ["1"])
+        self.assertEqual(self.store.delete("active", "missing"), 1)
+        self.assertIsNone(self.store.get("active"))
+
+    def test_hashes(self):
+        self.assertEqual(self.store.hgetall("status"), {})
+        self.store.hmset("status", {"current_temp": 40.0, "current_step": 2})
+        self.assertEqual(self.store.hset("status", "target_temp", 65), 1)
+        self.assertEqual(self.store.hset("status", "target_temp", 60), 0)
+        self.assertEqual(self.store.hget("status", "target_temp"), "60")
+        self.assertEqual(self.store.hgetall("status"), {"current_temp": "40.0", "current_step": "2",
+                                                        "target_temp": "60"})
+        self.assertEqual(self.store.hdel("status", "current_temp", "missing"), 1)
+        self.assertEqual(sorted(self.store.hgetall("status")), ["current_step", "target_temp"])
+
+    def test_lists(self):
+        for value in range(6):
+            self.store.rpush("history", value)
+        self.assertEqual(self.store.lrange("history", 0, -1), ["0", "1", "2", "3", "4", "5"])
+        self.assertEqual(self.store.lrange("history", -2, -1), ["4", "5"])
+        self.assertEqual(self.store.lrange("history", 1, 2), ["1", "2"])
+        self.store.ltrim("history", -3, -1)
+        self.assertEqual(self.store.lrange("history", 0, -1), ["3", "4", "5"])
+        self.store.ltrim("history", 2, 1)
+        self.assertEqual(self.store.lrange("history", 0, -1), [])
+
+    def test_wrong_type(self):
+        self.store.rpush("history", "a")
+        self.assertRaises(stores.StoreError, self.store.get, "history")
+        self.assertEqual(self.store.mget("history"), [None])
+
+    def test_pipeline(self):
+        pipe = self.store.pipeline(transaction=False)
+        pipe.set("program", "{}")
+        pipe.hmset("status", {"current_temp": 20.0})
+        pipe.get("program")
+        self.assertEqual(pipe.execute(), [True, True, "{}"])
+        self.assertEqual(pipe.execute(), [])
+
+    def test_pubsub(self):
+        self.store.publish("commands", "before")
+        pubsub = self.store.pubsub()
+        pubsub.subscribe("commands")
+        self.assertEqual(pubsub.get_message()["type"], "subscribe")
+        self.assertIsNone(pubsub.get_message())
+        self.store.publish("status", "ignored")
+        self.store.publish("commands", "first")
+        self.store.publish("commands", "second")
+        self.assertEqual([pubsub.get_message(timeout=1.0)["data"] for _ in range(2)], ["first", "second"])
+        self.assertIsNone(pubsub.get_message())
+
+    def test_listen_wakes_up(self):
+        pubsub = self.store.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe("commands")
+        timer = threading.Timer(0.05, self.store.publish, ("commands", "hello"))
+        timer.start()
+        message = next(pubsub.listen())
+        timer.join()
+        self.assertEqual((message["channel"], message["data"]), ("commands", "hello"))
+
+    def test_api_interface(self):
+        api_interface = APIInterface(channel="a", store=self.store)
+        api_interface.program = json.dumps({"1": {"mode": "set", "temperature": 40.0, "duration": 60}})
+        api_interface.activate()
+        self.assertEqual(api_interface.read_controls(), (True, 0))
+        api_interface.publish_status(current_temp=25.0, target_temp=40.0, current_step=1, step_time_remaining=None,
+                                     program_time_remaining=None)
+        status = api_interface.read_status()
+        self.assertEqual(status["current_temp"], "25.0")
+        self.assertIsNone(status["step_time_remaining"])
+        self.assertEqual(status["program"]["1"]["temperature"], 40.0)
+        self.assertEqual([entry["current_temp"] for entry in api_interface.read_status_history()], [25.0])
+        api_interface.publish_metrics({"tick:p50": 0.001})
+        self.assertEqual(api_interface.read_metrics()["tick:p50"], 0.001)
+        # the default channel doesn't see any of it
+        self.assertEqual(APIInterface(store=self.store).read_controls(), (False, 0))
+        api_interface.clear()
+        self.assertEqual(api_interface.read_status(), dict({field: None for field in STATUS_FIELDS}, program={}))
+
+
+class MemoryStoreTests(LocalStoreTests, unittest.TestCase):
+    def make_store(self):
+        return stores.MemoryStore()
+
+    def test_commands_reach_the_controller(self):
+        api_interface = APIInterface(store=self.store)
+        stops = []
+        listener = CommandListener(api_interface, on_stop=lambda: stops.append(True))
+        listener.start()
+        # the listener subscribes in the background, so keep asking until it hears
+        while not listener.wait(0.01):
+            api_interface.deactivate()
+        self.assertEqual(listener.drain()[0]["command"], Command.STOP)
+        self.assertTrue(stops)
+
+
+class MmapStoreTests(LocalStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        super(MmapStoreTests, self).setUp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_store(self, size=stores.MMAP_SIZE):
+        return stores.MmapStore(os.path.join(self.directory, "state"), size=size)
+
+    def test_shared_between_openers(self):
+        # as if another process had opened the same file
+        other = self.make_store()
+        self.store.set("active", 1)
+        self.assertEqual(other.get("active"), "1")
+        other.hset("status", "current_temp", 30)
+        self.assertEqual(self.store.hgetall("status"), {"current_temp": "30"})
+        pubsub = other.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe("status")
+        self.store.publish("status", "hello")
+        self.assertEqual(pubsub.get_message(timeout=1.0)["data"], "hello")
+
+    def test_full(self):
+        shutil.rmtree(self.directory)
+        os.mkdir(self.directory)
+        store = self.make_store(size=256)
+        store.set("small", "x")
+        self.assertRaises(stores.StoreError, store.set, "big", "x" * 1000)
+        # nothing is left half done
+        self.assertIsNone(store.get("big"))
+        self.assertEqual(store.get("small"), "x")
+
+
+    def test_lists_are_not_in_the_state(self):
+        api_interface = APIInterface(store=self.store)
+        for _ in range(STATUS_HISTORY_LENGTH):
+            api_interface.publish_status(current_temp=25.0, target_temp=40.0, current_step=1, step_time_remaining=60,
+                                         program_time_remaining=600)
+        magic, generation, length, log_epoch, log_length = self.store.HEADER.unpack_from(self.store._map, 0)
+        # the status hash and the last few messages, but not the history
+        self.assertLess(length, 20000)
+        self.assertEqual(len(self.make_store().lrange(STATUS_HISTORY, 0, -1)), STATUS_HISTORY_LENGTH)
+
+    def test_lists_shared_between_openers(self):
+        shutil.rmtree(self.directory)
+        os.mkdir(self.directory)
+        other = self.make_store(size=16384)
+        store = self.make_store(size=16384)
+        # far more than fits in the log, so it has to start over several times
+        for value in range(2000):
+            store.rpush("history", value)
+            store.ltrim("history", -10, -1)
+            if value % 97 == 0:
+                self.assertEqual(other.lrange("history", 0, -1), [str(i) for i in range(max(0, value - 9), value + 1)])
+        self.assertEqual(other.lrange("history", 0, -1), [str(i) for i in range(1990, 2000)])
+        other.rpush("history", "x")
+        store.delete("history")
+        self.assertEqual(other.lrange("history", 0, -1), [])
+        other.rpush("history", "y")
+        store.set("history", "z")
+        self.assertEqual(other.get("history"), "z")
+
+    def test_failed_pipeline_leaves_lists_alone(self):
+        other = self.make_store()
+        self.store.rpush("history", "a", "b")
+        pipe = self.store.pipeline()
+        pipe.ltrim("history", 1, -1)
+        pipe.rpush("history", "c")
+        pipe.get("history")
+        self.assertRaises(stores.StoreError, pipe.execute)
+        self.assertEqual(self.store.lrange("history", 0, -1), ["a", "b"])
+        self.assertEqual(other.lrange("history", 0, -1), ["a", "b"])
+
+    def test_not_a_state_file(self):
+        with open(os.path.join(self.directory, "other"), "wb") as f:
+            f.write(struct.pack("<QI", 3, 0) + b"\0" * 4096)
+        store = stores.MmapStore(os.path.join(self.directory, "other"))
+        self.assertRaises(stores.StoreError, store.get, "active")
+
+
+class MakeStoreTests(unittest.TestCase):
+    def test_specs(self):
+        self.assertIsInstance(stores.make_store("memory"), stores.MemoryStore)
+        self.assertIsInstance(stores.make_store("redis"), stores.RedisStore)
+        self.assertRaises(stores.StoreError, stores.make_store, "mmap:")
+        self.assertRaises(stores.StoreError, stores.make_store, "memcached")
+
+    def test_shared(self):
+        self.assertIs(stores.shared_store("memory"), stores.shared_store("memory"))
@@ -0,0 +1,62 @@
+import Queue
+import unittest
+from backend.api.rpidapi.streaming import StatusBroadcaster, StreamLimit
+
+
+class StatusBroadcasterTests(unittest.TestCase):
+    def setUp(self):
+        self.broadcaster = StatusBroadcaster()
+
+    def _listen(self):
+        # listeners are added directly, so that no subscription to Redis is started
+        listener = Queue.Queue(StatusBroadcaster.QUEUE_SIZE)
+        self.broadcaster._listeners.add(listener)
+        return listener
+
+    def test_every_listener_gets_every_message(self):
+        first, second = self._listen(), self._listen()
+        self.broadcaster.broadcast("a")
+        self.broadcaster.broadcast("b")
+        self.assertEqual([first.get_nowait(), first.get_nowait()], ["a", "b"])
+        self.assertEqual([second.get_nowait(), second.get_nowait()], ["a", "b"])
+
+    def test_slow_listener_loses_oldest(self):
+        listener = self._listen()
+        for i in range(StatusBroadcaster.QUEUE_SIZE + 5):
+            self.broadcaster.broadcast(i)
+        self.assertEqual(listener.qsize(), StatusBroadcaster.QUEUE_SIZE)
+        self.assertEqual(listener.get_nowait(), 5)
+
+    def test_unsubscribe(self):
+        listener = self._listen()
+        self.broadcaster.unsubscribe(listener)
+        self.broadcaster.broadcast("a")
+        self.assertTrue(listener.empty())
+
+
+class StreamLimitTests(unittest.TestCase):
+    def test_limit(self):
+        limit = StreamLimit(2)
+        first, second = limit.open(iter("a")), limit.open(iter("b"))
+        self.assertIsNone(limit.open(iter("c")))
+        self.assertEqual(list(first), ["a"])
+        # closing it again doesn't give up another slot
+        first.close()
+        first.close()
+        third = limit.open(iter("c"))
+        self.assertIsNotNone(third)
+        self.assertIsNone(limit.open(iter("d")))
+
+    def test_closes_the_stream(self):
+        closed = []
+
+        def stream():
+            try:
+                yield "a"
+                yield "b"
+            finally:
+                closed.append(True)
+        limited = StreamLimit(1).open(stream())
+        self.assertEqual(next(iter(limited)), "a")
+        limited.close()
+        self.assertEqual(closed, [True])
@@ -0,0 +1,86 @@
+from datetime import datetime
+import math
+import os
+import shutil
+import tempfile
+import unittest
+from interface import telemetry
+
+
+class TelemetryTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "run" + telemetry.EXTENSION)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        writer = telemetry.TelemetryWriter(self.path, datetime(2016, 1, 1, 12, 0, 0))
+        writer.write(datetime(2016, 1, 1, 12, 0, 1), 36.5, 37.0, 45, 2, 1.25)
+        writer.write(datetime(2016, 1, 1, 12, 0, 2), 36.75, None, 40, None, 1.5)
+        writer.close()
+        start_time, records = telemetry.read_telemetry(self.path)
+        self.assertEqual(start_time, 1451649600.0)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(list(records['timestamp']), [1451649601.0, 1451649602.0])
+        self.assertEqual(list(records['measured']), [36.5, 36.75])
+        self.assertEqual(records['step'][0], 2)
+        self.assertEqual(records['step'][1], telemetry.NO_STEP)
+        self.assertTrue(math.isnan(records['target'][1]))
+        self.assertEqual(records['integral'][1], 1.5)
+
+    def test_ignores_partial_record(self):
+        writer = telemetry.TelemetryWriter(self.path, datetime(2016, 1, 1))
+        writer.write(datetime(2016, 1, 1), 36.5, 37.0, 45, 1, 0.0)
+        writer.close()
+        with open(self.path, "ab") as f:
+            f.write(b"\x00" * 7)
+        start_time, records = telemetry.read_telemetry(self.path)
+        self.assertEqual(len(records), 1)
+
+    def test_append(self):
+        writer = telemetry.TelemetryWriter(self.path, datetime(2016, 1, 1))
+        writer.write(datetime(2016, 1, 1), 36.5, 37.0, 45, 1, 0.0)
+        writer.close()
+        with open(self.path, "ab") as f:
+            f.write(b"\x00" * 7)
+        # as if the run were resumed after crashing partway through a record
+        writer = telemetry.TelemetryWriter(self.path, datetime(2016, 1, 1), append=True)
+        writer.write(datetime(2016, 1, 1, 0, 0, 5), 36.75, 37.0, 40, 1, 0.5)
+        writer.close()
+        start_time, records = telemetry.read_telemetry(self.path)
+        self.assertEqual(list(records['duty']), [45.0, 40.0])
+
+    def test_empty(self):
+        telemetry.TelemetryWriter(self.path, datetime(2016, 1, 1)).close()
+        start_time, records = telemetry.read_telemetry(self.path)
+        self.assertEqual(len(records), 0)
+
+    def test_rejects_other_files(self):
+        with open(self.path, "wb") as f:
+            f.write(b"2016-01-01 12:00:00,000\t37.0\t37.0\t40\n")
+        self.assertRaises(telemetry.TelemetryError, telemetry.read_telemetry, self.path)
+
+    def test_convert_legacy_log(self):
+        log_path = os.path.join(self.directory, "temperature-2016.log")
+        with open(log_path, "w") as f:
+            f.write("2016-01-01 12:00:00,250\t36.5\t37.0\t45\n")
+            f.write("2016-01-01 12:00:01,250\t36.75\tNone\t40\n")
+        self.assertEqual(telemetry.convert_legacy_log(log_path, self.path), 2)
+        start_time, records = telemetry.read_telemetry(self.path)
+        self.assertAlmostEqual(records['timestamp'][1] - records['timestamp'][0], 1.0)
+        self.assertEqual(list(records['duty']), [45.0, 40.0])
+        self.assertTrue(math.isnan(records['target'][1]))
+        self.assertTrue(all(step == telemetry.NO_STEP for step in records['step']))
+
+    def test_read_legacy_log(self):
+        log_path = os.path.join(self.directory, "temperature-2016.log")
+        with open(log_path, "w") as f:
+            f.write("2016-01-01 12:00:00,250\t36.5\t37.0\t45\n")
+            f.write("2016-01-01 12:00:01,250\t36.75\tNone\t40\n")
+        start_time, records = telemetry.read_legacy_log(log_path)
+        self.assertEqual(start_time, records['timestamp'][0])
+        self.assertEqual(list(records['measured']), [36.5, 36.75])
+        self.assertTrue(math.isnan(records['target'][1]))
+        self.assertEqual(list(records['step']), [telemetry.NO_STEP, telemetry.NO_STEP])
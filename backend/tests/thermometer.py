@@ -1,5 +1,6 @@
 import unittest
-from backend.device.thermometer import Thermometer
+from backend.device.clock import SystemClock, VirtualClock
+from backend.device.thermometer import Thermometer, ThermometerSampler, SamplerGroup, SensorUnavailable
 from backend.device.mock import MockMAX31855
 import math
 
@@ -12,3 +13,78 @@ class ThermometerTests(unittest.TestCase):
         for i in range(10000):
             temperature = self.thermometer.current_temperature
             self.assertFalse(math.isnan(temperature))
+
+
+class SequenceSensor(object):
+    def __init__(self, values):
+        self._values = list(values)
+
+    def readTempC(self):
+        return self._values.pop(0)
+
+
+class ThermometerSamplerTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+
+    def sampler(self, values, **kwargs):
+        sampler = ThermometerSampler(SequenceSensor(values), clock=self.clock, **kwargs)
+        for _ in values:
+            sampler._sample()
+            self.clock.sleep(0.1)
+        return sampler
+
+    def test_no_reading_yet(self):
+        sampler = ThermometerSampler(SequenceSensor([]), clock=self.clock)
+        self.assertIsNone(sampler.reading)
+        self.assertRaises(SensorUnavailable, lambda: sampler.current_temperature)
+
+    def test_freshly_started(self):
+        sampler = ThermometerSampler(MockMAX31855(latency=0.02), clock=SystemClock())
+        sampler.start()
+        try:
+            # the first reading is waited for, rather than treated as missing
+            self.assertGreaterEqual(sampler.current_temperature, 20)
+        finally:
+            sampler.stop()
+
+    def test_never_read_after_starting(self):
+        sampler = ThermometerSampler(SequenceSensor([]), clock=self.clock, max_age=5.0)
+        sampler._begin()
+        self.assertRaises(SensorUnavailable, lambda: sampler.current_temperature)
+        self.assertEqual(self.clock.monotonic(), 5.0)
+
+    def test_rejects_nan_and_cold(self):
+        sampler = self.sampler([float('NaN'), 37.0, -150.0, 37.25, float('NaN')])
+        self.assertEqual(sampler.samples, 2)
+        self.assertEqual(sampler.rejected, 3)
+        self.assertEqual(sampler.current_temperature, 37.125)
+
+    def test_rejects_outliers(self):
+        sampler = self.sampler([37.0, 37.25, 37.0, 37.25, 37.0, 95.0, 37.25])
+        self.assertEqual(sampler.rejected, 1)
+        self.assertEqual(sampler.samples, 6)
+        self.assertEqual(sampler.current_temperature, 37.25)
+
+    def test_follows_real_changes(self):
+        sampler = self.sampler([37.0] * 15 + [60.0] * 30, window=15)
+        self.assertEqual(sampler.current_temperature, 60.0)
+
+    def test_stale(self):
+        sampler = self.sampler([37.0, 37.0, 37.0], max_age=5.0)
+        self.assertEqual(sampler.reading.samples, 3)
+        self.clock.sleep(6.0)
+        self.assertRaises(SensorUnavailable, lambda: sampler.current_temperature)
+
+
+class SamplerGroupTests(unittest.TestCase):
+    def test_reads_every_probe(self):
+        clock = VirtualClock()
+        first = ThermometerSampler(SequenceSensor([37.0, 37.5]), clock=clock)
+        second = ThermometerSampler(SequenceSensor([60.0, float('NaN')]), clock=clock)
+        group = SamplerGroup([first, second], clock=clock)
+        group.sample()
+        group.sample()
+        self.assertEqual(first.current_temperature, 37.25)
+        self.assertEqual(second.current_temperature, 60.0)
+        self.assertEqual(second.rejected, 1)
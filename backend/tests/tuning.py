@@ -0,0 +1,36 @@
+import unittest
+from backend.device.simulator import Trace
+from backend.device.tuning import Gains, Tuner, score_trace
+
+STEPS = {"1": {"mode": "set", "temperature": 40.0, "duration": 600}}
+
+
+class ScoreTests(unittest.TestCase):
+    def test_score_trace(self):
+        trace = Trace([0.0, 1.0, 2.0, 3.0], [20.0, 39.0, 41.0, 40.2], [40.0, 40.0, 40.0, 40.0], [100, 100, 0, 50])
+        score = score_trace(trace, {"iae": 1.0, "overshoot": 0.0, "settling_time": 0.0})
+        self.assertAlmostEqual(score.iae, 22.2)
+        self.assertAlmostEqual(score.overshoot, 1.0)
+        self.assertEqual(score.settling_time, 3.0)
+        self.assertAlmostEqual(score.cost, 22.2)
+
+
+class TunerTests(unittest.TestCase):
+    def test_grid_search_prefers_working_gains(self):
+        with Tuner(STEPS, processes=1) as tuner:
+            gains, score = tuner.grid_search([0.0, 8.0], [0.05], [0.0], [500.0])
+        self.assertEqual(gains, Gains(8.0, 0.05, 0.0, 500.0))
+        self.assertEqual(tuner.evaluations, 2)
+
+    def test_parallel_matches_serial(self):
+        with Tuner(STEPS, processes=1, noise=0.2, seed=4) as serial:
+            serial_result = serial.grid_search([2.0, 8.0], [0.01, 0.1], [0.0], [200.0])
+        with Tuner(STEPS, processes=2, noise=0.2, seed=4) as parallel:
+            parallel_result = parallel.grid_search([2.0, 8.0], [0.01, 0.1], [0.0], [200.0])
+        self.assertEqual(serial_result, parallel_result)
+
+    def test_nelder_mead_improves(self):
+        with Tuner(STEPS, processes=1) as tuner:
+            start = tuner.evaluate_all([Gains(1.0, 0.01, 0.0, 100.0)])[0]
+            gains, score = tuner.nelder_mead(Gains(1.0, 0.01, 0.0, 100.0), iterations=5)
+        self.assertLess(score.cost, start.cost)
@@ -0,0 +1,146 @@
+import django
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from django.conf import settings
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the API is run from its own directory, as a Django project
+for path in (BACKEND, os.path.join(BACKEND, "api")):
+    if path not in sys.path:
+        sys.path.append(path)
+if not settings.configured:
+    settings.configure(INSTALLED_APPS=("django.contrib.contenttypes", "django.contrib.auth", "rest_framework",
+                                       "rpidapi"),
+                       DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}},
+                       REST_FRAMEWORK={"DEFAULT_RENDERER_CLASSES": ("rest_framework.renderers.JSONRenderer",)})
+    django.setup()
+
+from datetime import datetime
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from interface import APIInterface, catalog, programs
+from rest_framework.test import APIRequestFactory
+from rpidapi import models, serializers, streaming, views
+
+STATUS = {"current_step": "2", "current_temp": "36.5", "target_temp": "37.0", "step_time_remaining": "60",
+          "program_time_remaining": "600", "program": {"1": {"mode": "set", "temperature": 37.0, "duration": 600}}}
+
+
+class CurrentViewTests(unittest.TestCase):
+    def setUp(self):
+        self.read_status = APIInterface.read_status
+        APIInterface.read_status = lambda api_interface: dict(STATUS)
+
+    def tearDown(self):
+        APIInterface.read_status = self.read_status
+
+    def test_get(self):
+        response = views.CurrentView.as_view()(APIRequestFactory().get("/current"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"step": "2", "temp": "36.5", "target": "37.0", "step_time_remaining": "60",
+                                         "program_time_remaining": "600", "program": STATUS["program"]})
+
+
+class TemperatureLogViewTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.run_catalog = views._run_catalog
+        views._run_catalog = catalog.RunCatalog(os.path.join(self.directory, "runs.sqlite3"))
+        views._run_catalog.start_run("/logs/temperature-2016-01-01-12-00-00.telemetry", datetime(2016, 1, 1, 12))
+
+    def tearDown(self):
+        views._run_catalog.close()
+        views._run_catalog = self.run_catalog
+        shutil.rmtree(self.directory)
+
+    def test_list_runs(self):
+        for _ in range(2):
+            response = views.TemperatureLogView.as_view()(APIRequestFactory().get("/logs"))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["count"], 1)
+            self.assertEqual(response.data["results"][0]["name"], "2016-01-01-12-00-00")
+
+
+class StatusStreamViewTests(unittest.TestCase):
+    def setUp(self):
+        self.stream_limit = streaming.stream_limit
+        streaming.stream_limit = streaming.StreamLimit(0)
+
+    def tearDown(self):
+        streaming.stream_limit = self.stream_limit
+
+    def test_too_many_streams(self):
+        response = views.StatusStreamView.as_view()(APIRequestFactory().get("/status/stream"))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
+
+class PreviewTests(unittest.TestCase):
+    def preview(self, steps, compiled=""):
+        program = models.Program(id=1, name="legacy", steps=steps, compiled=compiled)
+        program.save = lambda *args, **kwargs: self.fail("a preview must not save the program")
+        view = type("PreviewViewset", (views.ProgramViewset,), {"get_object": lambda viewset: program})
+        return view.as_view({"get": "preview"})(APIRequestFactory().get("/program/1/preview"), pk=1)
+
+    def test_program_saved_before_compiling(self):
+        response = self.preview('{"1": {"mode": "set", "temperature": 40.0, "duration": 600}}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total_duration"], 600.0)
+        self.assertEqual(response.data["target"][0], 40.0)
+
+    def test_program_compiled_by_a_different_version(self):
+        steps = '{"1": {"mode": "set", "temperature": 40.0, "duration": 600}}'
+        compiled = dict(programs.compile_steps(steps), version=programs.VERSION - 1, total_duration=1.0)
+        response = self.preview(steps, json.dumps(compiled))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total_duration"], 600.0)
+
+    def test_program_that_does_not_compile(self):
+        response = self.preview('{"1": {"mode": "boil"}}')
+        self.assertEqual(response.status_code, 400)
+
+
+class ProgramValidationTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # the migrations are what existing databases get, so they're what the tests use too
+        call_command("migrate", verbosity=0)
+
+    def setUp(self):
+        self.scientist = models.Scientist.objects.create(name="Jim")
+        self.driver = models.Driver.objects.create(name="Block A")
+
+    def tearDown(self):
+        for model in (models.Program, models.Driver, models.Scientist):
+            model.objects.all().delete()
+
+    def test_clean(self):
+        program = models.Program(name="boil", steps='{"1": {"mode": "boil"}}', scientist=self.scientist,
+                                 driver=self.driver)
+        with self.assertRaises(ValidationError) as context:
+            program.full_clean()
+        self.assertEqual(list(context.exception.message_dict), ["steps"])
+
+    def test_serializer(self):
+        serializer = serializers.ProgramSerializer(data={"name": "boil", "steps": '{"1": {"mode": "boil"}}',
+                                                         "scientist": self.scientist.id, "driver": self.driver.id})
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(list(serializer.errors), ["steps"])
+
+    def test_save_compiles(self):
+        program = models.Program.objects.create(name="warm", steps='{"1": {"mode": "hold", "temperature": 37.0}}',
+                                                scientist=self.scientist, driver=self.driver)
+        self.assertEqual(program.current_compiled()["version"], programs.VERSION)
+        self.assertEqual(program.content_hash, program.current_compiled()["hash"])
+
+    def test_start_program_that_was_not_validated(self):
+        program = models.Program.objects.create(name="boil", steps='{"1": {"mode": "boil"}}',
+                                                scientist=self.scientist, driver=self.driver)
+        self.assertEqual(program.compiled, "")
+        request = APIRequestFactory().post("/start", {"driver": self.driver.id, "program": program.id}, format="json")
+        response = views.StartView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
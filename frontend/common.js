@@ -55,6 +55,16 @@ function http(endpoint, verb, d, func){
       },
       failure: function(return_data) {
         alert("The API could not be reached.");
+      },
+      error: function(xhr) {
+        // the API explains what was wrong with a request, e.g. a program with a step it can't run
+        if (xhr.status == 400 && xhr.responseJSON) {
+          var messages = [];
+          for (var field in xhr.responseJSON) {
+            messages.push(field + ": " + xhr.responseJSON[field]);
+          }
+          alert(messages.join("\n"));
+        }
       }
     });
     if (verb == "POST") {
@@ -7,7 +7,8 @@ $(document).ready(function(){
                           'kd': $('#kd').val(),
                           'max_accumulated_error': $('#max_accumulated_error').val(),
                           'min_accumulated_error': $('#min_accumulated_error').val(),
-                          'max_power': $('#max_power').val()
+                          'max_power': $('#max_power').val(),
+                          'period': $('#period').val()
                           }
         http('driver/' + driver_id, 'PUT', updated_driver, function(d){
             alert('Driver updated!');
@@ -26,6 +27,7 @@ $(document).ready(function(){
         var max_accumulated_error = response['max_accumulated_error'];
         var min_accumulated_error = response['min_accumulated_error'];
         var max_power = response['max_power'];
+        var period = response['period'];
 
         $('#driver_name').html("Update PID values for " + name);
         $('#name').val(name);
@@ -35,5 +37,6 @@ $(document).ready(function(){
         $('#max_accumulated_error').val(max_accumulated_error);
         $('#min_accumulated_error').val(min_accumulated_error);
         $('#max_power').val(max_power);
+        $('#period').val(period);
     });
 });
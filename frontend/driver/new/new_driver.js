@@ -6,7 +6,8 @@ $(document).ready(function(){
                       'kd': $('#kd').val(),
                       'max_accumulated_error': $('#max_accumulated_error').val(),
                       'min_accumulated_error': $('#min_accumulated_error').val(),
-                      'max_power': $('#max_power').val()
+                      'max_power': $('#max_power').val(),
+                      'period': $('#period').val()
                       }
         http('driver', 'POST', new_driver, function(d){
             alert('Driver created!');
@@ -1,10 +1,27 @@
-$(document).ready(function(){
-    // this isn't really complete yet, just gets a list of log filenames
-    http("logs", 'GET', null, function(data) {
+var page = 1;
+
+function load_page(number) {
+    // the API returns runs newest first, a page at a time
+    http("logs?page=" + number, 'GET', null, function(data) {
+        page = data.page;
         var output = "";
-        for (var i=0; i<Object.keys(data).length; i++) {
-            output += data[i] + "<br>";
-       }
-       $("#logs").html(output);
-   });
-});
\ No newline at end of file
+        for (var i=0; i<data.results.length; i++) {
+            var run = data.results[i];
+            output += run.name;
+            if (run.samples) {
+                output += " (" + run.samples + " readings, " + run.min_temperature.toFixed(1) + " to " +
+                          run.max_temperature.toFixed(1) + " C)";
+            }
+            output += "<br>";
+        }
+        $("#logs").html(output);
+        $("#newer").toggle(page > 1);
+        $("#older").toggle(page * data.page_size < data.count);
+    });
+}
+
+$(document).ready(function(){
+    $("#newer").click(function() { load_page(page - 1); return false; });
+    $("#older").click(function() { load_page(page + 1); return false; });
+    load_page(1);
+});
@@ -8,13 +8,32 @@ function mode_to_human_readable_text(program) {
     if (program.mode == "hold") {
         return "Hold at " + program.temperature + "°C"
     }
+    if (program.mode == "repeat") {
+        var steps = [];
+        for (var i = 1; i <= Object.keys(program.steps).length; i++) {
+            steps.push(mode_to_human_readable_text(program.steps[i]));
+        }
+        return "Repeat " + program.count + " times: " + steps.join(", ")
+    }
 }
 
 function duration_to_human_readable(program) {
     if (program.mode == "hold") {
         return "---"
     }
-    return to_hhmmss(program.duration)
+    return to_hhmmss(step_seconds(program))
+}
+
+function step_seconds(program) {
+    // a repeat takes as long as all of its steps, as many times as it repeats
+    if (program.mode == "repeat") {
+        var seconds = 0;
+        for (var i in program.steps) {
+            seconds += parseFloat(step_seconds(program.steps[i]));
+        }
+        return seconds * program.count;
+    }
+    return program.duration
 }
 
 function display_temperature(temperature) {
@@ -27,73 +46,149 @@ function display_temperature(temperature) {
     return rounded_temp + "°C"
 }
 
+// the latest status pushed by the API, and the steps of the program that's running
+var latest_status = {};
+var current_program = {};
+var loading_program = false;
+
 function update() {
     // Get the latest temperature and data about the program that's running
+    http("current", 'GET', null, render);
+}
+
+function load_program() {
+    // the stream only carries the status, so we ask for the program once whenever a new one starts
+    if (loading_program) {
+        return;
+    }
+    loading_program = true;
     http("current", 'GET', null, function(data){
-        // Update the most important stats
-        $("#current_temp").html(display_temperature(data.temp));
-        $("#target_temp").html(display_temperature(data.target));
-        if (data.program_time_remaining == 0) {
-            $("#step_time_remaining").html('---');
-            $("#program_time_remaining").html('---');
+        loading_program = false;
+        current_program = data.program;
+        render(data);
+    });
+}
+
+function apply_status(fields) {
+    // each event only has the fields that changed, so merge them into what we already know
+    for (var field in fields) {
+        latest_status[field] = fields[field];
+    }
+    if (latest_status.current_step === null || latest_status.current_step === undefined) {
+        current_program = {};
+    }
+    else if (Object.keys(current_program).length == 0) {
+        load_program();
+    }
+    render({"temp": latest_status.current_temp,
+            "target": latest_status.target_temp,
+            "step": latest_status.current_step,
+            "step_time_remaining": latest_status.step_time_remaining,
+            "program_time_remaining": latest_status.program_time_remaining,
+            "program": current_program});
+}
+
+function start_polling() {
+    // once a second, get updated information about the program and the heater from API
+    window.setInterval(update, 1000);
+}
+
+function start_streaming() {
+    // the API pushes each new status as soon as the controller publishes it, so we don't have to poll
+    if (!window.EventSource) {
+        return false;
+    }
+    var source = new EventSource("http://" + API_URL + "/status/stream");
+    source.addEventListener("backfill", function(event) {
+        var backfill = JSON.parse(event.data);
+        var last = backfill.time.length - 1;
+        if (last >= 0) {
+            var fields = {};
+            for (var field in backfill) {
+                fields[field] = backfill[field][last];
+            }
+            apply_status(fields);
         }
         else {
-            $("#step_time_remaining").html(to_hhmmss(data.step_time_remaining));
-            $("#program_time_remaining").html(to_hhmmss(data.program_time_remaining));
+            update();
+        }
+    });
+    source.addEventListener("status", function(event) {
+        apply_status(JSON.parse(event.data));
+    });
+    source.onerror = function() {
+        // the browser retries by itself unless the connection can't be made at all
+        if (source.readyState == EventSource.CLOSED) {
+            start_polling();
         }
+    };
+    return true;
+}
 
-        // we're running a program if there are any steps
-        var show_stop_button = (Object.keys(data.program).length > 0);
+function render(data) {
+    // Update the most important stats
+    $("#current_temp").html(display_temperature(data.temp));
+    $("#target_temp").html(display_temperature(data.target));
+    if (data.program_time_remaining == 0) {
+        $("#step_time_remaining").html('---');
+        $("#program_time_remaining").html('---');
+    }
+    else {
+        $("#step_time_remaining").html(to_hhmmss(data.step_time_remaining));
+        $("#program_time_remaining").html(to_hhmmss(data.program_time_remaining));
+    }
 
-        // Build up the table of each program step
-        if (data.step) {
-            // see if we have changed steps since the last check. If so, we should beep.
-            var current_step = $("#current_step");
-            var previous_step = parseInt(current_step.val());
-            if (previous_step != data.step) {
-                beep();
+    // we're running a program if there are any steps
+    var show_stop_button = (Object.keys(data.program).length > 0);
+
+    // Build up the table of each program step
+    if (data.step) {
+        // see if we have changed steps since the last check. If so, we should beep.
+        var current_step = $("#current_step");
+        var previous_step = parseInt(current_step.val());
+        if (previous_step != data.step) {
+            beep();
+        }
+        current_step.val(data.step);
+        var steps = "<table><thead class='setting'><tr><th>Step</th><th>Duration</th></tr></thead><tfoot class='setting'>";
+        for (var i = 1; i <= Object.keys(data.program).length; i++) {
+            var line;
+            if (data.step == i) {
+                line = "<tr class='current_step'>";
             }
-            current_step.val(data.step);
-            var steps = "<table><thead class='setting'><tr><th>Step</th><th>Duration</th></tr></thead><tfoot class='setting'>";
-            for (var i = 1; i <= Object.keys(data.program).length; i++) {
-                var line;
-                if (data.step == i) {
-                    line = "<tr class='current_step'>";
-                }
-                else if (data.step > i) {
-                    line = "<tr class='completed_step'>";
-                }
-                else {
-                    line = "<tr>";
-                }
-                line += "<td>" + mode_to_human_readable_text(data.program[i]) + "</td>";
-                line += "<td>" + duration_to_human_readable(data.program[i]) + "</td>";
-                line += "</tr>";
-                steps += line;
+            else if (data.step > i) {
+                line = "<tr class='completed_step'>";
             }
-            steps += "</tfoot></table>";
-            $("#steps").html(steps);
+            else {
+                line = "<tr>";
+            }
+            line += "<td>" + mode_to_human_readable_text(data.program[i]) + "</td>";
+            line += "<td>" + duration_to_human_readable(data.program[i]) + "</td>";
+            line += "</tr>";
+            steps += line;
         }
+        steps += "</tfoot></table>";
+        $("#steps").html(steps);
+    }
 
-        // enable the Stop and Skip buttons only if a program is running
-        if (show_stop_button) {
-            $("#stop")
-                .prop('disabled', false)
-                .attr('style', 'background-color: #FF2020; color: #FFFFFF;');
-            $("#skip")
-                .prop('disabled', false)
-                .attr('style', 'background-color: #FFC200; color: #000000;');
-        }
-        else {
-            $("#steps").html('');
-            $("#stop")
-                .prop('disabled', true)
-                .attr('style', 'background-color: #806666; color: #FFFFFF;');
-            $("#skip")
-                .prop('disabled', true)
-                .attr('style', 'background-color: #806666; color: #FFFFFF;');
-        }
-    });
+    // enable the Stop and Skip buttons only if a program is running
+    if (show_stop_button) {
+        $("#stop")
+            .prop('disabled', false)
+            .attr('style', 'background-color: #FF2020; color: #FFFFFF;');
+        $("#skip")
+            .prop('disabled', false)
+            .attr('style', 'background-color: #FFC200; color: #000000;');
+    }
+    else {
+        $("#steps").html('');
+        $("#stop")
+            .prop('disabled', true)
+            .attr('style', 'background-color: #806666; color: #FFFFFF;');
+        $("#skip")
+            .prop('disabled', true)
+            .attr('style', 'background-color: #806666; color: #FFFFFF;');
+    }
 }
 
 $(document).ready(function(){
@@ -124,6 +219,7 @@ $(document).ready(function(){
         }
     );
 
-    // once half second, get updated information about the program and the heater from API
-    window.setInterval(update, 1000);
+    if (!start_streaming()) {
+        start_polling();
+    }
 });
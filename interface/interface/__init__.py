@@ -1 +1 @@
-from main import APIInterface
+from main import APIInterface, Command, COMMAND_CHANNEL, STATUS_CHANNEL, STATUS_FIELDS
@@ -0,0 +1,253 @@
+"""
+An index of every run, kept in SQLite so that runs can be listed, filtered and paged through without looking at the
+log directory, which can hold tens of thousands of files. The controller adds a run when it starts and fills in the
+rest when it stops, and the API only reads it.
+
+"""
+import argparse
+import calendar
+import os
+import sqlite3
+import telemetry
+
+DEFAULT_PATH = os.environ.get("PIWARMER_RUN_CATALOG", "/var/lib/piwarmer/runs.sqlite3")
+DEFAULT_PAGE_SIZE = 50
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    start_time REAL NOT NULL,
+    end_time REAL,
+    program_id INTEGER,
+    driver_id INTEGER,
+    samples INTEGER NOT NULL DEFAULT 0,
+    min_temperature REAL,
+    max_temperature REAL,
+    mean_absolute_error REAL
+);
+CREATE INDEX IF NOT EXISTS runs_by_start_time ON runs (start_time);
+CREATE INDEX IF NOT EXISTS runs_by_program ON runs (program_id, start_time);
+CREATE INDEX IF NOT EXISTS runs_by_driver ON runs (driver_id, start_time);
+"""
+
+
+def _to_epoch(when):
+    """
+    Converts a naive UTC datetime to seconds since the Unix epoch.
+
+    """
+    return calendar.timegm(when.utctimetuple()) + when.microsecond / 1e6
+
+
+def run_name(path):
+    """
+    The name the API uses for the run logged at a path, e.g. "2016-01-01-12-00-00" for
+    /var/log/piwarmer/temperature-2016-01-01-12-00-00.telemetry
+
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name[len("temperature-"):] if name.startswith("temperature-") else name
+
+
+class RunSummary(object):
+    """
+    Keeps running statistics of the measurements of a run, so that they can be stored in the catalog when it ends
+    without reading the log back.
+
+    """
+    def __init__(self):
+        self.samples = 0
+        self.min_temperature = None
+        self.max_temperature = None
+        self._error_samples = 0
+        self._total_error = 0.0
+
+    def add(self, measured, target):
+        """
+        :param measured:    the measured temperature
+        :param target:      the target temperature, or None if there isn't one
+
+        """
+        self.samples += 1
+        self.min_temperature = measured if self.min_temperature is None else min(self.min_temperature, measured)
+        self.max_temperature = measured if self.max_temperature is None else max(self.max_temperature, measured)
+        if target is not None:
+            self._error_samples += 1
+            self._total_error += abs(measured - target)
+
+    @property
+    def mean_absolute_error(self):
+        return self._total_error / self._error_samples if self._error_samples else None
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Summarizes the records of a log that's already been written.
+
+        :param records:    the records, as read by telemetry.read_telemetry()
+
+        """
+        summary = cls()
+        for measured, target in zip(records["measured"].tolist(), records["target"].tolist()):
+            if measured == measured:
+                summary.add(measured, None if target != target else target)
+        return summary
+
+
+class RunCatalog(object):
+    """
+    Reads and writes the catalog. The database and its table are created if they don't exist yet.
+
+    """
+    def __init__(self, path=DEFAULT_PATH, create=True):
+        """
+
+        :param path:      where the database is
+        :param create:    whether to set up the database, which only needs to be done once by each process
+
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=10.0)
+        self._connection.row_factory = sqlite3.Row
+        if create:
+            # the controller writes while the API reads, and write-ahead logging lets them do so without blocking
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            with self._connection:
+                self._connection.executescript(SCHEMA)
+
+    def connect(self):
+        """
+        Opens another connection to the catalog, which has already been set up. A connection can only be used by the
+        thread that opened it, so e.g. the API opens one for each request.
+
+        :rtype:     RunCatalog
+
+        """
+        return RunCatalog(self.path, create=False)
+
+    def close(self):
+        self._connection.close()
+
+    def start_run(self, path, start_time, program_id=None, driver_id=None):
+        """
+        Adds a run that has just started.
+
+        :param path:          where its telemetry file is
+        :param start_time:    when it started, in UTC
+        :type start_time:     datetime
+
+        :return:    the ID of the run
+        :rtype:     int
+
+        """
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO runs (path, start_time, program_id, driver_id) VALUES (?, ?, ?, ?)",
+                (path, _to_epoch(start_time), program_id, driver_id))
+        return cursor.lastrowid
+
+    def finish_run(self, run_id, end_time, summary):
+        """
+        Records that a run has ended.
+
+        :param end_time:    when it ended, in UTC
+        :type end_time:     datetime
+        :type summary:      RunSummary
+
+        """
+        with self._connection:
+            self._connection.execute(
+                "UPDATE runs SET end_time = ?, samples = ?, min_temperature = ?, max_temperature = ?, "
+                "mean_absolute_error = ? WHERE id = ?",
+                (_to_epoch(end_time), summary.samples, summary.min_temperature, summary.max_temperature,
+                 summary.mean_absolute_error, run_id))
+
+    def add_finished_run(self, path, start_time, end_time, summary):
+        """
+        Adds a run that ended before the catalog existed, unless it's already there.
+
+        :param start_time:    when it started, in seconds since the Unix epoch
+        :param end_time:      when it ended, in seconds since the Unix epoch
+        :type summary:        RunSummary
+
+        :return:    whether the run was added
+        :rtype:     bool
+
+        """
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO runs (path, start_time, end_time, samples, min_temperature, max_temperature, "
+                "mean_absolute_error) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, start_time, end_time, summary.samples, summary.min_temperature, summary.max_temperature,
+                 summary.mean_absolute_error))
+        return cursor.rowcount > 0
+
+    def query(self, program_id=None, driver_id=None, after=None, before=None, limit=DEFAULT_PAGE_SIZE, offset=0):
+        """
+        Finds runs, newest first.
+
+        :param program_id:    only include runs of this program
+        :param driver_id:     only include runs that used this driver
+        :param after:         only include runs that started at or after this time, in seconds since the Unix epoch
+        :param before:        only include runs that started before this time, in seconds since the Unix epoch
+        :param limit:         the most runs to return
+        :param offset:        the number of matching runs to skip, for paging
+
+        :return:    the total number of matching runs, and the requested page of them
+        :rtype:     (int, list of dict)
+
+        """
+        conditions = []
+        parameters = []
+        for condition, value in (("program_id = ?", program_id),
+                                 ("driver_id = ?", driver_id),
+                                 ("start_time >= ?", after),
+                                 ("start_time < ?", before)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        total = self._connection.execute("SELECT COUNT(*) FROM runs" + where, parameters).fetchone()[0]
+        rows = self._connection.execute("SELECT * FROM runs" + where + " ORDER BY start_time DESC, id DESC "
+                                        "LIMIT ? OFFSET ?", parameters + [limit, offset])
+        return total, [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row):
+        run = dict(zip(row.keys(), row))
+        run["name"] = run_name(run["path"])
+        return run
+
+
+def import_logs(run_catalog, log_dir):
+    """
+    Adds every temperature log in a directory to the catalog, for runs that ended before it existed. This reads every
+    log, so it's only meant to be run once, by hand.
+
+    :return:    the number of runs added
+    :rtype:     int
+
+    """
+    added = 0
+    for filename in sorted(os.listdir(log_dir)):
+        if not filename.startswith("temperature-"):
+            continue
+        path = os.path.join(log_dir, filename)
+        if filename.endswith(telemetry.EXTENSION):
+            start_time, records = telemetry.read_telemetry(path)
+        elif filename.endswith(".log"):
+            start_time, records = telemetry.read_legacy_log(path)
+        else:
+            continue
+        end_time = float(records["timestamp"][-1]) if len(records) else start_time
+        if run_catalog.add_finished_run(path, start_time, end_time, RunSummary.from_records(records)):
+            added += 1
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add the temperature logs of old runs to the run catalog")
+    parser.add_argument("log_dir", nargs="?", default="/var/log/piwarmer")
+    parser.add_argument("--catalog", default=DEFAULT_PATH)
+    args = parser.parse_args()
+    print("Added %d runs" % import_logs(RunCatalog(args.catalog), args.log_dir))
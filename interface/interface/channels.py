@@ -0,0 +1,117 @@
+"""
+The channels of a rig that has several heating stages on one Pi. Each channel has its own heater pins and thermometer,
+and its own program, driver and status in Redis (see APIInterface), so the channels run independently of each other.
+
+The channels are described by a JSON file, named by PIWARMER_CHANNELS (default /etc/piwarmer/channels.json), like:
+    {
+      "period": 1.0,
+      "clock_pin": 24,
+      "data_pin": 18,
+      "channels": [
+        {"name": "a", "pwm_pin": 16, "enable_pin": 20, "chip_select_pin": 23},
+        {"name": "b", "pwm_pin": 12, "enable_pin": 21, "chip_select_pin": 25}
+      ]
+    }
+The thermometers share the clock and data pins of the SPI bus, and each has its own chip select, although any channel can
+override the shared pins. Every channel is stepped once per period, in seconds.
+
+Without the file there's a single channel with no name, wired the way the controller always has been, which uses the
+same Redis keys as before there were channels.
+
+"""
+import collections
+import json
+import os
+import re
+
+DEFAULT_PATH = os.environ.get("PIWARMER_CHANNELS", "/etc/piwarmer/channels.json")
+# names are used in Redis keys and in URLs
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+PIN_FIELDS = ("pwm_pin", "enable_pin", "clock_pin", "chip_select_pin", "data_pin")
+
+Channel = collections.namedtuple("Channel", ("name",) + PIN_FIELDS)
+Config = collections.namedtuple("Config", ["period", "channels"])
+
+DEFAULT_CHANNEL = Channel(name=None, pwm_pin=16, enable_pin=20, clock_pin=24, chip_select_pin=23, data_pin=18)
+DEFAULT_CONFIG = Config(period=1.0, channels=(DEFAULT_CHANNEL,))
+
+
+class ChannelError(ValueError):
+    """
+    Signals that the channel configuration doesn't make sense.
+
+    """
+    pass
+
+
+def load(path=DEFAULT_PATH):
+    """
+    Reads the channel configuration, or gives the single default channel if there's no configuration file.
+
+    :rtype:     Config
+    :raises:    ChannelError
+
+    """
+    if not os.path.exists(path):
+        return DEFAULT_CONFIG
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (IOError, ValueError) as e:
+        raise ChannelError("Could not read the channel configuration in %s: %s" % (path, e))
+    return parse(config)
+
+
+def parse(config):
+    """
+    Checks a channel configuration, as described above.
+
+    :type config:    dict
+    :rtype:     Config
+    :raises:    ChannelError
+
+    """
+    if not isinstance(config, dict) or not isinstance(config.get("channels"), list) or not config["channels"]:
+        raise ChannelError("The configuration must have a list of channels")
+    try:
+        period = float(config.get("period", DEFAULT_CONFIG.period))
+    except (TypeError, ValueError):
+        raise ChannelError("period must be a number of seconds, not %r" % config.get("period"))
+    if not period > 0.0:
+        raise ChannelError("period must be more than zero seconds")
+    channels = []
+    for entry in config["channels"]:
+        if not isinstance(entry, dict):
+            raise ChannelError("Each channel must be an object")
+        name = entry.get("name")
+        if not isinstance(name, basestring) or not NAME_PATTERN.match(name):
+            raise ChannelError("Channel names must be letters, numbers, underscores and hyphens, not %r" % name)
+        pins = {}
+        for field in PIN_FIELDS:
+            value = entry.get(field, config.get(field, getattr(DEFAULT_CHANNEL, field)))
+            if isinstance(value, bool) or not isinstance(value, (int, long)):
+                raise ChannelError("%s of channel %s must be a pin number, not %r" % (field, name, value))
+            pins[field] = value
+        channels.append(Channel(name=str(name), **pins))
+    _check_unique([channel.name for channel in channels], "channel name")
+    # the clock and data pins are shared, but two channels can't drive the same heater or select the same thermometer
+    _check_unique([pin for channel in channels for pin in (channel.pwm_pin, channel.enable_pin)], "heater pin")
+    _check_unique([channel.chip_select_pin for channel in channels], "chip select pin")
+    return Config(period=period, channels=tuple(channels))
+
+
+def _check_unique(values, description):
+    duplicates = sorted(set(value for value in values if values.count(value) > 1))
+    if duplicates:
+        raise ChannelError("Each %s can only be used once, but %s are repeated"
+                           % (description, ", ".join(str(value) for value in duplicates)))
+
+
+def names(path=DEFAULT_PATH):
+    """
+    The names of the channels, which are empty for the single default channel.
+
+    :rtype:     list of str
+
+    """
+    return [channel.name for channel in load(path).channels if channel.name is not None]
@@ -0,0 +1,81 @@
+"""
+A Redis connection pool that is shared by everything in a process, so that connections are reused rather than opened
+for every request. Redis can be reached over TCP or, which is faster on a Pi, a Unix socket:
+
+    PIWARMER_REDIS_SOCKET    the path of Redis's Unix socket. If this is set, the host and port are ignored
+    PIWARMER_REDIS_HOST      defaults to localhost
+    PIWARMER_REDIS_PORT      defaults to 6379
+    PIWARMER_REDIS_DB        defaults to 0
+
+"""
+import os
+import redis
+import threading
+import time
+
+# a connection that has been idle for longer than this many seconds is checked with a PING before it's used again
+HEALTH_CHECK_INTERVAL = 30.0
+# how long to wait for Redis to accept a TCP connection, in seconds. There's no timeout on reading, since subscribers
+# wait indefinitely for messages
+CONNECT_TIMEOUT = 5.0
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+class HealthCheckedConnectionPool(redis.ConnectionPool):
+    """
+    Before handing out a connection that has been sitting idle, makes sure that Redis is still on the other end of
+    it, e.g. that Redis hasn't been restarted in the meantime. A dead connection is closed, and it reconnects when
+    it's used.
+
+    """
+    def __init__(self, health_check_interval=HEALTH_CHECK_INTERVAL, **kwargs):
+        super(HealthCheckedConnectionPool, self).__init__(**kwargs)
+        self.health_check_interval = health_check_interval
+
+    def get_connection(self, command_name, *keys, **options):
+        connection = super(HealthCheckedConnectionPool, self).get_connection(command_name, *keys, **options)
+        last_used = getattr(connection, "last_used", None)
+        if last_used is not None and time.time() - last_used > self.health_check_interval:
+            try:
+                connection.send_command("PING")
+                if connection.read_response() not in ("PONG", b"PONG"):
+                    raise redis.ConnectionError("Unexpected response to PING")
+            except (redis.ConnectionError, redis.TimeoutError):
+                connection.disconnect()
+        return connection
+
+    def release(self, connection):
+        connection.last_used = time.time()
+        super(HealthCheckedConnectionPool, self).release(connection)
+
+
+def make_pool(socket_path=None, host="localhost", port=6379, db=0):
+    """
+    Creates a connection pool for Redis at a Unix socket, if one is given, or otherwise at a host and port.
+
+    :rtype:     HealthCheckedConnectionPool
+
+    """
+    if socket_path:
+        return HealthCheckedConnectionPool(connection_class=redis.UnixDomainSocketConnection, path=socket_path, db=db)
+    return HealthCheckedConnectionPool(host=host, port=port, db=db, socket_connect_timeout=CONNECT_TIMEOUT)
+
+
+def shared_pool():
+    """
+    The connection pool for this process, configured from the environment. It's created the first time it's needed,
+    and it's safe to use from any thread.
+
+    :rtype:     HealthCheckedConnectionPool
+
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = make_pool(socket_path=os.environ.get("PIWARMER_REDIS_SOCKET"),
+                                     host=os.environ.get("PIWARMER_REDIS_HOST", "localhost"),
+                                     port=int(os.environ.get("PIWARMER_REDIS_PORT", 6379)),
+                                     db=int(os.environ.get("PIWARMER_REDIS_DB", 0)))
+        return _shared_pool
@@ -0,0 +1,118 @@
+"""
+Reduces a long series of measurements to a few hundred or thousand points that still look the same when plotted, so
+that the browser doesn't have to receive and draw every tick of a multi-day run.
+
+Both methods return indexes into the original arrays, so several columns can be reduced the same way.
+
+"""
+import numpy as np
+
+
+def _bucket_starts(n, buckets):
+    """
+    The index at which each of a number of (nearly) equal-sized buckets begins.
+
+    """
+    return np.unique(np.linspace(0, n, buckets, endpoint=False).astype(np.int64))
+
+
+def minmax(values, points):
+    """
+    Keeps the smallest and largest value of each bucket, in the order they occurred, so that peaks and dips are never
+    lost. NaN values are ignored unless a whole bucket is NaN.
+
+    :param values:    the values to reduce
+    :type values:     numpy.ndarray
+    :param points:    the maximum number of points to keep
+
+    :return:    the indexes of the points to keep, in increasing order
+    :rtype:     numpy.ndarray
+
+    """
+    n = len(values)
+    if n <= points:
+        return np.arange(n)
+    starts = _bucket_starts(n, max(1, points // 2))
+    counts = np.diff(np.append(starts, n))
+    index = np.arange(n)
+    # find the first index in each bucket that holds the bucket's minimum (or maximum), without a Python loop
+    lows = np.repeat(np.fmin.reduceat(values, starts), counts)
+    highs = np.repeat(np.fmax.reduceat(values, starts), counts)
+    argmins = np.minimum.reduceat(np.where(values == lows, index, n), starts)
+    argmaxes = np.minimum.reduceat(np.where(values == highs, index, n), starts)
+    # a bucket that is entirely NaN has no minimum, so we just keep its first point
+    argmins = np.where(argmins == n, starts, argmins)
+    argmaxes = np.where(argmaxes == n, starts, argmaxes)
+    return np.unique(np.concatenate([argmins, argmaxes]))
+
+
+def lttb(times, values, points):
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and last points, and from each bucket in between, the point that
+    forms the largest triangle with the point kept from the previous bucket and the average of the next bucket. This
+    preserves the visual shape of the line better than taking every nth point.
+
+    :param times:     the time of each value
+    :type times:      numpy.ndarray
+    :param values:    the values to reduce
+    :type values:     numpy.ndarray
+    :param points:    the number of points to keep
+
+    :return:    the indexes of the points to keep, in increasing order
+    :rtype:     numpy.ndarray
+
+    """
+    n = len(values)
+    if n <= points or points < 3:
+        return np.arange(n)
+    times = np.asarray(times, dtype=np.float64)
+    # NaN would make every triangle NaN, so treat missing values as zero for the purposes of choosing points
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    # the first and last points are always kept, and the rest are split into buckets
+    edges = np.unique(np.linspace(1, n - 1, points - 1).astype(np.int64))
+    keep = np.empty(len(edges) + 1, dtype=np.int64)
+    keep[0] = 0
+    previous = 0
+    for i in range(len(edges) - 1):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        next_time = times[stop:next_stop].mean()
+        next_value = values[stop:next_stop].mean()
+        # twice the area of the triangle formed with the previous point and the average of the next bucket
+        areas = np.abs((times[previous] - next_time) * (values[start:stop] - values[previous]) -
+                       (times[previous] - times[start:stop]) * (next_value - values[previous]))
+        previous = start + int(np.argmax(areas))
+        keep[i + 1] = previous
+    keep[-1] = n - 1
+    return keep
+
+
+METHODS = ("minmax", "lttb")
+
+
+def downsample(times, columns, points, method="minmax"):
+    """
+    Chooses which rows to keep so that several columns can be plotted against the same times. Each column gets an
+    equal share of the points, and the rows chosen for any column are kept for all of them.
+
+    :param times:      the time of each row
+    :type times:       numpy.ndarray
+    :param columns:    the values of each column, all the same length as times
+    :type columns:     list of numpy.ndarray
+    :param points:     roughly the most rows to keep, or 0 to keep everything
+    :param method:     one of METHODS
+
+    :return:    the indexes of the rows to keep, in increasing order
+    :rtype:     numpy.ndarray
+
+    """
+    assert method in METHODS
+    n = len(times)
+    if not points or n <= points or not columns:
+        return np.arange(n)
+    share = max(points // len(columns), 4)
+    if method == "minmax":
+        keep = [minmax(values, share) for values in columns]
+    else:
+        keep = [lttb(times, values, share) for values in columns]
+    return np.unique(np.concatenate(keep))
@@ -1,39 +1,254 @@
-import redis
 import json
+import stores
+import time
 
+# The fields of the controller's status that are published together once per tick
+STATUS_FIELDS = ("current_temp",
+                 "target_temp",
+                 "current_step",
+                 "step_time_remaining",
+                 "program_time_remaining")
+
+# The pub/sub channel the API uses to tell the controller to do something right away
+COMMAND_CHANNEL = "commands"
+
+# The pub/sub channel the controller announces its status on every tick, and the list of recent statuses that is kept
+# for anyone who starts watching partway through a run
+STATUS_CHANNEL = "status"
+STATUS_HISTORY = "status_history"
+# ten minutes' worth at the default control period of one second
+STATUS_HISTORY_LENGTH = 600
+
+# The hash of the controller's performance metrics (see device.metrics), which outlives any one run
+METRICS = "metrics"
+
+
+class Command(object):
+    """
+    The kinds of message that can be sent on the command channel.
+
+    """
+    START = "start"
+    STOP = "stop"
+    SKIP = "skip"
+    UPDATE_GAINS = "update_gains"
+
+
+class APIInterface(object):
+    # the last program we decoded, so that we don't have to parse the same JSON on every poll
+    _program_cache = (None, {})
+
+    def __init__(self, channel=None, store=None, **kwargs):
+        """
+        Uses the store shared by the whole process (see interface.stores), unless given one or told how to connect to
+        Redis.
+
+        :param channel:    the name of the channel (see interface.channels) whose keys to use. Each channel's keys and
+                           pub/sub channels are prefixed with "channel:<name>:", and the default channel has no prefix
+        :param store:      where to keep the state
+        :type store:       stores.StateStore
+        :param kwargs:     arguments for redis.StrictRedis, to keep the state in Redis without sharing the process's
+                           connection pool
+
+        """
+        if store is None:
+            store = stores.RedisStore(**kwargs) if kwargs else stores.shared_store()
+        self.store = store
+        self.channel = channel
+        self._prefix = "" if channel is None else "channel:%s:" % channel
+        self.command_channel = self._key(COMMAND_CHANNEL)
+        self.status_channel = self._key(STATUS_CHANNEL)
+
+    def pubsub(self, **kwargs):
+        """
+        Something to subscribe to command_channel or status_channel with.
+
+        """
+        return self.store.pubsub(**kwargs)
+
+    def _key(self, name):
+        """
+        The name of a key in this channel.
+
+        :rtype:     str
+
+        """
+        return self._prefix + name
 
-class APIInterface(redis.StrictRedis):
     def clear(self):
         """
         Resets all data, essentially stopping the current program and going back into a state where we're waiting
         for new instructions from the user.
 
         """
-        labels = ["current_temp",
-                  "target_temp",
-                  "current_step",
-                  "step_time_remaining",
-                  "program_time_remaining",
+        labels = ["status",
+                  STATUS_HISTORY,
                   "active",
                   "program",
+                  "program_id",
+                  "compiled_program",
                   "mode",
                   "skip_time"]
-        for label in labels:
-            self.delete(label)
+        pipe = self.store.pipeline(transaction=False)
+        pipe.delete(*[self._key(label) for label in labels])
+        # let anyone who's watching know that there's nothing running any more
+        pipe.publish(self.status_channel, self._encode_status({field: None for field in STATUS_FIELDS}))
+        pipe.execute()
+
+    def publish_status(self, **status):
+        """
+        Update every field of the controller's status in a single round trip. Fields that are None are removed, so
+        that readers see them as missing rather than as the string "None". The status is also announced on
+        STATUS_CHANNEL and added to the recent history.
+
+        :param status:    values for any of the fields in STATUS_FIELDS
+
+        """
+        assert set(status.keys()) <= set(STATUS_FIELDS)
+        values = {field: value for field, value in status.items() if value is not None}
+        missing = [field for field, value in status.items() if value is None]
+        message = self._encode_status(status)
+        pipe = self.store.pipeline(transaction=False)
+        if values:
+            pipe.hmset(self._key("status"), values)
+        if missing:
+            pipe.hdel(self._key("status"), *missing)
+        pipe.publish(self.status_channel, message)
+        pipe.rpush(self._key(STATUS_HISTORY), message)
+        pipe.ltrim(self._key(STATUS_HISTORY), -STATUS_HISTORY_LENGTH, -1)
+        pipe.execute()
+
+    @staticmethod
+    def _encode_status(status):
+        """
+        Converts a status to the JSON that is published, stamped with the current time in seconds since the Unix epoch.
+
+        :rtype:     str
+
+        """
+        message = dict(status)
+        message["time"] = time.time()
+        return json.dumps(message)
+
+    def publish_metrics(self, metrics):
+        """
+        Replace the controller's performance metrics, stamped with the current time in seconds since the Unix epoch
+        as the "time" field.
+
+        :param metrics:    numbers keyed by name, as made by device.metrics.Metrics.snapshot()
+        :type metrics:     dict
+
+        """
+        values = dict(metrics, time=time.time())
+        # in a transaction, so that the API never sees a mix of old and new metrics
+        pipe = self.store.pipeline(transaction=True)
+        pipe.delete(self._key(METRICS))
+        pipe.hmset(self._key(METRICS), values)
+        pipe.execute()
+
+    def read_metrics(self):
+        """
+        Get the controller's performance metrics.
+
+        :return:    the metrics, or nothing if the controller hasn't published any
+        :rtype:     dict of float
+
+        """
+        return {field: float(value) for field, value in self.store.hgetall(self._key(METRICS)).items()}
+
+    def read_status_history(self, seconds=None):
+        """
+        Get the statuses that were published recently, oldest first.
+
+        :param seconds:    only include statuses from this many seconds ago or later
+
+        :rtype:     list of dict
+
+        """
+        history = [json.loads(message) for message in self.store.lrange(self._key(STATUS_HISTORY), 0, -1)]
+        if seconds is not None:
+            since = time.time() - seconds
+            history = [status for status in history if status["time"] >= since]
+        return history
+
+    def read_status(self):
+        """
+        Get the controller's status and the currently-loaded program in a single round trip.
+
+        :return:    every field in STATUS_FIELDS (None if unset), plus "program"
+        :rtype:     dict
+
+        """
+        pipe = self.store.pipeline(transaction=False)
+        pipe.hgetall(self._key("status"))
+        pipe.get(self._key("program"))
+        status, program = pipe.execute()
+        out = {field: status.get(field) for field in STATUS_FIELDS}
+        out["program"] = self._decode_program(program)
+        return out
+
+    def read_controls(self):
+        """
+        Get the instructions the controller needs each tick in a single round trip.
+
+        :return:    whether we should be running a program, the number of seconds ahead we should skip
+        :rtype:     (bool, int)
+
+        """
+        active, skip_time = self.store.mget(self._key("active"), self._key("skip_time"))
+        return active == "1", int(skip_time) if skip_time is not None else 0
+
+    def _decode_program(self, raw):
+        """
+        Parses the program JSON, reusing the previous result if the program hasn't changed.
+
+        :rtype:     dict
+
+        """
+        cached_raw, cached_program = self._program_cache
+        if raw != cached_raw:
+            cached_program = json.loads(raw or "{}")
+            # stored on the class so that it's shared by every instance in this process
+            APIInterface._program_cache = raw, cached_program
+        return cached_program
+
+    def send_command(self, command, **payload):
+        """
+        Wake the controller up and tell it to do something. The "active" and "skip_time" keys are still kept up to
+        date, so the controller can recover its instructions if it misses a message.
+
+        :param command:    one of the values in Command
+        :type command:     str
+
+        """
+        payload["command"] = command
+        self.store.publish(self.command_channel, json.dumps(payload))
 
     def deactivate(self):
         """
         The controller will stop running any programs and will deactivate the heater when this is run.
 
         """
-        self.set("active", 0)
+        self.store.set(self._key("active"), 0)
+        self.send_command(Command.STOP)
 
     def activate(self):
         """
         The controller will attempt to start running a program when this is run.
 
         """
-        self.set("active", 1)
+        self.store.set(self._key("active"), 1)
+        self.send_command(Command.START)
+
+    def update_gains(self, value):
+        """
+        Replace the PID values of the program that is currently running.
+
+        :type value:    dict
+
+        """
+        self.driver = value
+        self.send_command(Command.UPDATE_GAINS, driver=value)
 
     @property
     def step_time_remaining(self):
@@ -43,11 +258,11 @@ class APIInterface(redis.StrictRedis):
         :rtype:     int
 
         """
-        return self.get("step_time_remaining")
+        return self.store.hget(self._key("status"), "step_time_remaining")
 
     @step_time_remaining.setter
     def step_time_remaining(self, value):
-        self.set("step_time_remaining", value)
+        self.store.hset(self._key("status"), "step_time_remaining", value)
 
     @property
     def program_time_remaining(self):
@@ -57,11 +272,11 @@ class APIInterface(redis.StrictRedis):
         :rtype:     int
 
         """
-        return self.get("program_time_remaining")
+        return self.store.hget(self._key("status"), "program_time_remaining")
 
     @program_time_remaining.setter
     def program_time_remaining(self, value):
-        self.set("program_time_remaining", value)
+        self.store.hset(self._key("status"), "program_time_remaining", value)
 
     @property
     def program(self):
@@ -71,7 +286,7 @@ class APIInterface(redis.StrictRedis):
         :rtype:     dict
 
         """
-        return json.loads(self.get("program") or "{}")
+        return self._decode_program(self.store.get(self._key("program")))
 
     @program.setter
     def program(self, value):
@@ -81,17 +296,55 @@ class APIInterface(redis.StrictRedis):
         :type value:    dict
 
         """
-        self.set("program", value)
+        self.store.set(self._key("program"), value)
+
+    @property
+    def compiled_program(self):
+        """
+        The currently-loaded program as compiled by interface.programs.compile_steps(), so that the controller doesn't
+        have to parse the steps itself.
+
+        :return:    the compiled program, or None if there isn't one
+        :rtype:     dict
+
+        """
+        return json.loads(self.store.get(self._key("compiled_program")) or "null")
+
+    @compiled_program.setter
+    def compiled_program(self, value):
+        """
+        :param value:    the compiled program, or its JSON
+        :type value:     dict or str
+
+        """
+        self.store.set(self._key("compiled_program"), value if isinstance(value, basestring) else json.dumps(value))
+
+    @property
+    def program_id(self):
+        """
+        The database ID of the currently-loaded program, so that runs can be catalogued by program.
+
+        :return:    the ID, or None if it isn't known
+        :rtype:     int
+
+        """
+        value = self.store.get(self._key("program_id"))
+        return None if value is None else int(value)
+
+    @program_id.setter
+    def program_id(self, value):
+        self.store.set(self._key("program_id"), value)
 
     @property
     def driver(self):
         """
         Get the PID values needed for the thing we're heating.
 
+        :return:    the PID values, or None if no driver has been chosen
         :rtype:     dict
 
         """
-        return json.loads(self.get("driver"))
+        return json.loads(self.store.get(self._key("driver")) or "null")
 
     @driver.setter
     def driver(self, value):
@@ -100,7 +353,7 @@ class APIInterface(redis.StrictRedis):
 
         :type value:    dict
         """
-        self.set("driver", json.dumps(value))
+        self.store.set(self._key("driver"), json.dumps(value))
 
     @property
     def active(self):
@@ -111,7 +364,7 @@ class APIInterface(redis.StrictRedis):
 
         """
         # Redis stores all values as strings
-        return self.get("active") == "1"
+        return self.store.get(self._key("active")) == "1"
 
     @property
     def current_temp(self):
@@ -121,16 +374,20 @@ class APIInterface(redis.StrictRedis):
         :rtype:     float
 
         """
-        return self.get("current_temp")
+        return self.store.hget(self._key("status"), "current_temp")
 
     @current_temp.setter
     def current_temp(self, temp):
         """
-        Update the record of the last temperature sensed by the thermometer.
+        Update the record of the last temperature sensed by the thermometer. None removes it, as publish_status()
+        does, so that readers see it as missing while the thermometer isn't working.
 
         :type temp:     float
         """
-        self.set("current_temp", temp)
+        if temp is None:
+            self.store.hdel(self._key("status"), "current_temp")
+        else:
+            self.store.hset(self._key("status"), "current_temp", temp)
 
     @property
     def target_temp(self):
@@ -140,7 +397,7 @@ class APIInterface(redis.StrictRedis):
         :rtype:     float
 
         """
-        return self.get("target_temp")
+        return self.store.hget(self._key("status"), "target_temp")
 
     @target_temp.setter
     def target_temp(self, temp):
@@ -149,7 +406,7 @@ class APIInterface(redis.StrictRedis):
 
         :type temp:     float
         """
-        self.set("target_temp", temp)
+        self.store.hset(self._key("status"), "target_temp", temp)
 
     @property
     def current_step(self):
@@ -159,7 +416,7 @@ class APIInterface(redis.StrictRedis):
         :rtype:    int
 
         """
-        return self.get("current_step")
+        return self.store.hget(self._key("status"), "current_step")
 
     @current_step.setter
     def current_step(self, step):
@@ -169,7 +426,7 @@ class APIInterface(redis.StrictRedis):
         :type step:    int
 
         """
-        self.set("current_step", step)
+        self.store.hset(self._key("status"), "current_step", step)
 
     @property
     def skip_time(self):
@@ -179,7 +436,7 @@ class APIInterface(redis.StrictRedis):
         :return:
 
         """
-        skip_time = self.get("skip_time")
+        skip_time = self.store.get(self._key("skip_time"))
         return int(skip_time) if skip_time is not None else 0
 
     def skip_step(self):
@@ -189,4 +446,6 @@ class APIInterface(redis.StrictRedis):
         :return:
         """
         if self.step_time_remaining is not None:
-            self.set("skip_time", self.skip_time + int(self.step_time_remaining))
+            skip_time = self.skip_time + int(self.step_time_remaining)
+            self.store.set(self._key("skip_time"), skip_time)
+            self.send_command(Command.SKIP, skip_time=skip_time)
@@ -0,0 +1,203 @@
+"""
+Checks and compiles the steps of temperature programs. The API does this when a program is saved, so that mistakes are
+caught before anyone tries to run it, and hands the compiled form to the controller so that nothing has to be parsed
+when a run starts.
+
+Steps are a dict, or its JSON, like:
+    {
+      "1": {"mode": "set", "temperature": 80.0, "duration": "1:30:00"},
+      "2": {"mode": "linear", "start_temperature": 80.0, "end_temperature": 37.0, "duration": "12:00"},
+      "3": {"mode": "hold", "temperature": 37.0}
+    }
+Indexes are 1-based. Durations are either a number of seconds or H:M:S text. Any steps after a hold are ignored, since
+the hold never ends.
+
+A repeat runs its own steps, in the same form, several times over, and repeats can be nested. A thermocycling protocol
+is just:
+    {
+      "1": {"mode": "set", "temperature": 95.0, "duration": 180},
+      "2": {"mode": "repeat", "count": 40, "steps": {
+              "1": {"mode": "set", "temperature": 95.0, "duration": 30},
+              "2": {"mode": "set", "temperature": 55.0, "duration": 30},
+              "3": {"mode": "set", "temperature": 72.0, "duration": 60}}},
+      "3": {"mode": "hold", "temperature": 4.0}
+    }
+The steps of a repeat are compiled once, not once per repetition, so a protocol that repeats ten thousand times is no
+bigger than one that runs once.
+
+"""
+import hashlib
+import json
+
+# the version of the compiled form, which changes whenever the controller would read it differently
+VERSION = 2
+# the parameters of each mode, and their defaults
+MODES = {"set": {"temperature": 25.0, "duration": 60},
+         "linear": {"start_temperature": 60.0, "end_temperature": 37.0, "duration": 3600},
+         "hold": {"temperature": 25.0},
+         "repeat": {"count": 1, "steps": {}}}
+
+
+class ProgramError(ValueError):
+    """
+    Signals that the steps of a program don't make sense.
+
+    """
+    pass
+
+
+def parse_duration(value):
+    """
+    Converts a duration to seconds.
+
+    :param value:    a number of seconds, or text like "1:30:00", "90:00" or "5400"
+
+    :rtype:     float
+    :raises:    ProgramError
+
+    """
+    if isinstance(value, bool):
+        raise ProgramError("%r is not a duration" % value)
+    if isinstance(value, (int, long, float)):
+        seconds = float(value)
+    else:
+        parts = unicode(value).strip().split(":")
+        if len(parts) > 3 or not all(part.isdigit() for part in parts):
+            raise ProgramError("%r is not a duration. Use a number of seconds or H:M:S" % value)
+        seconds = float(sum(int(part) * 60 ** power for power, part in enumerate(reversed(parts))))
+    if not seconds > 0.0:
+        raise ProgramError("durations must be more than zero seconds, not %r" % value)
+    return seconds
+
+
+def _parse_temperature(name, value):
+    if isinstance(value, bool):
+        raise ProgramError("%s must be a number, not %r" % (name, value))
+    try:
+        temperature = float(value)
+    except (TypeError, ValueError):
+        raise ProgramError("%s must be a number, not %r" % (name, value))
+    if temperature != temperature or temperature in (float('inf'), float('-inf')):
+        raise ProgramError("%s must be a finite number, not %r" % (name, value))
+    return temperature
+
+
+def _parse_count(name, value):
+    if isinstance(value, bool):
+        raise ProgramError("%s must be a whole number, not %r" % (name, value))
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        raise ProgramError("%s must be a whole number, not %r" % (name, value))
+    if count != float(value) or count < 1:
+        raise ProgramError("%s must be a whole number that is at least 1, not %r" % (name, value))
+    return count
+
+
+def decode_steps(steps):
+    """
+    Accepts steps as a dict or as JSON.
+
+    :rtype:     dict
+    :raises:    ProgramError
+
+    """
+    if isinstance(steps, basestring):
+        try:
+            steps = json.loads(steps)
+        except ValueError as e:
+            raise ProgramError("steps are not valid JSON: %s" % e)
+    if not isinstance(steps, dict):
+        raise ProgramError("steps must be an object keyed by step number")
+    return steps
+
+
+def compile_steps(steps):
+    """
+    Checks the steps of a program and works out when each one starts and stops.
+
+    :param steps:    the steps, as described above
+    :type steps:     dict or str
+
+    :return:    a dict that can be stored as JSON, with:
+                    version: VERSION
+                    settings: a list of [index, start, stop, start temperature, end temperature] for each step, in
+                              order, with times in seconds since the start of the program. A hold has no stop time.
+                              A repeat is instead a dict with its index, start, stop, count, period (the length of one
+                              repetition) and its own settings, whose times are relative to the start of a repetition.
+                    total_duration: the number of seconds until the program is over, not counting a hold
+                    hash: a hash of the settings, which is the same for any two programs that behave the same way
+    :rtype:     dict
+    :raises:    ProgramError
+
+    """
+    settings, total_duration = _compile_block(decode_steps(steps), "")
+    content = json.dumps([VERSION, settings], sort_keys=True, separators=(",", ":"))
+    return {"version": VERSION,
+            "settings": settings,
+            "total_duration": total_duration,
+            "hash": hashlib.sha1(content.encode("utf-8")).hexdigest()}
+
+
+def _compile_block(steps, prefix):
+    """
+    Compiles the steps of a program or of a repeat.
+
+    :param steps:     the steps, keyed by step number
+    :param prefix:    names the step that these steps belong to in error messages, e.g. "2." for a repeat at step 2
+
+    :return:    the settings, and the number of seconds that they take, not counting a hold
+    :rtype:     (list, float)
+    :raises:    ProgramError
+
+    """
+    try:
+        ordered = sorted(steps.items(), key=lambda item: int(item[0]))
+    except (TypeError, ValueError):
+        raise ProgramError("step numbers must be whole numbers")
+    settings = []
+    total_duration = 0.0
+    for key, parameters in ordered:
+        name = prefix + unicode(key)
+        if not isinstance(parameters, dict):
+            raise ProgramError("step %s must be an object" % name)
+        parameters = dict(parameters)
+        mode = parameters.pop("mode", None)
+        if mode not in MODES:
+            raise ProgramError("step %s has mode %r, but it must be one of %s" % (name, mode, ", ".join(sorted(MODES))))
+        unknown = set(parameters) - set(MODES[mode])
+        if unknown:
+            raise ProgramError("step %s has parameters that %s steps don't take: %s"
+                               % (name, mode, ", ".join(sorted(unknown))))
+        values = dict(MODES[mode])
+        values.update(parameters)
+        index = int(key)
+        if mode == "hold":
+            if prefix:
+                raise ProgramError("step %s is a hold inside a repeat, so the repeat could never finish" % name)
+            temperature = _parse_temperature("temperature", values["temperature"])
+            settings.append([index, total_duration, None, temperature, temperature])
+            # nothing after a hold can ever run
+            break
+        if mode == "repeat":
+            count = _parse_count("count", values["count"])
+            if not isinstance(values["steps"], dict) or not values["steps"]:
+                raise ProgramError("step %s must have steps to repeat, keyed by step number" % name)
+            repeated, period = _compile_block(values["steps"], name + ".")
+            settings.append({"index": index,
+                             "start": total_duration,
+                             "stop": total_duration + count * period,
+                             "count": count,
+                             "period": period,
+                             "settings": repeated})
+            total_duration += count * period
+            continue
+        if mode == "set":
+            start_temperature = end_temperature = _parse_temperature("temperature", values["temperature"])
+        else:
+            start_temperature = _parse_temperature("start_temperature", values["start_temperature"])
+            end_temperature = _parse_temperature("end_temperature", values["end_temperature"])
+        duration = parse_duration(values["duration"])
+        settings.append([index, total_duration, total_duration + duration, start_temperature, end_temperature])
+        total_duration += duration
+    return settings, total_duration
@@ -0,0 +1,168 @@
+"""
+Summaries of a finished run at several resolutions, so that a long run can be plotted at any zoom level without
+reading and reducing every record of its telemetry file.
+
+Each level splits the run into buckets of a fixed number of seconds and keeps the number of records in each bucket,
+and the minimum, maximum and mean of every column, ignoring missing values. Each level is stored as its own numpy .npy file, in a directory next
+to the telemetry file, and is memory-mapped when it's read. The buckets of a span of time are found with a binary
+search, so reading a window of a level only touches the pages that hold it, however long the run was.
+
+numpy is only imported when it's needed, since it's slow to import on a Pi.
+
+"""
+import argparse
+import bisect
+import os
+import shutil
+import telemetry
+
+EXTENSION = ".pyramid"
+# the width of the buckets of each level, in seconds, finest first
+LEVELS = (1, 10, 60, 600)
+COLUMNS = ("measured", "target", "duty", "integral")
+STATISTICS = ("min", "max", "mean")
+
+
+def pyramid_path(telemetry_path):
+    """
+    Where the pyramid of a telemetry file is stored.
+
+    """
+    return os.path.splitext(telemetry_path)[0] + EXTENSION
+
+
+def level_path(path, width):
+    """
+    Where one level of a pyramid is stored.
+
+    """
+    return os.path.join(path, "level_%d.npy" % width)
+
+
+def _level_dtype():
+    return [("time", "<f8"), ("count", "<i4")] + [("%s_%s" % (column, statistic), "<f4")
+                                                  for column in COLUMNS for statistic in STATISTICS]
+
+
+def summarize(times, records, width):
+    """
+    Summarizes records in buckets of a fixed width.
+
+    :param times:      the time of each record, in seconds since the start of the run, in increasing order
+    :param records:    the records, as read by telemetry.read_telemetry()
+    :param width:      the width of each bucket, in seconds
+
+    :return:    one row per bucket that has any records in it, with the start of the bucket as its time
+    :rtype:     numpy.ndarray
+
+    """
+    import numpy as np
+    if not len(times):
+        return np.zeros(0, dtype=_level_dtype())
+    buckets = np.floor(times / width)
+    # records are in time order, so each bucket is a contiguous run of records
+    starts = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+    summary = np.zeros(len(starts), dtype=_level_dtype())
+    counts = np.diff(np.append(starts, len(times)))
+    summary["time"] = buckets[starts] * width
+    summary["count"] = counts
+    for column in COLUMNS:
+        values = records[column].astype(np.float64)
+        present = ~np.isnan(values)
+        present_counts = np.add.reduceat(present.astype(np.int64), starts)
+        totals = np.add.reduceat(np.where(present, values, 0.0), starts)
+        summary["%s_min" % column] = np.fmin.reduceat(values, starts)
+        summary["%s_max" % column] = np.fmax.reduceat(values, starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            summary["%s_mean" % column] = np.where(present_counts > 0, totals / present_counts, np.nan)
+    return summary
+
+
+def build(telemetry_path):
+    """
+    Builds the pyramid of a telemetry file. It's written to a temporary directory first and then renamed, so that a
+    half-written pyramid is never read.
+
+    :return:    the path of the pyramid
+    :rtype:     str
+
+    """
+    import numpy as np
+    start_time, records = telemetry.read_telemetry(telemetry_path)
+    times = records["timestamp"] - start_time
+    path = pyramid_path(telemetry_path)
+    temporary_path = path + ".tmp"
+    _remove(temporary_path)
+    os.mkdir(temporary_path)
+    for width in LEVELS:
+        np.save(level_path(temporary_path, width), summarize(times, records, width))
+    # a directory can't be renamed over another one
+    _remove(path)
+    os.rename(temporary_path, path)
+    return path
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+
+
+class _Times(object):
+    """
+    The times of the buckets of a memory-mapped level, as a sequence that bisect can search without reading the rest
+    of the level.
+
+    """
+    def __init__(self, level):
+        self._level = level
+
+    def __len__(self):
+        return len(self._level)
+
+    def __getitem__(self, index):
+        return self._level[index]["time"]
+
+
+def choose_level(duration, points):
+    """
+    The finest level that can show a span of time in no more than a number of points, or the coarsest level if none
+    of them can.
+
+    :param duration:    the length of the span, in seconds
+    :param points:      the most points to show
+
+    :rtype:     int
+
+    """
+    for width in LEVELS:
+        if duration / float(width) <= points:
+            return width
+    return LEVELS[-1]
+
+
+def read_level(path, width, start=0.0, end=float('inf')):
+    """
+    Reads the buckets of one level that overlap a span of time.
+
+    :param path:     the path of the pyramid
+    :param width:    one of LEVELS
+    :param start:    the start of the span, in seconds since the start of the run
+    :param end:      the end of the span, in seconds since the start of the run
+
+    :rtype:     numpy.ndarray
+
+    """
+    import numpy as np
+    level = np.load(level_path(path, width), mmap_mode="r")
+    times = _Times(level)
+    first = bisect.bisect_right(times, start - width)
+    last = bisect.bisect_left(times, end)
+    return level[first:last]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the pyramids of telemetry files of finished runs")
+    parser.add_argument("logs", nargs="+", help="temperature-*.telemetry files")
+    args = parser.parse_args()
+    for log_path in args.logs:
+        print("%s -> %s" % (log_path, build(log_path)))
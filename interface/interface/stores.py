@@ -0,0 +1,666 @@
+"""
+Where the state that the controller and the API share is kept: the program, driver, controls, status and metrics of
+each channel, along with the pub/sub channels that commands and statuses are announced on. APIInterface only uses the
+small subset of Redis's commands described by StateStore, which each of these backends provides:
+
+    redis          a Redis server, reached as described in interface.connection. This is the default
+    mmap:<path>    a memory-mapped file that every process on the machine opens, e.g. mmap:/dev/shm/piwarmer, so that
+                   a Pi that runs both the controller and the API doesn't need Redis. State updates are memory writes
+    memory         a dict in this process, for tests and simulations, which needs nothing else to be running
+
+The backend is chosen with PIWARMER_STATE_STORE, which has to be the same for the controller and the API.
+
+"""
+from abc import ABCMeta, abstractmethod
+import collections
+import connection
+import contextlib
+import fcntl
+import marshal
+import mmap
+import os
+import redis
+import struct
+import threading
+import time
+
+DEFAULT_SPEC = os.environ.get("PIWARMER_STATE_STORE", "redis")
+# the number of recent pub/sub messages a local store keeps for its subscribers. A subscriber that falls further
+# behind than this misses the oldest ones
+MESSAGE_LOG_LENGTH = 64
+# the size of a memory-mapped store's file, in bytes, unless the file is already bigger
+MMAP_SIZE = 4 * 1024 * 1024
+# how often, in seconds, a subscriber to a memory-mapped store checks for new messages
+MMAP_POLL_INTERVAL = 0.01
+
+_shared_stores = {}
+_shared_stores_lock = threading.Lock()
+
+
+class StoreError(Exception):
+    """
+    Signals that a store can't do what was asked of it, e.g. that it's full or that it isn't configured properly.
+
+    """
+    pass
+
+
+class StateStore(object):
+    """
+    The commands that APIInterface needs. Each one behaves like the Redis command of the same name, as redis-py
+    provides it: values are stored and given back as strings, and missing keys read as None or as empty.
+
+    """
+    __metaclass__ = ABCMeta
+    COMMANDS = ("get", "set", "mget", "delete", "hget", "hset", "hmset", "hdel", "hgetall", "rpush", "ltrim", "lrange",
+                "publish")
+
+    @abstractmethod
+    def get(self, name):
+        pass
+
+    @abstractmethod
+    def set(self, name, value):
+        pass
+
+    @abstractmethod
+    def mget(self, keys, *args):
+        pass
+
+    @abstractmethod
+    def delete(self, *names):
+        pass
+
+    @abstractmethod
+    def hget(self, name, key):
+        pass
+
+    @abstractmethod
+    def hset(self, name, key, value):
+        pass
+
+    @abstractmethod
+    def hmset(self, name, mapping):
+        pass
+
+    @abstractmethod
+    def hdel(self, name, *keys):
+        pass
+
+    @abstractmethod
+    def hgetall(self, name):
+        pass
+
+    @abstractmethod
+    def rpush(self, name, *values):
+        pass
+
+    @abstractmethod
+    def ltrim(self, name, start, end):
+        pass
+
+    @abstractmethod
+    def lrange(self, name, start, end):
+        pass
+
+    @abstractmethod
+    def publish(self, channel, message):
+        pass
+
+    @abstractmethod
+    def pipeline(self, transaction=True):
+        """
+        Queues up commands to be run together when execute() is called, which gives a list of their results.
+
+        """
+
+    @abstractmethod
+    def pubsub(self, ignore_subscribe_messages=False):
+        """
+        Something to subscribe() to channels with, and then to listen() to.
+
+        """
+
+
+class RedisStore(redis.StrictRedis, StateStore):
+    """
+    Keeps the state in Redis.
+
+    """
+    def __init__(self, **kwargs):
+        """
+        Uses the connection pool shared by the whole process (see interface.connection), unless told how to connect.
+
+        """
+        if not kwargs:
+            kwargs["connection_pool"] = connection.shared_pool()
+        super(RedisStore, self).__init__(**kwargs)
+
+
+class LocalStore(StateStore):
+    """
+    Keeps the state in a dict, which subclasses keep somewhere. Every command, and every pipeline, runs on its own
+    without anything else happening in between, and pub/sub messages are kept in a short log that subscribers read
+    from.
+
+    """
+    @abstractmethod
+    def _access(self, write=False):
+        """
+        A context manager that gives the state while nothing else can change it.
+
+        :param write:    whether the state will be changed
+
+        """
+
+    @abstractmethod
+    def _messages_after(self, sequence, timeout):
+        """
+        Waits until there are messages that were published after one, or until the timeout expires.
+
+        :param sequence:    the sequence number of the last message that has already been seen
+        :param timeout:     the maximum number of seconds to wait, or None to wait as long as it takes
+        :return:    the sequence number, channel and data of each of the new messages, oldest first
+        :rtype:     list of tuple
+
+        """
+
+    def _published(self):
+        """
+        Called, with the state still locked, after a message is published.
+
+        """
+        pass
+
+    def get(self, name):
+        with self._access() as state:
+            return _typed(state, name, str)
+
+    def set(self, name, value):
+        with self._access(write=True) as state:
+            state["keys"][name] = _encode(value)
+            return True
+
+    def mget(self, keys, *args):
+        names = (list(keys) if isinstance(keys, (list, tuple)) else [keys]) + list(args)
+        with self._access() as state:
+            # as in Redis, keys that hold something other than a string read as missing
+            return [_string_or_none(state["keys"].get(name)) for name in names]
+
+    def delete(self, *names):
+        with self._access(write=True) as state:
+            return len([state["keys"].pop(name) for name in names if name in state["keys"]])
+
+    def hget(self, name, key):
+        with self._access() as state:
+            return (_typed(state, name, dict) or {}).get(_encode(key))
+
+    def hset(self, name, key, value):
+        with self._access(write=True) as state:
+            values = _typed(state, name, dict, create=True)
+            new = _encode(key) not in values
+            values[_encode(key)] = _encode(value)
+            return int(new)
+
+    def hmset(self, name, mapping):
+        if not mapping:
+            raise StoreError("hmset needs at least one field")
+        with self._access(write=True) as state:
+            _typed(state, name, dict, create=True).update((_encode(key), _encode(value))
+                                                          for key, value in mapping.items())
+            return True
+
+    def hdel(self, name, *keys):
+        with self._access(write=True) as state:
+            values = _typed(state, name, dict) or {}
+            deleted = len([values.pop(_encode(key)) for key in keys if _encode(key) in values])
+            if not values:
+                # as in Redis, an empty hash doesn't exist
+                state["keys"].pop(name, None)
+            return deleted
+
+    def hgetall(self, name):
+        with self._access() as state:
+            return dict(_typed(state, name, dict) or {})
+
+    def rpush(self, name, *values):
+        with self._access(write=True) as state:
+            items = _typed(state, name, list, create=True)
+            items.extend(_encode(value) for value in values)
+            return len(items)
+
+    def ltrim(self, name, start, end):
+        with self._access(write=True) as state:
+            items = _typed(state, name, list)
+            if items is not None:
+                items[:] = items[_slice(len(items), start, end)]
+                if not items:
+                    state["keys"].pop(name)
+            return True
+
+    def lrange(self, name, start, end):
+        with self._access() as state:
+            items = _typed(state, name, list) or []
+            return items[_slice(len(items), start, end)]
+
+    def publish(self, channel, message):
+        with self._access(write=True) as state:
+            state["sequence"] += 1
+            state["messages"].append((state["sequence"], channel, _encode(message)))
+            del state["messages"][:-MESSAGE_LOG_LENGTH]
+            self._published()
+            # nobody keeps track of the subscribers, so unlike Redis, we can't say how many there are
+            return 0
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return LocalPubSub(self, ignore_subscribe_messages)
+
+    def _sequence(self):
+        with self._access() as state:
+            return state["sequence"]
+
+
+class MemoryStore(LocalStore):
+    """
+    Keeps the state in this process, so it can only be shared between threads.
+
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.RLock())
+        self._state = _empty_state()
+
+    @contextlib.contextmanager
+    def _access(self, write=False):
+        with self._condition:
+            yield self._state
+
+    def _published(self):
+        self._condition.notify_all()
+
+    def _messages_after(self, sequence, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._state["sequence"] <= sequence:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0.0:
+                    break
+                self._condition.wait(remaining)
+            return [message for message in self._state["messages"] if message[0] > sequence]
+
+
+class MmapStore(LocalStore):
+    """
+    Keeps the state in a memory-mapped file that any process on the machine can open, such as one in /dev/shm. The
+    file starts with a header of a magic string, the generation of the state, which goes up every time the state
+    changes, and the length of the state, which follows in marshal format. Processes take turns with the file using flock(), and each
+    one only decodes the state again when the generation has changed.
+
+    Lists are kept out of the marshalled state, since the status history is long and changes on every tick. Instead,
+    every change to a list is added to a log in the second half of the file, and each process applies the changes it
+    hasn't seen yet to its own copy of the lists. When the log is full, it's replaced by the lists as they are, and the
+    epoch in the header goes up so that every process starts over from the new log.
+
+    """
+    HEADER = struct.Struct("<4sQIQI")
+    MAGIC = b"pws1"
+    RECORD = struct.Struct("<I")
+
+    def __init__(self, path, size=MMAP_SIZE):
+        """
+
+        :param path:    the path of the file, which is created if it doesn't exist
+        :param size:    the size of the file in bytes, and so the most state it can hold
+
+        """
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            new = os.fstat(self._fd).st_size == 0
+            if os.fstat(self._fd).st_size < size:
+                # the new space reads as zeros, i.e. an empty state
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+            if new:
+                self.HEADER.pack_into(self._map, 0, self.MAGIC, 0, 0, 0, 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        # the state takes the first half of the file, and the log of changes to lists takes the rest
+        self._log_start = self.HEADER.size + (len(self._map) - self.HEADER.size) // 2
+        # only one thread at a time, since flock() doesn't tell the threads of one process apart
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._writing = False
+        self._generation = None
+        self._state = None
+        # the lists as of the end of the log we've read, and the changes made to them since then that aren't saved yet
+        self._lists = {}
+        self._log_epoch = None
+        self._log_length = 0
+        self._changes = []
+
+    @contextlib.contextmanager
+    def _access(self, write=False):
+        with self._lock:
+            if self._depth:
+                # already in the middle of a pipeline, which always has the file to itself
+                assert self._writing or not write
+                self._depth += 1
+                try:
+                    yield self._state
+                finally:
+                    self._depth -= 1
+                return
+            fcntl.flock(self._fd, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            self._depth, self._writing = 1, write
+            try:
+                self._load()
+                try:
+                    yield self._state
+                except:
+                    # whatever was half done is forgotten rather than saved
+                    self._forget()
+                    raise
+                if write:
+                    self._save()
+            finally:
+                self._depth, self._writing = 0, False
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _load(self):
+        magic, generation, length, log_epoch, log_length = self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC:
+            raise StoreError("%s isn't a state file" % self.path)
+        if generation == self._generation:
+            return
+        start = self.HEADER.size
+        self._state = marshal.loads(self._map[start:start + length]) if length else _empty_state()
+        if log_epoch != self._log_epoch:
+            self._lists = {}
+            self._log_epoch = log_epoch
+            self._log_length = 0
+        position = self._log_start + self._log_length
+        while position < self._log_start + log_length:
+            size, = self.RECORD.unpack_from(self._map, position)
+            position += self.RECORD.size
+            _replay(self._lists, marshal.loads(self._map[position:position + size]))
+            position += size
+        self._log_length = log_length
+        self._state["keys"].update(self._lists)
+        self._generation = generation
+
+    def _save(self):
+        lists = {name: value for name, value in self._state["keys"].items() if isinstance(value, list)}
+        state = dict(self._state, keys={name: value for name, value in self._state["keys"].items()
+                                        if not isinstance(value, list)})
+        data = marshal.dumps(state, 2)
+        if self.HEADER.size + len(data) > self._log_start:
+            self._forget()
+            raise StoreError("The state needs %d bytes, but %s only holds %d" % (self.HEADER.size + len(data),
+                                                                                 self.path, self._log_start))
+        log_epoch, log_length = self._log_epoch, self._log_length
+        changes = _records(self._changes)
+        if self._log_start + log_length + len(changes) > len(self._map):
+            # start the log over from the lists as they are
+            changes = _records([("rpush", name, items) for name, items in sorted(lists.items())])
+            log_epoch, log_length = log_epoch + 1, 0
+            if self._log_start + len(changes) > len(self._map):
+                self._forget()
+                raise StoreError("The lists need %d bytes, but %s only holds %d"
+                                 % (len(changes), self.path, len(self._map) - self._log_start))
+        self._map[self._log_start + log_length:self._log_start + log_length + len(changes)] = changes
+        self._map[self.HEADER.size:self.HEADER.size + len(data)] = data
+        self.HEADER.pack_into(self._map, 0, self.MAGIC, self._generation + 1, len(data), log_epoch,
+                              log_length + len(changes))
+        self._generation += 1
+        self._lists = lists
+        self._log_epoch = log_epoch
+        self._log_length = log_length + len(changes)
+        self._changes = []
+
+    def _forget(self):
+        """
+        Throws away the changes that haven't been saved, so that the state is read again from the file.
+
+        """
+        self._generation = None
+        self._log_epoch = None
+        self._changes = []
+
+    def set(self, name, value):
+        with self._access(write=True) as state:
+            if isinstance(state["keys"].get(name), list):
+                self._changes.append(("delete", name))
+            return super(MmapStore, self).set(name, value)
+
+    def delete(self, *names):
+        with self._access(write=True) as state:
+            self._changes.extend(("delete", name) for name in names if isinstance(state["keys"].get(name), list))
+            return super(MmapStore, self).delete(*names)
+
+    def rpush(self, name, *values):
+        with self._access(write=True) as state:
+            length = super(MmapStore, self).rpush(name, *values)
+            self._changes.append(("rpush", name, state["keys"][name][length - len(values):]))
+            return length
+
+    def ltrim(self, name, start, end):
+        with self._access(write=True):
+            trimmed = super(MmapStore, self).ltrim(name, start, end)
+            self._changes.append(("ltrim", name, start, end))
+            return trimmed
+
+    def _messages_after(self, sequence, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._access() as state:
+                messages = [message for message in state["messages"] if message[0] > sequence]
+            if messages or (deadline is not None and time.time() >= deadline):
+                return messages
+            time.sleep(MMAP_POLL_INTERVAL)
+
+
+class LocalPipeline(object):
+    """
+    Queues up commands for a LocalStore, and runs them all at once.
+
+    """
+    def __init__(self, store):
+        self._store = store
+        self._commands = []
+
+    def __getattr__(self, name):
+        if name not in StateStore.COMMANDS:
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._commands = []
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        with self._store._access(write=True):
+            return [getattr(self._store, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+class LocalPubSub(object):
+    """
+    Receives the messages published to a LocalStore, as redis-py's PubSub does from Redis.
+
+    """
+    def __init__(self, store, ignore_subscribe_messages=False):
+        self._store = store
+        self._ignore_subscribe_messages = ignore_subscribe_messages
+        self._pending = collections.deque()
+        self._seen = None
+        self.channels = set()
+
+    def subscribe(self, *channels):
+        if self._seen is None:
+            # messages that were published before we subscribed aren't for us
+            self._seen = self._store._sequence()
+        for channel in channels:
+            self.channels.add(channel)
+            self._announce("subscribe", channel)
+
+    def unsubscribe(self, *channels):
+        for channel in channels or list(self.channels):
+            self.channels.discard(channel)
+            self._announce("unsubscribe", channel)
+
+    def _announce(self, kind, channel):
+        if not self._ignore_subscribe_messages:
+            self._pending.append({"type": kind, "pattern": None, "channel": channel, "data": len(self.channels)})
+
+    def get_message(self, timeout=0.0):
+        """
+        :param timeout:    the maximum number of seconds to wait for a message, or None to wait as long as it takes
+        :return:    the next message, or None if there isn't one yet
+        :rtype:     dict
+
+        """
+        if not self._pending and self._seen is not None:
+            for sequence, channel, data in self._store._messages_after(self._seen, timeout):
+                self._seen = sequence
+                if channel in self.channels:
+                    self._pending.append({"type": "message", "pattern": None, "channel": channel, "data": data})
+        return self._pending.popleft() if self._pending else None
+
+    def listen(self):
+        """
+        Gives each message as it arrives, for as long as we're subscribed to anything.
+
+        """
+        while self.channels or self._pending:
+            message = self.get_message(timeout=None)
+            if message is not None:
+                yield message
+
+    def close(self):
+        self.channels.clear()
+        self._pending.clear()
+
+
+def make_store(spec=DEFAULT_SPEC):
+    """
+    Creates a store, as described above.
+
+    :param spec:    "redis", "memory" or "mmap:<path>"
+    :rtype:     StateStore
+    :raises:    StoreError
+
+    """
+    if spec == "redis":
+        return RedisStore()
+    if spec == "memory":
+        return MemoryStore()
+    if spec.startswith("mmap:") and len(spec) > len("mmap:"):
+        return MmapStore(spec[len("mmap:"):])
+    raise StoreError("PIWARMER_STATE_STORE must be redis, memory or mmap:<path>, not %r" % spec)
+
+
+def shared_store(spec=None):
+    """
+    The store for this process, which is created the first time it's needed, and is safe to use from any thread.
+
+    :param spec:    the store to use, as for make_store(), if not the one configured by PIWARMER_STATE_STORE
+    :rtype:     StateStore
+
+    """
+    spec = spec or DEFAULT_SPEC
+    with _shared_stores_lock:
+        if spec not in _shared_stores:
+            _shared_stores[spec] = make_store(spec)
+        return _shared_stores[spec]
+
+
+def _empty_state():
+    return {"keys": {}, "messages": [], "sequence": 0}
+
+
+def _records(changes):
+    """
+    Encodes changes to lists for the log of a MmapStore, each with its length.
+
+    :rtype:     str
+
+    """
+    encoded = [marshal.dumps(change, 2) for change in changes]
+    return b"".join(MmapStore.RECORD.pack(len(data)) + data for data in encoded)
+
+
+def _replay(lists, change):
+    """
+    Makes a change from the log of a MmapStore to a copy of the lists, as the command that made it did to the original.
+
+    """
+    if change[0] == "rpush":
+        lists.setdefault(change[1], []).extend(change[2])
+    elif change[0] == "ltrim":
+        items = lists.get(change[1])
+        if items is not None:
+            items[:] = items[_slice(len(items), change[2], change[3])]
+            if not items:
+                del lists[change[1]]
+    elif change[0] == "delete":
+        lists.pop(change[1], None)
+
+
+def _typed(state, name, kind, create=False):
+    """
+    The value of a key, which must be of a kind: str, dict (a Redis hash) or list.
+
+    :param create:    whether to create an empty value if there's no such key
+    :raises:    StoreError
+
+    """
+    value = state["keys"].get(name)
+    if value is None:
+        if create:
+            value = state["keys"][name] = kind()
+        return value
+    if not isinstance(value, kind):
+        raise StoreError("WRONGTYPE %s holds a %s, not a %s" % (name, type(value).__name__, kind.__name__))
+    return value
+
+
+def _string_or_none(value):
+    return value if isinstance(value, str) else None
+
+
+def _encode(value):
+    """
+    Converts a value to a string the same way redis-py does.
+
+    :rtype:     str
+
+    """
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _slice(length, start, end):
+    """
+    Converts the inclusive, possibly negative, indexes of a Redis list command to a slice.
+
+    :rtype:     slice
+
+    """
+    if start < 0:
+        start = max(0, length + start)
+    if end < 0:
+        end += length
+    return slice(start, max(start, end + 1))
@@ -0,0 +1,255 @@
+"""
+A compact binary format for the temperature logs of each run. Every tick is one fixed-width record, so a file can be
+appended to cheaply on the Pi and memory-mapped as a numpy array for plotting, without parsing any text.
+
+A file starts with a 32-byte header:
+    magic (4 bytes, "PWTL"), version (uint16), header size (uint16), record size (uint16), padding (2 bytes),
+    start time (float64, seconds since the Unix epoch), padding (12 bytes)
+followed by records laid out as RECORD, all little-endian.
+
+numpy is only needed to read files, so it isn't imported until then.
+
+"""
+import argparse
+import os
+import struct
+import time
+from datetime import datetime
+
+MAGIC = b"PWTL"
+VERSION = 1
+EXTENSION = ".telemetry"
+HEADER = struct.Struct("<4sHHH2xd12x")
+# timestamp (seconds since the Unix epoch), measured temperature, target temperature, duty cycle, step index,
+# accumulated error, padding
+RECORD = struct.Struct("<dfffif4x")
+RECORD_DTYPE = [("timestamp", "<f8"),
+                ("measured", "<f4"),
+                ("target", "<f4"),
+                ("duty", "<f4"),
+                ("step", "<i4"),
+                ("integral", "<f4"),
+                ("padding", "V4")]
+COLUMNS = ("timestamp", "measured", "target", "duty", "step", "integral")
+# written in place of a step index when there isn't one
+NO_STEP = -1
+
+
+class TelemetryError(Exception):
+    """
+    Signals that a file isn't a telemetry file we know how to read.
+
+    """
+    pass
+
+
+def _to_epoch(when):
+    """
+    Converts a naive UTC datetime to seconds since the Unix epoch.
+
+    """
+    delta = when - datetime(1970, 1, 1)
+    return delta.days * 86400.0 + delta.seconds + delta.microseconds / 1e6
+
+
+def _or_nan(value):
+    return float('NaN') if value is None else float(value)
+
+
+class TelemetryWriter(object):
+    """
+    Appends one record per tick to a telemetry file.
+
+    """
+    def __init__(self, path, start_time, append=False):
+        """
+
+        :param path:          where to create the file
+        :param start_time:    when the run started, in UTC
+        :type start_time:     datetime
+        :param append:        add to the file if it already exists, e.g. when a run is resumed, instead of replacing it
+        :raises:    TelemetryError
+
+        """
+        self.path = path
+        if append and os.path.exists(path):
+            _, header_size, record_size = read_header(path)
+            if record_size != RECORD.size:
+                raise TelemetryError("%s has records of %d bytes, not %d" % (path, record_size, RECORD.size))
+            self._file = open(path, "r+b")
+            # a record that was only partly written when the controller stopped is dropped
+            records = (os.path.getsize(path) - header_size) // record_size
+            self._file.truncate(header_size + records * record_size)
+            self._file.seek(0, os.SEEK_END)
+            return
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, HEADER.size, RECORD.size, _to_epoch(start_time)))
+        self._file.flush()
+
+    def write(self, timestamp, measured, target, duty, step, integral):
+        """
+        Adds a record. Anything that isn't known can be None.
+
+        :param timestamp:    when the measurement was made, in UTC
+        :type timestamp:     datetime
+
+        """
+        self._file.write(self.pack(timestamp, measured, target, duty, step, integral))
+        # flush so that we lose as little as possible if we crash mid-run
+        self._file.flush()
+
+    def write_packed(self, data):
+        """
+        Adds records that have already been packed, without flushing them.
+
+        :param data:    any number of records, as given by pack()
+        :type data:     bytes
+
+        """
+        self._file.write(data)
+
+    def flush(self, sync=False):
+        """
+        Hands what has been written to the operating system.
+
+        :param sync:    also wait for it to reach the disk, which can take a long time on an SD card
+
+        """
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    @staticmethod
+    def pack(timestamp, measured, target, duty, step, integral):
+        """
+        Converts the values of one record to bytes.
+
+        :rtype:     bytes
+
+        """
+        return RECORD.pack(_to_epoch(timestamp), _or_nan(measured), _or_nan(target), _or_nan(duty),
+                           NO_STEP if step is None else int(step), _or_nan(integral))
+
+    def close(self):
+        self._file.close()
+
+
+def read_header(path):
+    """
+    Reads the header of a telemetry file.
+
+    :return:    the start time (seconds since the Unix epoch), the header size and the record size
+    :rtype:     (float, int, int)
+    :raises:    TelemetryError
+
+    """
+    with open(path, "rb") as f:
+        data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise TelemetryError("%s is too short to be a telemetry file" % path)
+    magic, version, header_size, record_size, start_time = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION:
+        raise TelemetryError("%s is not a version %d telemetry file" % (path, VERSION))
+    return start_time, header_size, record_size
+
+
+def read_telemetry(path):
+    """
+    Memory-maps the records of a telemetry file, so that nothing is read from disk until it's used. A partly-written
+    record at the end of the file (e.g. from a crash) is ignored.
+
+    :return:    the start time (seconds since the Unix epoch), and the records as a structured array with the fields in
+                COLUMNS
+    :rtype:     (float, numpy.ndarray)
+    :raises:    TelemetryError
+
+    """
+    import numpy as np
+    start_time, header_size, record_size = read_header(path)
+    dtype = np.dtype(RECORD_DTYPE)
+    if record_size != dtype.itemsize:
+        raise TelemetryError("%s has %d-byte records, expected %d" % (path, record_size, dtype.itemsize))
+    count = (os.path.getsize(path) - header_size) // record_size
+    if count <= 0:
+        return start_time, np.zeros(0, dtype=dtype)
+    return start_time, np.memmap(path, dtype=dtype, mode="r", offset=header_size, shape=(count,))
+
+
+def _parse_legacy_log(text_path):
+    """
+    Reads the lines of a tab-separated temperature log from older versions. Their timestamps are in the local time of
+    the Pi.
+
+    :return:    the time (seconds since the Unix epoch), measured temperature, target temperature and duty cycle of each
+                line
+    :rtype:     list of (float, float, float, float)
+
+    """
+    records = []
+    with open(text_path) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 4:
+                continue
+            timestamp, measured, target, duty = fields[:4]
+            seconds, _, milliseconds = timestamp.partition(",")
+            epoch = time.mktime(time.strptime(seconds, "%Y-%m-%d %H:%M:%S")) + float(milliseconds or 0) / 1000.0
+            records.append((epoch, _parse_legacy_value(measured), _parse_legacy_value(target),
+                            _parse_legacy_value(duty)))
+    return records
+
+
+def read_legacy_log(text_path):
+    """
+    Reads a tab-separated temperature log from older versions into the same form as read_telemetry(), so that old runs
+    can be plotted without converting them first. Those logs have no step index or accumulated error, so they're
+    recorded as missing.
+
+    :return:    the start time (seconds since the Unix epoch), and the records as a structured array
+    :rtype:     (float, numpy.ndarray)
+
+    """
+    import numpy as np
+    lines = _parse_legacy_log(text_path)
+    records = np.zeros(len(lines), dtype=RECORD_DTYPE)
+    for i, column in enumerate(("timestamp", "measured", "target", "duty")):
+        records[column] = [line[i] for line in lines]
+    records["step"] = NO_STEP
+    records["integral"] = float('NaN')
+    start_time = lines[0][0] if lines else 0.0
+    return start_time, records
+
+
+def convert_legacy_log(text_path, telemetry_path):
+    """
+    Converts a tab-separated temperature log from older versions into a telemetry file. Those logs have no step
+    index or accumulated error, so they're recorded as missing.
+
+    :return:    the number of records written
+    :rtype:     int
+
+    """
+    records = _parse_legacy_log(text_path)
+    start_time = records[0][0] if records else 0.0
+    with open(telemetry_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, HEADER.size, RECORD.size, start_time))
+        for epoch, measured, target, duty in records:
+            f.write(RECORD.pack(epoch, measured, target, duty, NO_STEP, float('NaN')))
+    return len(records)
+
+
+def _parse_legacy_value(text):
+    try:
+        return float(text)
+    except ValueError:
+        # e.g. "None" for the target temperature after a program ended
+        return float('NaN')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert tab-separated temperature logs to telemetry files")
+    parser.add_argument("logs", nargs="+", help="temperature-*.log files to convert")
+    args = parser.parse_args()
+    for log_path in args.logs:
+        output_path = os.path.splitext(log_path)[0] + EXTENSION
+        print("%s -> %s (%d records)" % (log_path, output_path, convert_legacy_log(log_path, output_path)))